@@ -1,9 +1,14 @@
+import json
 import os
+import threading
+import time
 import uuid
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Response, g, render_template, request, redirect, stream_with_context, url_for, jsonify
 from werkzeug.utils import secure_filename
 
-from modules import rag_pipeline
+from modules import metrics
+from modules.answer_cache import AnswerCache
+from modules.jobs import JobQueue
 from config import Config
 
 app = Flask(__name__)
@@ -14,12 +19,102 @@ app.config.from_object(Config)
 
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
-# initializing RAG Pipeline
-rag = rag_pipeline.RAGPipeline(
-    vector_dim=Config.VECTOR_DIM,
-    vector_persist=Config.VECTORSTORE_DIR,
-    ollama_model=getattr(Config, "OLLAMA_MODEL", "llama2")
-)
+# the RAG pipeline (FAISS index, metadata, DB, models) is built on first use, not at import:
+# worker spawns and tests that never query don't pay for it. preload() builds it up front.
+_rag = None
+_rag_lock = threading.Lock()
+
+
+def get_rag():
+    global _rag
+    if _rag is None:
+        with _rag_lock:
+            if _rag is None:
+                from modules import rag_pipeline
+                _rag = rag_pipeline.RAGPipeline(
+                    vector_dim=Config.VECTOR_DIM,
+                    vector_persist=Config.VECTORSTORE_DIR,
+                    ollama_model=getattr(Config, "OLLAMA_MODEL", "llama2"),
+                    embed_batch_size=Config.EMBED_BATCH_SIZE,
+                    ingest_batch_size=Config.INGEST_BATCH_SIZE,
+                    store_document_text=Config.STORE_DOCUMENT_TEXT,
+                    chunk_storage=Config.CHUNK_STORAGE,
+                    chunk_tokens=Config.CHUNK_TOKENS,
+                    dedup=Config.DEDUP,
+                    near_dup_distance=Config.DEDUP_NEAR_DISTANCE,
+                    answer_cache=AnswerCache(
+                        max_entries=Config.ANSWER_CACHE_SIZE,
+                        ttl=Config.ANSWER_CACHE_TTL,
+                        similarity=Config.ANSWER_CACHE_SIMILARITY,
+                    ) if Config.ANSWER_CACHE else None,
+                    hybrid=Config.HYBRID_SEARCH,
+                    hybrid_candidates=Config.HYBRID_CANDIDATES,
+                    rrf_k=Config.RRF_K,
+                    llm_concurrency=Config.LLM_CONCURRENCY,
+                    vector_options={
+                        "index_type": Config.VECTOR_INDEX_TYPE,
+                        "promote_at": Config.VECTOR_INDEX_PROMOTE_AT,
+                        "nprobe": Config.VECTOR_NPROBE,
+                        "ef_search": Config.VECTOR_EF_SEARCH,
+                        "quantization": Config.VECTOR_QUANTIZATION,
+                        "rerank": Config.VECTOR_RERANK,
+                        "shards": Config.VECTOR_SHARDS,
+                        "shard_by": Config.VECTOR_SHARD_BY,
+                    }
+                )
+    return _rag
+
+
+# background ingestion workers; threads don't survive fork(), so they start in each
+# worker process (post_fork, or the first request), never at import
+jobs = JobQueue(pipeline_factory=get_rag, workers=Config.INGEST_WORKERS, ocr_processes=Config.OCR_PROCESSES)
+
+
+_workers_lock = threading.Lock()
+
+
+def start_workers():
+    if Config.ASYNC_INGEST and not jobs._threads:
+        with _workers_lock:
+            jobs.start()
+
+
+def preload():
+    """
+    Loads the pipeline, the embedding model and the lexical index now. Call it in the parent
+    before forking web workers (gunicorn --preload, see gunicorn.conf.py) so they share the
+    model weights copy-on-write instead of each loading their own copy.
+    """
+    try:
+        get_rag().warm_up()
+    except RuntimeError as e:
+        # e.g. no embedding backend installed: serve anyway, queries report the error
+        app.logger.warning("warm-up skipped: %s", e)
+
+
+def post_fork():
+    """Per-process setup after fork: fresh DB connections, then the ingestion workers."""
+    from modules import embeddings
+    from modules.db import engine
+    engine.dispose(close=False)  # the parent's pooled connections stay with the parent
+    embeddings.reopen_cache()
+    start_workers()
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    start_workers()  # no-op once running
+
+@app.after_request
+def observe_request(response):
+    start = g.pop("request_start", None)
+    # endpoint name rather than path, so /jobs/<id> stays one series
+    if Config.METRICS and start is not None and request.endpoint != "metrics_endpoint":
+        metrics.registry.observe("http_request_seconds", time.perf_counter() - start,
+                                 endpoint=request.endpoint or "unknown", method=request.method,
+                                 status=response.status_code)
+    return response
 
 # helper functions
 def allowed_file(filename: str) -> bool:
@@ -48,15 +143,28 @@ def upload_file():
         filename = unique_filename(file.filename)
         filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
         file.save(filepath)
+        # optional: id of a document this upload is a new version of
+        replaces = request.form.get("replace_document_id", type=int)
+
+        if Config.ASYNC_INGEST:
+            job_id = jobs.enqueue(filepath, filename, use_gvision=True, replaces=replaces)
+            msg = "Document queued for ingestion."
+            return render_template("docs.html", filename=filename, text_preview=msg, job_id=job_id)
 
         try:
             # Ingesting document into RAG pipeline using SentenceTransformers embeddings
-            doc_info = rag.ingest_image(
-                filepath,
-                filename=filename,
-                use_gvision=True  # True = Google Vision OCR
-            )
-            msg = f"Document ingested successfully. {doc_info['num_chunks']} chunks stored."
+            if replaces:
+                doc_info = get_rag().replace_document(replaces, filepath, filename=filename, use_gvision=True)
+            else:
+                doc_info = get_rag().ingest_image(
+                    filepath,
+                    filename=filename,
+                    use_gvision=True  # True = Google Vision OCR
+                )
+            if doc_info.get("duplicate"):
+                msg = f"Document already ingested (document {doc_info['document_id']}), skipped."
+            else:
+                msg = f"Document ingested successfully. {doc_info['num_chunks']} chunks stored."
         except Exception as e:
             msg = f"Failed to ingest document: {e}"
 
@@ -64,6 +172,45 @@ def upload_file():
 
     return redirect(url_for("index"))
 
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id: int):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job)
+
+@app.route("/documents/<int:document_id>", methods=["DELETE"])
+def delete_document(document_id: int):
+    try:
+        info = get_rag().delete_document(document_id)
+    except Exception as e:
+        return jsonify({"error": f"Failed to delete document: {e}"}), 500
+    if info is None:
+        return jsonify({"error": "document not found"}), 404
+    return jsonify(info)
+
+@app.route("/cache/stats")
+def cache_stats():
+    rag = get_rag()
+    if rag.answer_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(rag.answer_cache.stats(), enabled=True))
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if not Config.METRICS:
+        return jsonify({"error": "metrics are disabled"}), 404
+    if _rag is not None:  # a scrape shouldn't be what loads the pipeline
+        metrics.registry.set("vectors", _rag.vs.ntotal)
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+def form_filters():
+    # document_ids may be repeated fields or comma separated; source / uploaded_after / uploaded_before are optional
+    ids = [part for value in request.form.getlist("document_ids") for part in value.split(",") if part.strip()]
+    filters = {key: request.form[key] for key in ("source", "uploaded_after", "uploaded_before") if request.form.get(key)}
+    return [int(i) for i in ids], filters
+
+
 @app.route("/chat", methods=["GET", "POST"])
 def chat():
     if request.method == "POST":
@@ -71,19 +218,81 @@ def chat():
         if not user_query:
             return jsonify({"answer": "Please enter a query."})
 
-        try:
-            # Query RAG pipeline
-            response = rag.query(user_query)
-            answer = response.get("answer", "")
-            retrieved = response.get("retrieved", [])
-        except Exception as e:
-            answer = f"Error during query: {e}"
-            retrieved = []
+        # timings=1 (or CHAT_TIMINGS) adds a per-stage breakdown of this request
+        want_timings = Config.CHAT_TIMINGS or request.form.get("timings") in ("1", "true")
+        with metrics.collect() as timings:
+            try:
+                # Query RAG pipeline
+                document_ids, filters = form_filters()
+                response = get_rag().query(user_query, document_ids=document_ids, filters=filters)
+                answer = response.get("answer", "")
+                retrieved = response.get("retrieved", [])
+            except Exception as e:
+                answer = f"Error during query: {e}"
+                retrieved = []
 
-        return jsonify({"answer": answer, "retrieved": retrieved})
+        payload = {"answer": answer, "retrieved": retrieved}
+        if want_timings:
+            payload["timings"] = timings
+        return jsonify(payload)
 
     return render_template("chat.html")
 
 
+@app.route("/query/batch", methods=["POST"])
+def query_batch():
+    """
+    JSON {"queries": [...], "top_k": 5, "generate": true, "document_ids": [...], "filters": {...}}
+    -> {"results": [{"answer", "retrieved"}, ...]}
+    """
+    payload = request.get_json(silent=True) or {}
+    queries = payload.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(q, str) and q for q in queries):
+        return jsonify({"error": "queries must be a list of non-empty strings"}), 400
+    if len(queries) > Config.QUERY_BATCH_MAX:
+        return jsonify({"error": f"at most {Config.QUERY_BATCH_MAX} queries per request"}), 400
+    if not isinstance(payload.get("filters") or {}, dict):
+        return jsonify({"error": "filters must be an object"}), 400
+
+    try:
+        results = get_rag().query_batch(queries, top_k=int(payload.get("top_k", 5)),
+                                  generate=bool(payload.get("generate", True)),
+                                  document_ids=payload.get("document_ids"), filters=payload.get("filters"))
+    except Exception as e:
+        return jsonify({"error": f"Error during query: {e}"}), 500
+    return jsonify({"results": results})
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Server-sent events: one `sources` event, `token` events as the LLM generates, then `done`."""
+    user_query = request.form.get("query")
+
+    def generate():
+        if not user_query:
+            yield sse_event("token", "Please enter a query.")
+            yield sse_event("done", {})
+            return
+        try:
+            document_ids, filters = form_filters()
+            for event in get_rag().query_stream(user_query, document_ids=document_ids, filters=filters):
+                if event["type"] == "sources":
+                    yield sse_event("sources", event["retrieved"])
+                elif event["type"] == "token":
+                    yield sse_event("token", event["text"])
+                else:
+                    yield sse_event("done", {})
+        except Exception as e:
+            yield sse_event("error", f"Error during query: {e}")
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 if __name__ == "__main__":
+    start_workers()
     app.run(debug=True)
@@ -12,6 +12,56 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     VECTOR_DIM = 384
     VECTORSTORE_DIR = os.path.join(BASE_DIR, "vectorstore")
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+
+    # ANN index: flat | ivf_flat | ivf_pq | hnsw (promoted from flat once the store is big enough)
+    VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+    VECTOR_INDEX_PROMOTE_AT = int(os.getenv("VECTOR_INDEX_PROMOTE_AT", 50000))
+    VECTOR_NPROBE = int(os.getenv("VECTOR_NPROBE", 16))
+    VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", 64))
+    # compressed vectors once promoted: none | fp16 | sq8 | pq, top_k * VECTOR_RERANK re-scored exactly
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+    VECTOR_RERANK = int(os.getenv("VECTOR_RERANK", 4))
+    # >1 splits the vectorstore into shards searched in parallel (fixed once the store exists)
+    VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", 1))
+    VECTOR_SHARD_BY = os.getenv("VECTOR_SHARD_BY", "document")  # document | hash
+
+    # background ingestion: /upload enqueues a job instead of ingesting inline
+    ASYNC_INGEST = os.getenv("ASYNC_INGEST", "1") != "0"
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+    OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", max(1, (os.cpu_count() or 2) - 1)))
+
+    # streaming ingestion: chunks are embedded and stored this many at a time
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+    # keep a full copy of each document's text in documents.text (0: only chunks are stored, see READme.md)
+    STORE_DOCUMENT_TEXT = os.getenv("STORE_DOCUMENT_TEXT", "1") == "1"
+    # content: each chunk row has its text | offsets: documents.text once, chunks as (start, end) into it
+    CHUNK_STORAGE = os.getenv("CHUNK_STORAGE", "content")
+    # chunk size in embedding model tokens, -1 = the model's max input length, 0 = 500 characters
+    CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 0))
+
+    # skip re-uploaded files and reuse vectors of identical chunks; a distance > 0 also folds near duplicates
+    DEDUP = os.getenv("DEDUP", "1") != "0"
+    DEDUP_NEAR_DISTANCE = float(os.getenv("DEDUP_NEAR_DISTANCE", 0.0))
+
+    # cache answers for repeated / paraphrased questions that retrieve the same chunks
+    ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") != "0"
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+
+    # hybrid retrieval: BM25 next to FAISS, top_k * HYBRID_CANDIDATES from each side fused with RRF
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 4))
+    RRF_K = int(os.getenv("RRF_K", 60))
+
+    # /query/batch: max questions per request, concurrent LLM calls
+    QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", 1000))
+    LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+
+    # per-stage timings: Prometheus text at /metrics, CHAT_TIMINGS=1 adds the breakdown to every /chat response
+    METRICS = os.getenv("METRICS", "1") != "0"
+    CHAT_TIMINGS = os.getenv("CHAT_TIMINGS", "0") == "1"
 
 # Database settings
 
@@ -22,6 +72,42 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 VECTORSTORE_DIR = os.path.join(BASE_DIR, "vectorstore")
 VECTOR_DIM = 384    
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+VECTOR_INDEX_PROMOTE_AT = int(os.getenv("VECTOR_INDEX_PROMOTE_AT", 50000))
+VECTOR_NPROBE = int(os.getenv("VECTOR_NPROBE", 16))
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", 64))
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_RERANK = int(os.getenv("VECTOR_RERANK", 4))
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", 1))
+VECTOR_SHARD_BY = os.getenv("VECTOR_SHARD_BY", "document")
+
+ASYNC_INGEST = os.getenv("ASYNC_INGEST", "1") != "0"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", max(1, (os.cpu_count() or 2) - 1)))
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+STORE_DOCUMENT_TEXT = os.getenv("STORE_DOCUMENT_TEXT", "1") == "1"
+CHUNK_STORAGE = os.getenv("CHUNK_STORAGE", "content")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 0))
+DEDUP = os.getenv("DEDUP", "1") != "0"
+DEDUP_NEAR_DISTANCE = float(os.getenv("DEDUP_NEAR_DISTANCE", 0.0))
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") != "0"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 4))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", 1000))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+
+METRICS = os.getenv("METRICS", "1") != "0"
+CHAT_TIMINGS = os.getenv("CHAT_TIMINGS", "0") == "1"
 
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", None)
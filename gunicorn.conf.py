@@ -0,0 +1,28 @@
+# gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported and warmed up once in the master (model weights, FAISS index, lexical
+# index), then forked: the worker starts serving at once.
+#
+# One worker with threads: the vectorstore, answer cache, BM25 index and /metrics live in the
+# worker process. Several workers would each hold their own copy and write the same vectorstore
+# directory without coordinating, losing each other's vectors on compaction. Scale with threads.
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+threads = int(os.getenv("WEB_THREADS", 8))
+preload_app = True
+
+
+def when_ready(server):
+    # runs in the master after the app is imported, before any worker is forked
+    if server.cfg.workers > 1:
+        server.log.warning("%d workers share one vectorstore directory without a lock, "
+                           "vectors added by one can be lost when another compacts", server.cfg.workers)
+    import app
+    app.preload()
+
+
+def post_fork(server, worker):
+    import app
+    app.post_fork()
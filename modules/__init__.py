@@ -1,15 +1,30 @@
-from .ocr import file_to_text
-from .chunking import chunk_text
-from .embeddings import get_embedding, embed_texts
-from .vectorstore import VectorStore
-from .rag_pipeline import RAGPipeline # type: ignore
-from .db import init_db, SessionLocal, Document, Chunk
+import importlib
+from typing import TYPE_CHECKING
+
+# exported name -> submodule; submodules are only imported when a name is first used (PEP 562),
+# so `import modules` doesn't pay for faiss, sqlalchemy or the OCR / embedding backends
+_EXPORTS = {
+    "file_to_text": "ocr",
+    "file_to_pages": "ocr",
+    "chunk_text": "chunking",
+    "get_embedding": "embeddings",
+    "embed_texts": "embeddings",
+    "EmbeddingCache": "embedding_cache",
+    "VectorStore": "vectorstore",
+    "RAGPipeline": "rag_pipeline",
+    "init_db": "db",
+    "SessionLocal": "db",
+    "Document": "db",
+    "Chunk": "db",
+}
 
 __all__ = [
     "file_to_text",
+    "file_to_pages",
     "chunk_text",
     "get_embedding",
     "embed_texts",
+    "EmbeddingCache",
     "VectorStore",
     "RAGPipeline",
     "init_db",
@@ -17,3 +32,24 @@ __all__ = [
     "Document",
     "Chunk",
 ]
+
+if TYPE_CHECKING:
+    from .ocr import file_to_text, file_to_pages
+    from .chunking import chunk_text
+    from .embeddings import get_embedding, embed_texts
+    from .embedding_cache import EmbeddingCache
+    from .vectorstore import VectorStore
+    from .rag_pipeline import RAGPipeline # type: ignore
+    from .db import init_db, SessionLocal, Document, Chunk
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
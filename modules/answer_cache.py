@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+
+class AnswerCache:
+    """
+    In-process cache of LLM answers.
+
+    An entry matches a new query when the query embeddings are within `similarity` cosine
+    of each other *and* retrieval returned the same chunk ids for the same top_k, so a
+    paraphrased question over changed results is a miss rather than a stale answer.
+    Entries expire after `ttl` seconds, the least recently used go first once full,
+    and ingesting vectors that would enter an entry's top-k drops it (invalidate_near).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, similarity: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype="float32").ravel()
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _expire(self, now: float):
+        for key in [k for k, e in self._entries.items() if now - e["created"] > self.ttl]:
+            del self._entries[key]
+            self.expirations += 1
+
+    def get(self, query_vec, top_k: int, result_ids: Sequence[str]) -> Optional[Dict[str, Any]]:
+        """Cached value for this query / retrieval result, or None."""
+        q = self._unit(query_vec)
+        ids = frozenset(result_ids)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            best_key, best_sim = None, self.similarity
+            for key, e in self._entries.items():
+                if e["top_k"] != top_k or e["ids"] != ids:
+                    continue
+                sim = float(np.dot(q, e["unit"]))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]["value"]
+
+    def put(self, query_vec, top_k: int, result_ids: Sequence[str], kth_distance: float, value: Dict[str, Any]):
+        """
+        kth_distance is the distance of the last hit (inf when fewer than top_k came back);
+        any new vector closer than that to the query changes the result.
+        """
+        now = time.time()
+        with self._lock:
+            self._entries[self._next_key] = {
+                "vec": np.asarray(query_vec, dtype="float32").ravel(),
+                "unit": self._unit(query_vec),
+                "top_k": top_k,
+                "ids": frozenset(result_ids),
+                "kth_distance": kth_distance,
+                "value": value,
+                "created": now,
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_near(self, embeddings) -> int:
+        """Drops entries whose top-k would change with these vectors added (squared L2, like the vectorstore)."""
+        x = np.asarray(embeddings, dtype="float32")
+        if x.size == 0:
+            return 0
+        x = x.reshape(len(x), -1)
+        with self._lock:
+            if not self._entries:
+                return 0
+            keys = list(self._entries)
+            q = np.stack([self._entries[k]["vec"] for k in keys])
+            # ||q - x||^2 for every (entry, new vector) pair, only the closest one matters
+            d = (q * q).sum(1)[:, None] - 2 * q @ x.T + (x * x).sum(1)[None, :]
+            closest = d.min(axis=1)
+            dropped = [k for k, c in zip(keys, closest) if c < self._entries[k]["kth_distance"]]
+            for k in dropped:
+                del self._entries[k]
+            self.invalidations += len(dropped)
+            return len(dropped)
+
+    def invalidate_ids(self, result_ids: Iterable[str]) -> int:
+        """Drops entries that retrieved any of these vector ids (e.g. after a delete)."""
+        ids = set(result_ids)
+        with self._lock:
+            dropped = [k for k, e in self._entries.items() if e["ids"] & ids]
+            for k in dropped:
+                del self._entries[k]
+            self.invalidations += len(dropped)
+            return len(dropped)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,587 @@
+"""
+Offline benchmarks for chunking, embedding, the vectorstore and the full pipeline.
+
+    python -m modules.benchmark [--scenarios chunk,embed,vectorstore,ingest,query] [--sizes 10000,100000]
+                                [--index-type hnsw] [--quantization sq8] [--json run.json] [--compare base.json]
+
+Everything runs against a synthetic corpus with a deterministic hashing embedder and a stub
+LLM, so there is no network and no model download, and two runs on the same machine measure
+the same work. Each scenario runs in its own process by default, which keeps peak RSS per
+scenario and stops one scenario's caches from warming the next.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+try:
+    from PIL import Image, ImageDraw
+except Exception:
+    Image = None
+
+SCENARIOS = ("chunk", "embed", "vectorstore", "ingest", "query")
+
+
+# synthetic corpus
+def make_vocabulary(size: int = 5000, seed: int = 0) -> List[str]:
+    """Pronounceable made-up words, so tokenizers and BM25 see realistic lengths."""
+    rng = np.random.default_rng(seed)
+    consonants, vowels = list("bcdfghklmnprstvz"), list("aeiou")
+    words = set()
+    while len(words) < size:
+        syllables = rng.integers(1, 4)
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(syllables)))
+    return sorted(words)
+
+
+def make_corpus(num_docs: int, words_per_doc: int = 2000, vocab_size: int = 5000,
+                seed: int = 0) -> List[str]:
+    """
+    num_docs documents of sentences drawn from a Zipf-like distribution. Every document
+    also gets a few topic words of its own, so queries built from it have a right answer.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = make_vocabulary(vocab_size, seed)
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+    docs = []
+    for d in range(num_docs):
+        topic = [f"topic{d}x{t}" for t in range(3)]
+        words = list(rng.choice(vocab, size=words_per_doc, p=weights))
+        for pos in rng.integers(0, words_per_doc, size=max(1, words_per_doc // 50)):
+            words[pos] = topic[pos % 3]
+        sentences, start = [], 0
+        while start < len(words):
+            n = int(rng.integers(8, 21))
+            sentence = " ".join(words[start:start + n])
+            sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+            start += n
+        docs.append(" ".join(sentences))
+    return docs
+
+
+def make_queries(docs: Sequence[str], num_queries: int, words: int = 6, seed: int = 1) -> List[Tuple[str, int]]:
+    """(query text, index of the document it was cut from)."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(num_queries):
+        d = int(rng.integers(len(docs)))
+        tokens = docs[d].split()
+        start = int(rng.integers(max(1, len(tokens) - words)))
+        queries.append((" ".join(tokens[start:start + words]).strip("."), d))
+    return queries
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, text: str, lines_per_page: int = 50, chars_per_line: int = 90):
+    """Writes text as a PDF with a real text layer (Helvetica, no fonts embedded)."""
+    words, lines, line = text.split(), [], ""
+    for w in words:
+        if line and len(line) + len(w) + 1 > chars_per_line:
+            lines.append(line)
+            line = w
+        else:
+            line = f"{line} {w}" if line else w
+    if line:
+        lines.append(line)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        body = " T* ".join(f"({_pdf_escape(l)}) Tj" for l in page)
+        stream = f"BT /F1 10 Tf 12 TL 40 760 Td {body} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+    return len(pages)
+
+
+def write_image(path: str, text: str, width: int = 1700, line_height: int = 28, chars_per_line: int = 110):
+    """Renders text black on white as a scan-like PNG (needs Pillow), for the OCR path."""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed, can't render images")
+    words, lines, line = text.split(), [], ""
+    for w in words:
+        if line and len(line) + len(w) + 1 > chars_per_line:
+            lines.append(line)
+            line = w
+        else:
+            line = f"{line} {w}" if line else w
+    lines.append(line)
+    img = Image.new("L", (width, 80 + line_height * len(lines)), color=255)
+    draw = ImageDraw.Draw(img)
+    for i, l in enumerate(lines):
+        draw.text((40, 40 + i * line_height), l, fill=0)
+    img.save(path)
+
+
+# stubs
+class HashEmbedder:
+    """
+    Deterministic bag-of-words embedder: each token maps to a fixed random direction
+    (seeded by its crc32), a text is the normalized sum. Texts sharing words end up close,
+    which is all retrieval benchmarks need, at well under a millisecond per text.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._tokens: Dict[str, np.ndarray] = {}
+
+    def _token(self, token: str) -> np.ndarray:
+        vec = self._tokens.get(token)
+        if vec is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode("utf-8")))
+            vec = self._tokens[token] = rng.standard_normal(self.dim).astype("float32")
+        return vec
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for token in text.lower().replace(".", " ").split():
+                out[i] += self._token(token)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-6)
+
+
+class StubLLM:
+    """Stands in for the Ollama client: fixed answer after `latency` seconds, streamed word by word."""
+
+    def __init__(self, latency: float = 0.0, answer: str = "This is a benchmark answer."):
+        self.latency = latency
+        self.answer = answer
+
+    def chat(self, messages, stream: bool = False):
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return iter([{"message": {"content": w + " "}} for w in self.answer.split()])
+        return {"message": self.answer}
+
+
+@contextmanager
+def patched(obj, **attrs):
+    # setattr for the duration of the block
+    saved = {name: getattr(obj, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(obj, name, value)
+
+
+@contextmanager
+def stub_embeddings(dim: int, cache_dir: str = None):
+    """
+    Routes embed_texts / get_embedding to a HashEmbedder. The real batching and embedding
+    cache code still runs (against a throwaway cache in cache_dir, or none).
+    """
+    from . import embeddings
+    from .embedding_cache import EmbeddingCache
+
+    embedder = HashEmbedder(dim)
+    cache = EmbeddingCache(os.path.join(cache_dir, "embed_cache.sqlite")) if cache_dir else None
+    with patched(embeddings,
+                 _resolve_provider=lambda provider="sentence_transformers": "sentence_transformers",
+                 _encode=lambda texts, provider, model_name, batch_size: embedder(texts),
+                 _cache=cache, EMBED_CACHE_ENABLED=cache is not None):
+        yield embedder
+
+
+@contextmanager
+def scratch_pipeline(workdir: str, dim: int, vector_options: Dict[str, Any] = None,
+                     llm_latency: float = 0.0, **options):
+    """A RAGPipeline on a throwaway SQLite DB and vectorstore under workdir, with stub embedder and LLM."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from . import rag_pipeline
+    from .db import Base
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                           connect_args={"check_same_thread": False})
+    Session = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    with stub_embeddings(dim, cache_dir=workdir), \
+            patched(rag_pipeline, SessionLocal=Session, init_db=lambda: Base.metadata.create_all(bind=engine)):
+        rp = rag_pipeline.RAGPipeline(vector_dim=dim, vector_persist=os.path.join(workdir, "vectorstore"),
+                                      vector_options=vector_options, **options)
+        rp.ollama_client = StubLLM(llm_latency)
+        try:
+            yield rp
+        finally:
+            rp.vs.wait_for_compaction()
+            engine.dispose()
+
+
+# measuring
+def latency_stats(seconds: Sequence[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds, dtype="float64") * 1000
+    if not len(ms):
+        return {}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3), "mean_ms": round(float(ms.mean()), 3)}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """High-water mark of this process's resident memory."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def recall_at_k(found: Sequence[Sequence[int]], truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t.tolist())) / k for f, t in zip(found, truth)]))
+
+
+def _timed(fn: Callable, items: Sequence) -> Tuple[float, List[float], List[Any]]:
+    # total seconds, per-item seconds, results
+    samples, results = [], []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        results.append(fn(item))
+        samples.append(time.perf_counter() - t)
+    return time.perf_counter() - start, samples, results
+
+
+# scenarios
+def bench_chunk(num_docs: int = 200, words_per_doc: int = 2000, seed: int = 0, **_) -> Dict[str, Any]:
+    from .chunking import chunk_text
+
+    docs = make_corpus(num_docs, words_per_doc, seed=seed)
+    total, samples, chunks = _timed(chunk_text, docs)
+    mb = sum(len(d) for d in docs) / 1e6
+    return {"docs": num_docs, "chunks": sum(len(c) for c in chunks), "mb_per_sec": round(mb / total, 2),
+            "chunks_per_sec": round(sum(len(c) for c in chunks) / total, 1), **latency_stats(samples)}
+
+
+def bench_embed(num_docs: int = 200, words_per_doc: int = 2000, dim: int = 384, batch: int = 64,
+                seed: int = 0, **_) -> Dict[str, Any]:
+    """embed_texts overhead around the embedder: batching, cache misses (cold) and hits (warm)."""
+    from .chunking import chunk_text
+    from . import embeddings
+
+    texts = [c for d in make_corpus(num_docs, words_per_doc, seed=seed) for c in chunk_text(d)]
+    batches = [texts[i:i + batch] for i in range(0, len(texts), batch)]
+    workdir = tempfile.mkdtemp(prefix="bench_embed_")
+    try:
+        with stub_embeddings(dim, cache_dir=workdir):
+            cold, samples, _ = _timed(embeddings.embed_texts, batches)
+            warm, _, _ = _timed(embeddings.embed_texts, batches)
+        with stub_embeddings(dim):
+            uncached, _, _ = _timed(embeddings.embed_texts, batches)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"texts": len(texts), "batch": batch,
+            "cold_texts_per_sec": round(len(texts) / cold, 1),
+            "warm_texts_per_sec": round(len(texts) / warm, 1),
+            "uncached_texts_per_sec": round(len(texts) / uncached, 1),
+            **latency_stats(samples)}
+
+
+def _vector_blocks(n: int, dim: int, block: int = 100_000, clusters: int = 256,
+                   seed: int = 0) -> Iterator[np.ndarray]:
+    # clustered gaussian vectors, regenerated block by block so n can exceed RAM
+    centers = np.random.default_rng(seed).standard_normal((clusters, dim)).astype("float32")
+    for b, start in enumerate(range(0, n, block)):
+        rng = np.random.default_rng([seed, b + 1])
+        size = min(block, n - start)
+        noise = rng.standard_normal((size, dim), dtype="float32") * 0.5
+        yield centers[rng.integers(clusters, size=size)] + noise
+
+
+def bench_vectorstore(size: int = 10_000, dim: int = 384, num_queries: int = 200, k: int = 10,
+                      index_type: str = "flat", quantization: str = "none", add_batch: int = 10_000,
+                      seed: int = 0, **_) -> Dict[str, Any]:
+    """VectorStore.add throughput, index build time, search latency and recall@k against exact search."""
+    import faiss
+    from .vectorstore import VectorStore
+
+    queries = next(_vector_blocks(num_queries, dim, seed=seed + 1_000_003))
+    workdir = tempfile.mkdtemp(prefix="bench_vs_")
+    try:
+        vs = VectorStore(dim=dim, persist_path=workdir, index_type=index_type, quantization=quantization,
+                         promote_at=0 if (index_type != "flat" or quantization != "none") else None)
+        add_seconds, truth_d, truth_i, offset = 0.0, None, None, 0
+        for vectors in _vector_blocks(size, dim, seed=seed):
+            for start in range(0, len(vectors), add_batch):
+                part = vectors[start:start + add_batch]
+                first = offset + start
+                t = time.perf_counter()
+                vs.add(part, [{"document_id": (first + i) // 100} for i in range(len(part))],
+                       [str(first + i) for i in range(len(part))])
+                add_seconds += time.perf_counter() - t
+            # exact top-k, merged block by block
+            d, i = faiss.knn(queries, vectors, k)
+            i = np.where(i >= 0, i + offset, -1)
+            if truth_d is None:
+                truth_d, truth_i = d, i
+            else:
+                d, i = np.hstack([truth_d, d]), np.hstack([truth_i, i])
+                order = np.argsort(d, axis=1, kind="stable")[:, :k]
+                truth_d, truth_i = np.take_along_axis(d, order, 1), np.take_along_axis(i, order, 1)
+            offset += len(vectors)
+
+        t = time.perf_counter()
+        vs.wait_for_compaction()
+        vs.compact()  # folds the delta logs and trains index_type / quantization
+        build_seconds = time.perf_counter() - t
+
+        _, samples, results = _timed(lambda q: vs.search(q, top_k=k), queries)
+        t = time.perf_counter()
+        vs.search_batch(queries, top_k=k)
+        batch_seconds = time.perf_counter() - t
+        found = [[int(id_) for id_, _, _ in rows] for rows in results]
+        index = vs.index_name
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"vectors": size, "index": index,
+            "add_vectors_per_sec": round(size / add_seconds, 1), "build_s": round(build_seconds, 3),
+            "batch_queries_per_sec": round(num_queries / batch_seconds, 1),
+            f"recall@{k}": round(recall_at_k(found, truth_i), 4), **latency_stats(samples)}
+
+
+def bench_ingest(num_docs: int = 20, words_per_doc: int = 2000, dim: int = 384, kind: str = "pdf",
+                 seed: int = 0, **_) -> Dict[str, Any]:
+    """Full ingest_image per file: text extraction (or OCR), chunking, embedding, DB + vectorstore writes."""
+    from . import ocr
+
+    if kind == "image" and not ocr._ocr_available():
+        return {"skipped": "no OCR backend installed"}
+    docs = make_corpus(num_docs, words_per_doc, seed=seed)
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        paths, pages = [], 0
+        for i, text in enumerate(docs):
+            path = os.path.join(workdir, f"doc{i}.{'pdf' if kind == 'pdf' else 'png'}")
+            if kind == "pdf":
+                pages += write_pdf(path, text)
+            else:
+                write_image(path, text)
+                pages += 1
+            paths.append(path)
+        mb = sum(os.path.getsize(p) for p in paths) / 1e6
+        with scratch_pipeline(workdir, dim) as rp:
+            total, samples, infos = _timed(rp.ingest_image, paths)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    chunks = sum(info["num_chunks"] for info in infos)
+    return {"docs": num_docs, "kind": kind, "pages": pages, "chunks": chunks,
+            "docs_per_sec": round(num_docs / total, 2), "pages_per_sec": round(pages / total, 1),
+            "chunks_per_sec": round(chunks / total, 1), "mb_per_sec": round(mb / total, 2),
+            **latency_stats(samples)}
+
+
+def bench_query(num_docs: int = 200, words_per_doc: int = 2000, dim: int = 384, num_queries: int = 200,
+                k: int = 5, index_type: str = "flat", quantization: str = "none", hybrid: bool = False,
+                llm_ms: float = 0.0, shards: int = 1, seed: int = 0, **_) -> Dict[str, Any]:
+    """
+    Full query(): embed, search, hydrate, prompt, stub LLM. recall@k compares the retrieved
+    chunks with exact search over the same vectors, hit@k is how often the document the
+    query was cut from is among them.
+    """
+    import faiss
+    from .chunking import chunk_text
+    from . import embeddings
+
+    docs = make_corpus(num_docs, words_per_doc, seed=seed)
+    queries = make_queries(docs, num_queries, seed=seed + 1)
+    workdir = tempfile.mkdtemp(prefix="bench_query_")
+    options = {"index_type": index_type, "quantization": quantization, "shards": shards,
+               "promote_at": 0 if (index_type != "flat" or quantization != "none") else None}
+    try:
+        with scratch_pipeline(workdir, dim, vector_options=options, llm_latency=llm_ms / 1000,
+                              hybrid=hybrid) as rp:
+            infos = rp.ingest_chunked([(f"doc{i}.pdf", [(c, 1) for c in chunk_text(text)])
+                                       for i, text in enumerate(docs)])
+            rp.vs.wait_for_compaction()
+            rp.vs.compact()
+            rp.query(queries[0][0], top_k=k)  # loads the lexical index, warms the DB connection
+
+            total, samples, responses = _timed(lambda q: rp.query(q[0], top_k=k), queries)
+            t = time.perf_counter()
+            rp.query_batch([q for q, _ in queries], top_k=k)
+            batch_seconds = time.perf_counter() - t
+
+            q_embs = embeddings.embed_texts([q for q, _ in queries])
+            stored, stored_metas = rp.vs.vectors()
+            _, truth = faiss.knn(q_embs, stored, k)
+            # every stored vector carries its chunk id, lexical-only hits too
+            position = {m["chunk_id"]: i for i, m in enumerate(stored_metas)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    found = [[position.get(r["metadata"].get("chunk_id"), -1) for r in resp["retrieved"]] for resp in responses]
+    doc_ids = [info["document_id"] for info in infos]
+    hits = [doc_ids[d] in {r["metadata"].get("document_id") for r in resp["retrieved"]}
+            for (_, d), resp in zip(queries, responses)]
+    return {"docs": num_docs, "chunks": len(stored), "queries": num_queries,
+            "queries_per_sec": round(num_queries / total, 1),
+            "batch_queries_per_sec": round(num_queries / batch_seconds, 1),
+            f"recall@{k}": round(recall_at_k(found, truth), 4), f"hit@{k}": round(float(np.mean(hits)), 4),
+            **latency_stats(samples)}
+
+
+BENCHES: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "chunk": bench_chunk,
+    "embed": bench_embed,
+    "vectorstore": bench_vectorstore,
+    "ingest": bench_ingest,
+    "query": bench_query,
+}
+
+
+def run_scenario(scenario: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one benchmark in this process, adds the process's peak RSS."""
+    metrics = BENCHES[scenario](**params)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return {"scenario": scenario, "params": params, "metrics": metrics}
+
+
+def run_isolated(scenario: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    # fresh interpreter per scenario: peak RSS is the scenario's own, no warm caches carried over
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(run_scenario, (scenario, params))
+
+
+# comparing runs
+def _direction(metric: str) -> int:
+    # +1 higher is better, -1 lower is better, 0 not compared
+    if metric.endswith("_per_sec") or metric.startswith(("recall@", "hit@")):
+        return 1
+    if metric.endswith(("_ms", "_s", "_mb")):
+        return -1
+    return 0
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.1) -> List[str]:
+    """Regressions of current vs. baseline beyond tolerance (a fraction), for scenarios run with the same params."""
+    def key(result):
+        return result["scenario"], json.dumps(result["params"], sort_keys=True)
+
+    before = {key(r): r["metrics"] for r in baseline.get("results", [])}
+    regressions = []
+    for result in current.get("results", []):
+        old = before.get(key(result))
+        if old is None:
+            continue
+        for metric, value in result["metrics"].items():
+            direction, previous = _direction(metric), old.get(metric)
+            if not direction or not isinstance(value, (int, float)) or not isinstance(previous, (int, float)):
+                continue
+            if previous and direction * (value - previous) / abs(previous) < -tolerance:
+                regressions.append(f"{result['scenario']} {result['params']}: {metric} {previous} -> {value}")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a synthetic corpus and stub models.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma separated, from {SCENARIOS}")
+    parser.add_argument("--sizes", default="10000,100000", help="vector counts for the vectorstore scenario")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--docs", type=int, default=None, help="documents for chunk/embed/ingest/query")
+    parser.add_argument("--words", type=int, default=2000, help="words per synthetic document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--quantization", default="none")
+    parser.add_argument("--hybrid", action="store_true", help="BM25 + vector retrieval in the query scenario")
+    parser.add_argument("--ingest-kind", default="pdf", choices=("pdf", "image"))
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="simulated LLM latency per call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-isolate", action="store_true", help="run every scenario in this process")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative change before a regression")
+    args = parser.parse_args(argv)
+
+    common = {"dim": args.dim, "words_per_doc": args.words, "seed": args.seed}
+    runs: List[Tuple[str, Dict[str, Any]]] = []
+    for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        if scenario not in BENCHES:
+            parser.error(f"unknown scenario '{scenario}', expected one of {SCENARIOS}")
+        if scenario == "vectorstore":
+            for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+                runs.append((scenario, {"size": size, "dim": args.dim, "num_queries": args.queries, "k": args.k,
+                                        "index_type": args.index_type, "quantization": args.quantization,
+                                        "seed": args.seed}))
+        elif scenario == "ingest":
+            runs.append((scenario, dict(common, num_docs=args.docs or 20, kind=args.ingest_kind)))
+        elif scenario == "query":
+            runs.append((scenario, dict(common, num_docs=args.docs or 200, num_queries=args.queries, k=args.k,
+                                        index_type=args.index_type, quantization=args.quantization,
+                                        hybrid=args.hybrid, llm_ms=args.llm_ms)))
+        else:
+            runs.append((scenario, dict(common, num_docs=args.docs or 200)))
+
+    results = []
+    for scenario, params in runs:
+        result = run_scenario(scenario, params) if args.no_isolate else run_isolated(scenario, params)
+        results.append(result)
+        print(f"[bench] {scenario} {params}")
+        print("        " + ", ".join(f"{k}={v}" for k, v in result["metrics"].items()))
+
+    report = {"meta": {"commit": _git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                       "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+              "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, tolerance=args.tolerance)
+        for line in regressions:
+            print(f"[bench] REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Bulk ingestion of a directory or .zip archive.
+
+    python -m modules.bulk_ingest path/to/docs [--manifest run.jsonl] [--processes 8]
+
+Files are extracted + chunked in a process pool (sized and stored like the pipeline's own
+ingest: CHUNK_TOKENS, CHUNK_STORAGE, STORE_DOCUMENT_TEXT), chunks from many files are embedded
+together and written to the DB / vectorstore in large batches. Every committed file is
+appended to a JSONL manifest, so re-running the same command skips what is already done.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .chunking import SpanChunker
+from .dedup import file_sha256
+from .embeddings import chunk_sizing
+from .ocr import iter_pages
+
+SUPPORTED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".pdf"}
+BULK_BATCH_CHUNKS = int(os.getenv("BULK_BATCH_CHUNKS", "2048"))
+
+# (key, location, member) - member is the name inside the archive, None for plain files
+Source = Tuple[str, str, Optional[str]]
+# what a worker sends back for a file: [(chunk, page_number)], the cleaned text (if kept), [(start, end)]
+Extracted = Tuple[List[Tuple[str, Optional[int]]], Optional[str], List[Tuple[int, int]]]
+
+# per worker process: chunk_tokens -> SpanChunker options, the tokenizer is loaded for the first file
+_SIZING: Dict[int, Dict[str, Any]] = {}
+
+
+def iter_sources(path: str) -> Iterator[Source]:
+    """Supported files under a directory (recursively) or inside a zip archive, in a stable order."""
+    root = Path(path)
+    if root.is_file() and zipfile.is_zipfile(root):
+        with zipfile.ZipFile(root) as zf:
+            infos = sorted(zf.infolist(), key=lambda i: i.filename)
+        for info in infos:
+            if not info.is_dir() and Path(info.filename).suffix.lower() in SUPPORTED_EXTENSIONS:
+                yield f"{root.name}!{info.filename}:{info.file_size}:{info.CRC}", str(root), info.filename
+    elif root.is_file():
+        yield f"{root.name}:{root.stat().st_size}", str(root), None
+    else:
+        for p in sorted(root.rglob("*")):
+            if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS:
+                yield f"{p.relative_to(root).as_posix()}:{p.stat().st_size}", str(p), None
+
+
+def _extract_chunks(location: str, member: Optional[str], use_gvision: bool = False, chunk_tokens: int = 0,
+                    keep_text: bool = False) -> Extracted:
+    # worker: chunks of one file, cut like RAGPipeline.ingest_pages would; PDFs stay single-process here,
+    # the pool is the parallelism
+    tmp_dir = None
+    try:
+        if member is not None:
+            tmp_dir = tempfile.mkdtemp(prefix="bulk_")
+            path = os.path.join(tmp_dir, "doc" + Path(member).suffix.lower())
+            with zipfile.ZipFile(location) as zf, zf.open(member) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            path = location
+        if chunk_tokens not in _SIZING:
+            _SIZING[chunk_tokens] = chunk_sizing(chunk_tokens, provider="sentence_transformers",
+                                                 model_name="all-MiniLM-L6-v2")
+        chunker = SpanChunker(iter_pages(path, use_gvision=use_gvision, processes=1), keep_text=keep_text,
+                              **_SIZING[chunk_tokens])
+        spans = list(chunker)
+        return [(s.text, s.page) for s in spans], chunker.text if keep_text else None, [(s.start, s.end) for s in spans]
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _source_sha256(source: Source, archives: Dict[str, zipfile.ZipFile]) -> str:
+    _, location, member = source
+    if member is None:
+        return file_sha256(location)
+    # one open handle per archive, re-reading the central directory per member adds up
+    if location not in archives:
+        archives[location] = zipfile.ZipFile(location)
+    with archives[location].open(member) as f:
+        return file_sha256(f)
+
+
+def load_manifest(path: str) -> Set[str]:
+    """Keys of files already committed by a previous run."""
+    done: Set[str] = set()
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a killed run
+            if entry.get("status") == "done":
+                done.add(entry["key"])
+    return done
+
+
+class _Manifest:
+    def __init__(self, path: Optional[str]):
+        self._f = open(path, "a", encoding="utf-8") if path else None
+
+    def write(self, entries: List[Dict[str, Any]]):
+        if self._f is None:
+            return
+        for e in entries:
+            self._f.write(json.dumps(e) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+
+
+def bulk_ingest(pipeline, path: str, manifest_path: str = None, processes: int = None,
+                batch_chunks: int = None, use_gvision: bool = False, log=print) -> Dict[str, Any]:
+    """
+    Ingests every supported file under `path` (directory or .zip) into `pipeline`.
+    Returns counts and throughput; files listed as done in the manifest are skipped,
+    and with pipeline.dedup files whose bytes were already ingested are never extracted.
+    """
+    processes = processes or max(1, (os.cpu_count() or 2) - 1)
+    batch_chunks = batch_chunks or BULK_BATCH_CHUNKS
+    done = load_manifest(manifest_path)
+    manifest = _Manifest(manifest_path)
+    stats = {"files": 0, "chunks": 0, "skipped": 0, "duplicates": 0, "failed": 0}
+    dedup = getattr(pipeline, "dedup", False)
+    chunk_tokens = getattr(pipeline, "chunk_tokens", 0)
+    keep_text = getattr(pipeline, "chunk_storage", "content") == "offsets" or getattr(pipeline, "store_document_text", False)
+    hashes: Dict[str, str] = {}  # key -> sha256 of files sent to extraction
+    seen: Set[str] = set()
+    archives: Dict[str, zipfile.ZipFile] = {}
+
+    pending_docs: List[Tuple[str, str, Extracted]] = []  # (key, filename, extracted)
+    pending_chunks = 0
+
+    def flush():
+        nonlocal pending_docs, pending_chunks
+        if not pending_docs:
+            return
+        infos = pipeline.ingest_chunked([(name, extracted[0]) for _, name, extracted in pending_docs],
+                                        content_hashes=[hashes.get(key) for key, _, _ in pending_docs],
+                                        document_texts=[extracted[1] for _, _, extracted in pending_docs],
+                                        spans=[extracted[2] for _, _, extracted in pending_docs])
+        # only recorded after the commit, so a crash before this point re-processes the batch
+        manifest.write([
+            {"key": key, "status": "done", "document_id": info["document_id"], "num_chunks": info["num_chunks"]}
+            for (key, _, _), info in zip(pending_docs, infos)
+        ])
+        stats["files"] += len(pending_docs)
+        stats["chunks"] += pending_chunks
+        pending_docs, pending_chunks = [], 0
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # bounded number of files in flight so a huge tree doesn't queue everything up front
+            running: Dict[Any, Source] = {}
+            for source in iter_sources(path):
+                if source[0] in done:
+                    stats["skipped"] += 1
+                    continue
+                if dedup and _is_duplicate(pipeline, source, hashes, seen, archives, manifest):
+                    stats["duplicates"] += 1
+                    continue
+                running[pool.submit(_extract_chunks, source[1], source[2], use_gvision, chunk_tokens, keep_text)] = source
+                if len(running) < processes * 2:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    pending_chunks += _collect(fut, running.pop(fut), pending_docs, manifest, stats, log)
+                if pending_chunks >= batch_chunks:
+                    flush()
+            for fut in list(running):
+                pending_chunks += _collect(fut, running.pop(fut), pending_docs, manifest, stats, log)
+                if pending_chunks >= batch_chunks:
+                    flush()
+        flush()
+    finally:
+        manifest.close()
+        for zf in archives.values():
+            zf.close()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["files_per_sec"] = round(stats["files"] / elapsed, 2) if elapsed else 0.0
+    stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+    return stats
+
+
+def _is_duplicate(pipeline, source: Source, hashes: Dict[str, str], seen: Set[str],
+                  archives: Dict[str, zipfile.ZipFile], manifest: _Manifest) -> bool:
+    content_hash = _source_sha256(source, archives)
+    if content_hash in seen:
+        # copy of a file from this run that may not be committed yet: no manifest entry,
+        # a resumed run finds it in the DB instead
+        return True
+    existing = pipeline.find_document_by_hash(content_hash)
+    if existing:
+        manifest.write([{"key": source[0], "status": "done", "document_id": existing["document_id"],
+                         "duplicate": True}])
+        return True
+    hashes[source[0]] = content_hash
+    seen.add(content_hash)
+    return False
+
+
+def _collect(fut, source: Source, pending_docs: list, manifest: _Manifest, stats: Dict[str, Any], log) -> int:
+    key, location, member = source
+    name = os.path.basename(member or location)
+    try:
+        extracted = fut.result()
+    except Exception as e:
+        # failed files aren't marked done, the next run retries them
+        log(f"[bulk] failed {key}: {e}")
+        manifest.write([{"key": key, "status": "failed", "error": str(e)}])
+        stats["failed"] += 1
+        return 0
+    pending_docs.append((key, name, extracted))
+    return len(extracted[0])
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory or zip archive of documents.")
+    parser.add_argument("path", help="directory or .zip archive")
+    parser.add_argument("--manifest", help="JSONL checkpoint file (default: <path>.manifest.jsonl)")
+    parser.add_argument("--processes", type=int, default=None, help="extraction worker processes")
+    parser.add_argument("--batch-chunks", type=int, default=None, help="chunks embedded/stored per batch")
+    parser.add_argument("--gvision", action="store_true", help="use Google Vision for OCR")
+    args = parser.parse_args(argv)
+
+    from config import Config
+    from .rag_pipeline import RAGPipeline
+
+    pipeline = RAGPipeline(
+        vector_dim=Config.VECTOR_DIM,
+        vector_persist=Config.VECTORSTORE_DIR,
+        ollama_model=getattr(Config, "OLLAMA_MODEL", "llama2"),
+        embed_batch_size=Config.EMBED_BATCH_SIZE,
+        dedup=Config.DEDUP,
+        near_dup_distance=Config.DEDUP_NEAR_DISTANCE,
+        store_document_text=Config.STORE_DOCUMENT_TEXT,
+        chunk_storage=Config.CHUNK_STORAGE,
+        chunk_tokens=Config.CHUNK_TOKENS,
+        vector_options={
+            "index_type": Config.VECTOR_INDEX_TYPE,
+            "promote_at": Config.VECTOR_INDEX_PROMOTE_AT,
+            "nprobe": Config.VECTOR_NPROBE,
+            "ef_search": Config.VECTOR_EF_SEARCH,
+            "quantization": Config.VECTOR_QUANTIZATION,
+            "rerank": Config.VECTOR_RERANK,
+            "shards": Config.VECTOR_SHARDS,
+            "shard_by": Config.VECTOR_SHARD_BY,
+        },
+    )
+    manifest = args.manifest or os.path.abspath(args.path).rstrip(os.sep) + ".manifest.jsonl"
+    stats = bulk_ingest(pipeline, args.path, manifest_path=manifest, processes=args.processes,
+                        batch_chunks=args.batch_chunks, use_gvision=args.gvision)
+    print(f"[bulk] {stats['files']} files, {stats['chunks']} chunks in {stats['seconds']}s "
+          f"({stats['files_per_sec']} files/sec, {stats['chunks_per_sec']} chunks/sec); "
+          f"{stats['skipped']} skipped, {stats['duplicates']} duplicates, {stats['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 
 import re
-from typing import List
+from bisect import bisect_right
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 
 def clean_text(text: str) -> str:
@@ -25,43 +26,219 @@ def clean_text(text: str) -> str:
     return text.strip()
 
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-    text = clean_text(text)
-    if not text:
-        return []
-
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks = []
-    current = ""
-
-    for s in sentences:
-        if len(current) + len(s) <= chunk_size:
-            current = (current + " " + s).strip()
-        else:
-            if current:
-                chunks.append(current)
-            # If the sentence itself is too long, split by characters
-            if len(s) > chunk_size:
-                for i in range(0, len(s), chunk_size - overlap):
-                    part = s[i:i + (chunk_size - overlap)].strip()
-                    if part:
-                        chunks.append(part)
-                current = ""
-            else:
-                current = s
-    if current:
-        chunks.append(current)
-
-    # ensuring minimal overlap between subsequent chunks
-    final = []
-    for i, c in enumerate(chunks):
-        if i == 0:
-            final.append(c)
-        else:
-            # creating overlap from previous
-            overlap_text = final[-1][-overlap:] if overlap and len(final[-1]) >= overlap else ""
-            if overlap_text:
-                final.append((overlap_text + " " + c).strip())
-            else:
-                final.append(c)
-    return final
+# sentence boundary: the punctuation and the whitespace after it (no lookbehind, which is twice as slow)
+_SENTENCE_END = re.compile(r"[.!?]\s+")
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+    page: Optional[int]
+    text: str  # the cleaned document text [start:end]
+
+
+class SpanChunker:
+    """
+    Single pass chunker over [(page_number, text)] that emits offsets instead of rebuilding strings.
+    Iterating yields Span(start, end, page, text) as soon as a chunk is complete, where the offsets
+    index into .text, the cleaned pages joined by newlines. Chunks are whole sentences (sentences
+    running over a page break included) of at most chunk_size as measured by `length`: characters by
+    default, or e.g. an embedding model's token counter. Each chunk starts up to `overlap` characters
+    back into the one before, which counts towards its size.
+    Pages the chunker is done with are dropped as it goes; with keep_text they are kept until the
+    caller release()s them, so .text is the whole document when nothing was released.
+    """
+
+    def __init__(self, pages: Iterable[Tuple[Optional[int], str]], chunk_size: int = 500, overlap: int = 50,
+                 length: Callable[[str], int] = None, keep_text: bool = True):
+        self.pages = pages
+        self.chunk_size = max(1, chunk_size)
+        self.overlap = max(0, overlap)
+        self.length = length or len
+        self.keep_text = keep_text
+        self._chars = self.length is len  # sizes are plain offset differences then
+        self._parts: List[str] = []
+        self._starts: List[int] = []
+        self._end = 0
+        self._needed = 0  # oldest offset the chunker itself still slices from
+        self._released = 0
+
+    @property
+    def text(self) -> str:
+        """Cleaned text of the pages consumed so far, from the first page still held."""
+        return "\n".join(self._parts)
+
+    def text_from(self, start: int) -> str:
+        """Cleaned text from offset `start` (not released yet) up to the end of the pages consumed so far."""
+        return self._slice(start, self._end) if start < self._end else ""
+
+    def release(self, offset: int):
+        """With keep_text: the caller is done with the text before `offset`."""
+        self._released = max(self._released, offset)
+        self._trim()
+
+    def _trim(self):
+        keep = min(self._needed, self._released) if self.keep_text else self._needed
+        drop = 0
+        # the last page is always kept, the next one's offset and sentence end check go by it
+        while drop < len(self._parts) - 1 and self._starts[drop] + len(self._parts[drop]) < keep:
+            drop += 1
+        if drop:
+            del self._parts[:drop]
+            del self._starts[:drop]
+
+    def _append(self, cleaned: str) -> int:
+        start = self._end + 1 if self._parts else 0
+        self._parts.append(cleaned)
+        self._starts.append(start)
+        self._end = start + len(cleaned)
+        return start
+
+    def _slice(self, start: int, end: int) -> str:
+        i = bisect_right(self._starts, start) - 1
+        part_start = self._starts[i]
+        if end <= part_start + len(self._parts[i]):
+            return self._parts[i][start - part_start:end - part_start]
+        # runs over a page break
+        pieces = []
+        while i < len(self._parts) and self._starts[i] < end:
+            s = self._starts[i]
+            pieces.append(self._parts[i][max(start - s, 0):end - s])
+            i += 1
+        return "\n".join(pieces)
+
+    def _measure(self, start: int, end: int) -> int:
+        return end - start if self._chars else self.length(self._slice(start, end))
+
+    def _overlap_start(self, prev: Optional[Tuple[int, int]]) -> Optional[int]:
+        # start of the overlap taken from the previous chunk, moved up to a word boundary
+        if prev is None or not self.overlap or prev[1] - prev[0] < self.overlap:
+            return None
+        start = prev[1] - self.overlap
+        tail = self._slice(start, prev[1])
+        space = tail.find(" ")
+        return start + space + 1 if 0 <= space < len(tail) - 1 else start
+
+    def __iter__(self) -> Iterator[Span]:
+        size = self.chunk_size
+        ready: List[Span] = []  # completed chunks, handed out after each sentence
+        prev: Optional[Tuple[int, int]] = None  # (start, end) of the last emitted chunk
+        chunk: Optional[list] = None  # [first sentence start, end, page, size, budget, overlap start]
+        pending: Optional[Tuple[int, Optional[int]]] = None  # (start, page) of the sentence in progress
+
+        def emit(start: int, end: int, page: Optional[int], ov_start: Optional[int]):
+            nonlocal prev
+            if ov_start is not None:
+                start = ov_start
+            prev = (start, end)
+            ready.append(Span(start, end, page, self._slice(start, end)))
+
+        def open_chunk(start: int, end: int, page: Optional[int], n: int) -> list:
+            ov_start = self._overlap_start(prev)
+            budget = size
+            if ov_start is not None:
+                budget = size - self._measure(ov_start, start)
+                if n > budget:  # no room for the overlap next to this sentence
+                    ov_start, budget = None, size
+            return [start, end, page, n, budget, ov_start]
+
+        def add(start: int, end: int, page: Optional[int]):
+            nonlocal chunk
+            if end <= start:
+                return
+            if chunk is not None:
+                # measured from the end of the chunk, so the whitespace in between counts too
+                grown = chunk[3] + self._measure(chunk[1], end)
+                if grown <= chunk[4]:
+                    chunk[1], chunk[3] = end, grown
+                    return
+                emit(chunk[0], chunk[1], chunk[2], chunk[5])
+                chunk = None
+            n = self._measure(start, end)
+            if n <= size:
+                chunk = open_chunk(start, end, page, n)
+                return
+            # sentence longer than a chunk: cut at proportional offsets, preferably on a space
+            text = self._slice(start, end)
+            step = max(1, int(len(text) * size // n) - self.overlap)
+            pos = 0
+            while pos < len(text):
+                cut = min(pos + step, len(text))
+                if cut < len(text):
+                    space = text.rfind(" ", pos + step // 2, cut)
+                    cut = space if space > pos else cut
+                part_start = pos + len(text[pos:cut]) - len(text[pos:cut].lstrip())
+                if cut > part_start:
+                    ov_start = self._overlap_start(prev)
+                    # proportional cuts miss where the token density changes, so measure each piece:
+                    # drop the overlap first, then shrink the piece until it fits
+                    while True:
+                        m = self._measure(start + part_start if ov_start is None else ov_start, start + cut)
+                        if m <= size:
+                            break
+                        if ov_start is not None:
+                            ov_start = None
+                            continue
+                        shrunk = min(cut - 1, part_start + int((cut - part_start) * size // m))
+                        space = text.rfind(" ", part_start + (shrunk - part_start) // 2, shrunk)
+                        cut = max(part_start + 1, space if space > part_start else shrunk)
+                        if cut == part_start + 1:
+                            break
+                    emit(start + part_start, start + cut, page, ov_start)
+                pos = cut
+
+        for page, raw in self.pages:
+            cleaned = clean_text(raw)
+            if not cleaned:
+                continue
+            last = self._parts[-1][-1] if self._parts else ""
+            base = self._append(cleaned)
+            if pending is not None and last in ".!?":
+                add(pending[0], base - 1, pending[1])  # the sentence ended with the previous page
+                pending = None
+            if pending is None:
+                pending = (base, page)
+            for m in _SENTENCE_END.finditer(cleaned):
+                add(pending[0], base + m.start() + 1, pending[1])
+                pending = (base + m.end(), page)
+                if ready:
+                    yield from ready
+                    ready.clear()
+
+            # text without sentence breaks would otherwise pile up in the pending sentence
+            if self._end - pending[0] > size and self._measure(pending[0], self._end) > size:
+                add(pending[0], self._end, pending[1])
+                pending = None
+            # what the next pages can still reach back to: the open chunk (and its overlap),
+            # the sentence in progress and the overlap of the last emitted chunk
+            needed = [self._end]
+            if chunk is not None:
+                needed.append(chunk[0] if chunk[5] is None else min(chunk[0], chunk[5]))
+            if pending is not None:
+                needed.append(pending[0])
+            if prev is not None:
+                needed.append(prev[1] - self.overlap)
+            self._needed = min(needed)
+            self._trim()
+            yield from ready
+            ready.clear()
+
+        if pending is not None:
+            add(pending[0], self._end, pending[1])
+        if chunk is not None:
+            emit(chunk[0], chunk[1], chunk[2], chunk[5])
+        yield from ready
+
+
+def iter_chunks(pages: Iterable[Tuple[Optional[int], str]], chunk_size: int = 500, overlap: int = 50,
+                length: Callable[[str], int] = None) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    Streaming chunker over [(page_number, text)], yields (chunk, page_number) as soon as a chunk
+    is complete (see SpanChunker for the sizing rules).
+    """
+    for span in SpanChunker(pages, chunk_size=chunk_size, overlap=overlap, length=length):
+        yield span.text, span.page
+
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50, length: Callable[[str], int] = None) -> List[str]:
+    return [chunk for chunk, _ in iter_chunks([(None, text)], chunk_size=chunk_size, overlap=overlap, length=length)]
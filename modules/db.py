@@ -1,6 +1,9 @@
+from collections import OrderedDict
 from datetime import datetime
 import os
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+from sqlalchemy import create_engine, event, insert, inspect, text, Boolean, Column, Integer, Float, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
@@ -16,10 +19,39 @@ SQLITE_PATH = os.getenv(
     f"sqlite:///{os.path.join(INSTANCE_DIR, 'rag.db')}"
 )
 
-engine = create_engine(
-    SQLITE_PATH,
-    connect_args={"check_same_thread": False} if 'sqlite' in SQLITE_PATH else {}
-)
+IS_SQLITE = SQLITE_PATH.startswith('sqlite')
+
+# rows per executemany batch for bulk chunk inserts
+CHUNK_INSERT_BATCH = int(os.getenv('CHUNK_INSERT_BATCH', '500'))
+# characters of document text kept in memory for slicing offset-stored chunks
+DOC_TEXT_CACHE_CHARS = int(float(os.getenv('DOC_TEXT_CACHE_MB', '64')) * 1024 * 1024)
+_IN_CLAUSE_BATCH = 900
+
+if IS_SQLITE:
+    engine = create_engine(
+        SQLITE_PATH,
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets chat reads proceed while an ingest transaction is writing
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+else:
+    # Postgres & co. via DATABASE_URL
+    engine = create_engine(
+        SQLITE_PATH,
+        pool_size=int(os.getenv('DB_POOL_SIZE', '10')),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        pool_pre_ping=True,
+    )
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -33,9 +65,11 @@ class Document(Base):
     __tablename__ = 'documents'
 
     id = Column(Integer, primary_key=True, index=True)
-    filename = Column(String, nullable=False)
+    filename = Column(String, nullable=False, index=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     text = Column(Text)
+    # sha256 of the uploaded file, re-uploads of the same bytes are skipped before OCR
+    content_hash = Column(String(64), index=True)
 
     # relationship to chunks
     chunks = relationship('Chunk', back_populates='document')
@@ -43,19 +77,210 @@ class Document(Base):
 
 class Chunk(Base):
     __tablename__ = 'chunks'
+    __table_args__ = (
+        Index('ix_chunks_document_chunk', 'document_id', 'chunk_index'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey('documents.id'))
     content = Column(Text)
+    # offsets storage: content is NULL and the chunk is documents.text[start_offset:end_offset]
+    start_offset = Column(Integer)
+    end_offset = Column(Integer)
 
     chunk_index = Column(Integer, nullable=False)
 
     # stored as "metadata" column in DB
     chunk_metadata = Column("metadata", Text)
 
+    # sha256 of the normalized content; a chunk identical (or near identical) to an earlier one
+    # has no vector of its own and points at that chunk instead
+    content_hash = Column(String(64), index=True)
+    duplicate_of = Column(Integer)
+
     # relationship to parent document
     document = relationship('Document', back_populates='chunks')
 
 
+class DocumentSegment(Base):
+    __tablename__ = 'document_segments'
+
+    # offsets storage: the cleaned text of a document still being ingested, appended batch by batch
+    # (in id order) and folded into documents.text in one write once the document is complete
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey('documents.id'), index=True)
+    text = Column(Text, nullable=False)
+
+
+def segment_texts(db, document_ids: Iterable[int]) -> Dict[int, str]:
+    """Text so far of documents whose offset-stored text is still in segments."""
+    document_ids = sorted(set(document_ids))
+    pieces: Dict[int, List[str]] = {}
+    for start in range(0, len(document_ids), _IN_CLAUSE_BATCH):
+        rows = (db.query(DocumentSegment.document_id, DocumentSegment.text)
+                .filter(DocumentSegment.document_id.in_(document_ids[start:start + _IN_CLAUSE_BATCH]))
+                .order_by(DocumentSegment.id).all())
+        for row in rows:
+            pieces.setdefault(row.document_id, []).append(row.text)
+    return {doc_id: "".join(parts) for doc_id, parts in pieces.items()}
+
+
+class IngestJob(Base):
+    __tablename__ = 'ingest_jobs'
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, nullable=False)
+    filepath = Column(String, nullable=False)
+    use_gvision = Column(Boolean, default=False)
+
+    # queued -> running -> done | failed
+    status = Column(String, nullable=False, default='queued', index=True)
+    stage = Column(String)
+    progress = Column(Float, default=0.0)
+    message = Column(Text)
+
+    document_id = Column(Integer)
+    num_chunks = Column(Integer)
+    # document this upload replaces, deleted once the new version is in
+    replaces = Column(Integer)
+    # queue instance running the job and its last sign of life; stale running jobs are re-queued
+    owner = Column(String)
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "message": self.message,
+            "document_id": self.document_id,
+            "num_chunks": self.num_chunks,
+            "replaces": self.replaces,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+def bulk_insert_chunks(db, rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Inserts chunk rows (dicts of Chunk column attributes) with executemany batches
+    inside the caller's transaction. Returns the new ids in row order.
+    """
+    ids: List[int] = []
+    stmt = insert(Chunk).returning(Chunk.id, sort_by_parameter_order=True)
+    for start in range(0, len(rows), CHUNK_INSERT_BATCH):
+        ids.extend(db.scalars(stmt, rows[start:start + CHUNK_INSERT_BATCH]).all())
+    return ids
+
+
+class DocumentTextCache:
+    """
+    LRU of document texts for materializing offset-stored chunks, at most max_chars characters
+    (bigger documents are read but not kept). Keys are (id, uploaded_at): SQLite hands out the id
+    of a deleted last row again, and another process may have cached the old document under it.
+    """
+
+    def __init__(self, max_chars: int = DOC_TEXT_CACHE_CHARS):
+        self.max_chars = max_chars
+        self._texts: "OrderedDict[Tuple[int, Any], str]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, db, keys: Iterable[Tuple[int, Any]]) -> Dict[Tuple[int, Any], str]:
+        keys = set(keys)
+        found: Dict[Tuple[int, Any], str] = {}
+        with self._lock:
+            for key in keys:
+                text = self._texts.get(key)
+                if text is not None:
+                    self._texts.move_to_end(key)
+                    found[key] = text
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        missing = sorted({doc_id for doc_id, _ in keys - found.keys()})
+        ingesting = []
+        for start in range(0, len(missing), _IN_CLAUSE_BATCH):
+            rows = (db.query(Document.id, Document.uploaded_at, Document.text)
+                    .filter(Document.id.in_(missing[start:start + _IN_CLAUSE_BATCH])).all())
+            for row in rows:
+                key = (row.id, row.uploaded_at)
+                if row.text is None:
+                    ingesting.append(key)
+                    continue
+                if key in keys:
+                    found[key] = row.text
+                self._put(key, row.text)
+        if ingesting:
+            # partial text of documents still being ingested, not cached
+            partial = segment_texts(db, [doc_id for doc_id, _ in ingesting])
+            found.update({key: partial.get(key[0], "") for key in ingesting if key in keys})
+        return found
+
+    def _put(self, key: Tuple[int, Any], text: str):
+        if len(text) > self.max_chars:
+            return
+        with self._lock:
+            if key in self._texts:
+                return
+            self._texts[key] = text
+            self._chars += len(text)
+            while self._chars > self.max_chars:
+                _, old = self._texts.popitem(last=False)
+                self._chars -= len(old)
+
+    def discard(self, document_id: int):
+        with self._lock:
+            for key in [k for k in self._texts if k[0] == document_id]:
+                self._chars -= len(self._texts.pop(key))
+
+
+def chunk_text_query(db):
+    """Chunk rows with what chunk_texts needs, filter / order it like any query."""
+    return (db.query(Chunk.id, Chunk.content, Chunk.document_id, Chunk.start_offset, Chunk.end_offset,
+                     Document.uploaded_at)
+            .outerjoin(Document, Chunk.document_id == Document.id))
+
+
+def chunk_texts(db, rows, cache: DocumentTextCache = None) -> List[str]:
+    """Text of each chunk_text_query row; offset-stored chunks are sliced out of their document's text."""
+    keys = {(r.document_id, r.uploaded_at) for r in rows if r.content is None and r.start_offset is not None}
+    docs = (cache or DocumentTextCache(max_chars=0)).get_many(db, keys) if keys else {}
+    texts = []
+    for r in rows:
+        if r.content is not None:
+            texts.append(r.content)
+        elif r.start_offset is not None:
+            texts.append(docs.get((r.document_id, r.uploaded_at), "")[r.start_offset:r.end_offset])
+        else:
+            texts.append("")
+    return texts
+
+
+def _add_missing_columns():
+    # create_all never alters existing tables, so add columns introduced later (all nullable)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+
 def init_db():
+    _add_missing_columns()
     Base.metadata.create_all(bind=engine)
+    # create_all skips existing tables, so add indexes introduced after the table was created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
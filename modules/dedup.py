@@ -0,0 +1,24 @@
+import hashlib
+from typing import BinaryIO, Union
+
+from .embedding_cache import normalize_text
+
+_READ_SIZE = 1024 * 1024
+
+
+def file_sha256(source: Union[str, BinaryIO]) -> str:
+    """sha256 of a file's bytes, from a path or an open binary file object."""
+    h = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_READ_SIZE), b""):
+                h.update(block)
+    else:
+        for block in iter(lambda: source.read(_READ_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    # same whitespace normalization as the embedding cache, so both agree on what "identical" means
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
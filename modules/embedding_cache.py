@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    # whitespace differences should not produce a different cache entry
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache.
+    Hot keys live in an in-process LRU, everything else in a size-bounded SQLite file.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = 200_000, lru_size: int = 4096):
+        self.path = path
+        self.max_entries = max_entries
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        self._count = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def reopen(self):
+        """
+        Call in a forked child: SQLite connections must not cross fork(), so the child gets its own.
+        The inherited one is dropped without close(), closing it could checkpoint / remove the
+        parent's WAL under it.
+        """
+        self._lock = threading.Lock()  # may have been held by another thread at fork time
+        if self.path:
+            self._conn = None
+            self._connect()
+
+    @staticmethod
+    def make_key(provider: str, model_name: str, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{provider}:{model_name}:{digest}"
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        pending: List[str] = []
+        with self._lock:
+            for k in keys:
+                if k in found:
+                    continue
+                vec = self._lru.get(k)
+                if vec is not None:
+                    self._lru.move_to_end(k)
+                    found[k] = vec
+                    self.hits += 1
+                else:
+                    pending.append(k)
+
+            if pending and self._conn is not None:
+                now = time.time()
+                # sqlite caps the number of bound parameters, so query in slices
+                for start in range(0, len(pending), 500):
+                    part = pending[start:start + 500]
+                    marks = ",".join("?" * len(part))
+                    rows = self._conn.execute(
+                        f"SELECT key, dim, vec FROM embeddings WHERE key IN ({marks})", part
+                    ).fetchall()
+                    for key, dim, blob in rows:
+                        vec = np.frombuffer(blob, dtype="float32").reshape(dim)
+                        found[key] = vec
+                        self._remember(key, vec)
+                    if rows:
+                        self._conn.executemany(
+                            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                            [(now, r[0]) for r in rows],
+                        )
+                self._conn.commit()
+                self.disk_hits += sum(1 for k in pending if k in found)
+
+            self.misses += sum(1 for k in pending if k not in found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        with self._lock:
+            for k, v in items.items():
+                self._remember(k, np.asarray(v, dtype="float32"))
+            if self._conn is None:
+                return
+            now = time.time()
+            rows = [
+                (k, int(v.shape[-1]), np.asarray(v, dtype="float32").tobytes(), now)
+                for k, v in items.items()
+            ]
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, vec, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _evict(self):
+        # drop the least recently used tenth so eviction doesn't run on every put
+        target = int(self.max_entries * 0.9)
+        excess = self._count - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+        self._count = target
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self._count,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+            self._count = 0
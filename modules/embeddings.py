@@ -1,80 +1,239 @@
 import os
-from typing import List
+import re
+from typing import Any, Callable, Dict, List, Tuple
 
+import numpy as np
 
-try:
-    from ollama import Ollama
-    _OLLAMA_AVAILABLE = True
-except ImportError:
-    Ollama = None
-    _OLLAMA_AVAILABLE = False
+from .embedding_cache import EmbeddingCache
+from .lazy import optional_import
 
 
-try:
-    import openai
-    _OPENAI_AVAILABLE = True
-except Exception:
-    openai = None
-    _OPENAI_AVAILABLE = False
+# backends are imported the first time an embedding is requested (sentence_transformers
+# pulls in torch, seconds of startup); None = not checked yet
+_OLLAMA_AVAILABLE = None
+_OPENAI_AVAILABLE = None
+_ST_AVAILABLE = None
 
 
-try:
-    from sentence_transformers import SentenceTransformer
-    _ST_AVAILABLE = True
-except Exception:
-    SentenceTransformer = None
-    _ST_AVAILABLE = False
+def _ollama_available() -> bool:
+    global _OLLAMA_AVAILABLE
+    if _OLLAMA_AVAILABLE is None:
+        _OLLAMA_AVAILABLE = optional_import("ollama", "Ollama") is not None
+    return _OLLAMA_AVAILABLE
+
+
+def _openai_available() -> bool:
+    global _OPENAI_AVAILABLE
+    if _OPENAI_AVAILABLE is None:
+        _OPENAI_AVAILABLE = optional_import("openai") is not None
+    return _OPENAI_AVAILABLE
+
+
+def _st_available() -> bool:
+    global _ST_AVAILABLE
+    if _ST_AVAILABLE is None:
+        _ST_AVAILABLE = optional_import("sentence_transformers", "SentenceTransformer") is not None
+    return _ST_AVAILABLE
 
 
 _st_model = None
 _ollama_client = None
 
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# embedding cache (set EMBED_CACHE=0 to disable)
+_BASE_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE", "1") != "0"
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(_BASE_DIR, "vectorstore", "embed_cache.sqlite"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+EMBED_CACHE_LRU_SIZE = int(os.getenv("EMBED_CACHE_LRU_SIZE", "4096"))
+
+_DEFAULT_MODELS = {
+    "sentence_transformers": "all-MiniLM-L6-v2",
+    "openai": "text-embedding-3-small",
+    "ollama": "llama2",
+}
+
+# longest input each backend embeds (sentence_transformers reads it off the model), in tokens
+_MAX_TOKENS = {
+    "sentence_transformers": 256,
+    "openai": 8191,
+    "ollama": 2048,
+}
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+_cache = None
+
 # initializing models
-def _init_st_model(model_name: str = "all-MiniLM-L6-v2") -> SentenceTransformer: # type: ignore
+def _init_st_model(model_name: str = "all-MiniLM-L6-v2"):
     global _st_model
-    if _ST_AVAILABLE and _st_model is None:
-        _st_model = SentenceTransformer(model_name)
+    if _st_model is None and _st_available():
+        _st_model = optional_import("sentence_transformers", "SentenceTransformer")(model_name)
     return _st_model
 
-def _init_ollama(model_name: str = "llama2") -> Ollama: # type: ignore
+def _init_ollama(model_name: str = "llama2"):
     global _ollama_client
-    if _OLLAMA_AVAILABLE and _ollama_client is None:
-        _ollama_client = Ollama(model=model_name)
+    if _ollama_client is None and _ollama_available():
+        _ollama_client = optional_import("ollama", "Ollama")(model=model_name)
     return _ollama_client
 
-# embedding
-def get_embedding(text: str, provider: str = "sentence_transformers", model_name: str = None) -> List[float]:
-
-    # SentenceTransformers
-    if provider in ["auto", "sentence_transformers", None]:
-        if _ST_AVAILABLE:
-            model = _init_st_model(model_name or "all-MiniLM-L6-v2")
-            return model.encode([text])[0].tolist()
-    
-    # OpenAI
-    api_key = os.getenv("OPENAI_API_KEY")
-    if provider in ["auto", "openai"] and api_key and _OPENAI_AVAILABLE:
-        openai.api_key = api_key
-        resp = openai.Embedding.create(model="text-embedding-3-small", input=text)
-        return resp['data'][0]['embedding']
-
-    # Ollama fallback (LLM embeddings if supported)
-    if provider in ["auto", "ollama"] and _OLLAMA_AVAILABLE:
-        try:
-            client = _init_ollama()
-            resp = client.embeddings(text)
-            return resp["embedding"]
-        except Exception:
-            pass
+def get_cache() -> EmbeddingCache:
+    global _cache
+    if EMBED_CACHE_ENABLED and _cache is None:
+        _cache = EmbeddingCache(EMBED_CACHE_PATH, max_entries=EMBED_CACHE_MAX_ENTRIES,
+                                lru_size=EMBED_CACHE_LRU_SIZE)
+    return _cache
+
+def reopen_cache():
+    # after fork: a cache opened in the parent (e.g. by warm_up) needs its own sqlite connection
+    if _cache is not None:
+        _cache.reopen()
 
+# embedding
+def _resolve_provider(provider: str = "sentence_transformers") -> str:
+    # picks the concrete backend that would serve this provider request
+    if provider in ["auto", "sentence_transformers", None] and _st_available():
+        return "sentence_transformers"
+    if provider in ["auto", "openai"] and os.getenv("OPENAI_API_KEY") and _openai_available():
+        return "openai"
+    if provider in ["auto", "ollama"] and _ollama_available():
+        return "ollama"
     raise RuntimeError(
         "No embedding provider available. "
         "Install SentenceTransformers or set OPENAI_API_KEY."
     )
 
-def embed_texts(texts: List[str], provider: str = "sentence_transformers", model_name: str = None) -> List[List[float]]:
+
+def _encode_st(texts: List[str], model_name: str, batch_size: int) -> np.ndarray:
+    model = _init_st_model(model_name or "all-MiniLM-L6-v2")
+    # sorting by length keeps similar sized texts in the same batch -> less padding
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    encoded = model.encode(
+        [texts[i] for i in order],
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    out = np.empty_like(encoded, dtype="float32")
+    out[order] = encoded
+    return out
+
+
+def _encode_openai(texts: List[str], batch_size: int) -> np.ndarray:
+    openai = optional_import("openai")
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    rows: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        resp = openai.Embedding.create(model="text-embedding-3-small", input=batch)
+        # the API may return items out of order, "index" maps them back
+        data = sorted(resp['data'], key=lambda d: d['index'])
+        rows.extend(d['embedding'] for d in data)
+    return np.asarray(rows, dtype="float32")
+
+
+def _encode_ollama(texts: List[str]) -> np.ndarray:
+    # no batch endpoint on the client, one request per text
+    client = _init_ollama()
+    return np.asarray([client.embeddings(t)["embedding"] for t in texts], dtype="float32")
+
+
+def _encode(texts: List[str], provider: str, model_name: str, batch_size: int) -> np.ndarray:
+    if provider == "sentence_transformers":
+        return _encode_st(texts, model_name, batch_size)
+    if provider == "openai":
+        return _encode_openai(texts, batch_size)
+    return _encode_ollama(texts)
+
+
+def get_embedding(text: str, provider: str = "sentence_transformers", model_name: str = None,
+                  use_cache: bool = True) -> List[float]:
+    return embed_texts([text], provider=provider, model_name=model_name, use_cache=use_cache)[0].tolist()
+
+
+def embed_texts(texts: List[str], provider: str = "sentence_transformers", model_name: str = None,
+                batch_size: int = None, use_cache: bool = True) -> np.ndarray:
+    """
+    Embeds a list of texts in batches, serving repeated texts from the embedding cache.
+    Returns: contiguous float32 matrix of shape (len(texts), dim)
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype="float32")
+    resolved = _resolve_provider(provider)
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    texts = list(texts)
+
+    cache = get_cache() if use_cache else None
+    if cache is None:
+        return np.ascontiguousarray(_encode(texts, resolved, model_name, batch_size), dtype="float32")
+
+    model_key = model_name or _DEFAULT_MODELS[resolved]
+    keys = [cache.make_key(resolved, model_key, t) for t in texts]
+    found = cache.get_many(dict.fromkeys(keys))
+
+    # encode each missing key once, even if the text repeats within the batch
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in missing:
+            missing[k] = t
+    if missing:
+        encoded = _encode(list(missing.values()), resolved, model_name, batch_size)
+        fresh = dict(zip(missing.keys(), np.asarray(encoded, dtype="float32")))
+        cache.put_many(fresh)
+        found.update(fresh)
+
+    out = np.empty((len(texts), found[keys[0]].shape[-1]), dtype="float32")
+    for i, k in enumerate(keys):
+        out[i] = found[k]
+    return out
+
+
+def warm_up(provider: str = "sentence_transformers", model_name: str = None) -> str:
+    """
+    Imports the backend and loads the model now instead of on the first request. Run it before
+    forking workers and they share the weights copy-on-write. Returns the provider that will serve.
+    """
+    resolved = _resolve_provider(provider)
+    if resolved == "sentence_transformers":
+        _encode_st(["warm up"], model_name, 1)  # first encode also initialises torch's kernels
+    elif resolved == "ollama":
+        _init_ollama()
+    get_cache()
+    return resolved
+
+
+def _approx_tokens(text: str) -> float:
+    # words and punctuation, plus a third for subword pieces. Not rounded: the chunker adds up
+    # the counts of neighbouring pieces, which only matches the count of the whole without rounding
+    return len(_WORD_RE.findall(text)) * 4 / 3
+
+
+def token_counter(provider: str = "sentence_transformers", model_name: str = None) -> Tuple[Callable[[str], float], int]:
+    """
+    (token count of a text, max tokens per input) for the model that would serve this provider,
+    to size chunks so they aren't truncated. Falls back to an estimate when no tokenizer is at hand.
+    """
+    try:
+        resolved = _resolve_provider(provider)
+    except RuntimeError:
+        resolved = provider or "sentence_transformers"
+    max_tokens = _MAX_TOKENS.get(resolved, _MAX_TOKENS["sentence_transformers"])
+    if resolved == "sentence_transformers":
+        model = _init_st_model(model_name or "all-MiniLM-L6-v2")
+        max_tokens = (getattr(model, "max_seq_length", None) or max_tokens) - 2  # [CLS] / [SEP]
+        tokenizer = getattr(model, "tokenizer", None)
+        if tokenizer is not None:
+            return (lambda text: len(tokenizer.encode(text, add_special_tokens=False))), max_tokens
+    return _approx_tokens, max_tokens
+
+
+def chunk_sizing(chunk_tokens: int, provider: str = "sentence_transformers", model_name: str = None) -> Dict[str, Any]:
     """
-    Embeds a list of texts.
-    Returns: List of embedding vectors
+    SpanChunker options for chunks of chunk_tokens tokens of this model (capped at its max input,
+    -1 for the max itself); 0 is {}, the chunker's default character sizing.
     """
-    return [get_embedding(t, provider=provider, model_name=model_name) for t in texts]
+    if not chunk_tokens:
+        return {}
+    count, max_tokens = token_counter(provider=provider, model_name=model_name)
+    size = max_tokens if chunk_tokens < 0 else min(chunk_tokens, max_tokens)
+    return {"chunk_size": size, "length": count}
@@ -0,0 +1,152 @@
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# compressed vector codes: float16 (2x smaller), 8-bit scalar (4x), product quantization (~16x+)
+QUANTIZATIONS = ("none", "fp16", "sq8", "pq")
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def _nlist_for(n: int) -> int:
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_m_for(dim: int) -> int:
+    # largest sub-quantizer count that divides dim with >= 4 dims per sub-vector
+    for m in range(dim // 4, 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _pq_nbits_for(ntrain: int) -> int:
+    # 8 bits per code needs ~39 * 256 training points, use fewer centroids on small stores
+    return max(1, min(8, int(math.log2(max(ntrain // 39, 2)))))
+
+
+def build_index(index_type: str, dim: int, ntrain: int = 0, hnsw_m: int = 32,
+                quantization: str = "none") -> faiss.Index:
+    """
+    Creates an empty index of the requested type, storing quantization codes instead of
+    float32 vectors unless quantization is "none" (ivf_pq is always PQ).
+    IVF variants are sized for ~ntrain vectors; IVF, sq8 and pq still need train().
+    """
+    quantization = quantization or "none"
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+    if index_type == "flat":
+        if quantization in _SQ_TYPES:
+            return faiss.IndexScalarQuantizer(dim, _SQ_TYPES[quantization])
+        if quantization == "pq":
+            return faiss.IndexPQ(dim, _pq_m_for(dim), _pq_nbits_for(ntrain))
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        if quantization in _SQ_TYPES:
+            return faiss.IndexHNSWSQ(dim, _SQ_TYPES[quantization], hnsw_m)
+        if quantization == "pq":
+            return faiss.IndexHNSWPQ(dim, _pq_m_for(dim), hnsw_m, _pq_nbits_for(ntrain))
+        return faiss.IndexHNSWFlat(dim, hnsw_m)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = _nlist_for(ntrain)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat" and quantization in _SQ_TYPES:
+            return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[quantization])
+        if index_type == "ivf_flat" and quantization == "none":
+            return faiss.IndexIVFFlat(quantizer, dim, nlist)
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m_for(dim), _pq_nbits_for(ntrain))
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def quantization_of(index: faiss.Index) -> str:
+    """The QUANTIZATIONS entry an index stores its vectors with ("none" = exact float32)."""
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "none"
+
+
+def train(index: faiss.Index, vectors: np.ndarray, max_train: int = 256 * 1024):
+    if index.is_trained:
+        return
+    if len(vectors) > max_train:
+        rng = np.random.default_rng(0)
+        vectors = vectors[rng.choice(len(vectors), max_train, replace=False)]
+    index.train(vectors)
+
+
+def reconstruct_all(index: faiss.Index, start: int = 0, n: int = None) -> np.ndarray:
+    """Copies stored vectors back out (exact for flat/HNSW/IVF-Flat, approximate for PQ)."""
+    n = index.ntotal - start if n is None else n
+    if n <= 0:
+        return np.zeros((0, index.d), dtype="float32")
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(start, n)
+
+
+def owned_copy(index: faiss.Index) -> faiss.Index:
+    # clone_index keeps pointing at mmapped storage, a serialize round trip gives a writable copy
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def empty_like(index: faiss.Index) -> faiss.Index:
+    """An empty, writable index with the same type and trained parameters (quantizer, codebooks)."""
+    if index_type_of(index) == "flat" and quantization_of(index) == "none":
+        return faiss.IndexFlatL2(index.d)
+    empty = owned_copy(index)
+    empty.reset()
+    return empty
+
+
+def reconstruct_ids(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """Vectors at the given positions (approximate for PQ)."""
+    ids = np.asarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.type == faiss.DirectMap.NoMap:
+        index.make_direct_map()
+    return index.reconstruct_batch(ids)
+
+
+def selector_for(mask: np.ndarray):
+    """
+    IDSelector for a boolean mask over positions [0, len(mask)), or None when everything is kept.
+    Returns (selector, buffer); the bitmap selector only points at buffer, keep it alive while searching.
+    """
+    hits = np.flatnonzero(mask)
+    if len(hits) == len(mask):
+        return None, None
+    if len(hits) and hits[-1] - hits[0] + 1 == len(hits):
+        # one contiguous run (e.g. a single document), a range check is cheaper than a bitmap
+        return faiss.IDSelectorRange(int(hits[0]), int(hits[-1]) + 1), None
+    bitmap = np.packbits(mask, bitorder="little")
+    return faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)), bitmap
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None, selector=None) -> Optional[faiss.SearchParameters]:
+    # per-query knobs, None means "use the index default"
+    if isinstance(index, faiss.IndexIVF) and (nprobe or selector is not None):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe or index.nprobe), sel=selector)
+    if isinstance(index, faiss.IndexHNSW) and (ef_search or selector is not None):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search or index.hnsw.efSearch), sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
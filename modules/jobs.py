@@ -0,0 +1,229 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, update
+
+from .db import SessionLocal, IngestJob
+from .ocr import file_to_pages
+
+logger = logging.getLogger(__name__)
+
+
+def extract_pages(path: str, use_gvision: bool = False) -> List[Tuple[int, str]]:
+    # runs inside the OCR pool: PDFs stay single-process here, the pool is the parallelism
+    return file_to_pages(path, use_gvision=use_gvision, processes=1)
+
+
+class JobQueue:
+    """
+    Background ingestion backed by the ingest_jobs table.
+
+    `workers` threads each claim one queued job at a time (so at most `workers` ingests
+    run at once); the CPU-bound OCR step runs in a separate process pool so it
+    doesn't hold the GIL the web threads need. Running jobs carry their queue's owner id
+    and a heartbeat refreshed every heartbeat_interval; a job whose heartbeat is older than
+    stale_after (its process died) is re-queued, one another live queue is running is left alone.
+
+    pipeline_factory, used instead of pipeline, builds the pipeline when the first job runs,
+    so a queue can exist (and take uploads) before the pipeline is loaded.
+    """
+
+    def __init__(self, pipeline=None, workers: int = 2, ocr_processes: int = None,
+                 session_factory: Callable = SessionLocal, poll_interval: float = 2.0,
+                 extract: Callable[[str, bool], List[Tuple[int, str]]] = extract_pages,
+                 pipeline_factory: Callable[[], Any] = None, stale_after: float = 120.0,
+                 heartbeat_interval: float = None):
+        if pipeline is None and pipeline_factory is None:
+            raise ValueError("JobQueue needs a pipeline or a pipeline_factory")
+        self._pipeline = pipeline
+        self._pipeline_factory = pipeline_factory
+        self.extract = extract
+        self.workers = max(1, workers)
+        self.ocr_processes = ocr_processes or max(1, (os.cpu_count() or 2) - 1)
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval or stale_after / 6
+        # unique per queue instance, a recycled worker with the same pid is still someone else
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._ocr_pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            self._pipeline = self._pipeline_factory()
+        return self._pipeline
+
+    def start(self):
+        if self._threads:
+            return
+        self.requeue_stale()
+
+        self._ocr_pool = ProcessPoolExecutor(max_workers=self.ocr_processes)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat_loop, name="ingest-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def requeue_stale(self) -> int:
+        """Puts running jobs whose owner stopped heartbeating back in the queue; returns how many."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        db = self.session_factory()
+        try:
+            n = db.execute(
+                update(IngestJob)
+                .where(IngestJob.status == 'running',
+                       or_(IngestJob.heartbeat_at.is_(None), IngestJob.heartbeat_at < cutoff))
+                .values(status='queued', stage=None, progress=0.0, owner=None, heartbeat_at=None,
+                        message='Re-queued, its worker stopped')
+            ).rowcount
+            db.commit()
+            return n
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self.heartbeat_interval):
+            try:
+                self._update_owned(heartbeat_at=datetime.utcnow())
+                if self.requeue_stale():
+                    self._wakeup.set()
+            except Exception:
+                logger.exception("ingest heartbeat failed")
+
+    def _update_owned(self, **values):
+        db = self.session_factory()
+        try:
+            db.execute(update(IngestJob)
+                       .where(IngestJob.owner == self.owner, IngestJob.status == 'running')
+                       .values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+    def shutdown(self, wait: bool = True):
+        self._stopping.set()
+        self._wakeup.set()
+        if wait:
+            for t in self._threads:
+                t.join()
+        if self._ocr_pool is not None:
+            self._ocr_pool.shutdown(wait=wait)
+        self._threads = []
+
+    def enqueue(self, filepath: str, filename: str, use_gvision: bool = False, replaces: int = None) -> int:
+        db = self.session_factory()
+        try:
+            job = IngestJob(filename=filename, filepath=filepath, use_gvision=use_gvision, status='queued',
+                            replaces=replaces)
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        finally:
+            db.close()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            job = db.get(IngestJob, job_id)
+            return job.to_dict() if job else None
+        finally:
+            db.close()
+
+    # workers
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            while True:
+                job = (db.query(IngestJob)
+                       .filter(IngestJob.status == 'queued')
+                       .order_by(IngestJob.id)
+                       .first())
+                if job is None:
+                    return None
+                claimed_job = {"id": job.id, "filepath": job.filepath, "filename": job.filename,
+                               "use_gvision": bool(job.use_gvision), "replaces": job.replaces}
+                # conditional update so two workers (or processes) never take the same job
+                claimed = db.execute(
+                    update(IngestJob)
+                    .where(IngestJob.id == job.id, IngestJob.status == 'queued')
+                    .values(status='running', stage='queued', progress=0.0, owner=self.owner,
+                            heartbeat_at=datetime.utcnow())
+                ).rowcount
+                db.commit()
+                if claimed:
+                    return claimed_job
+        finally:
+            db.close()
+
+    def _update(self, job_id: int, **values):
+        db = self.session_factory()
+        try:
+            db.execute(update(IngestJob).where(IngestJob.id == job_id).values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        def progress(stage: str, fraction: float):
+            self._update(job["id"], stage=stage, progress=round(fraction, 3))
+
+        try:
+            # same bytes already ingested: no OCR, point the job at the existing document
+            content_hash, duplicate = self.pipeline.find_duplicate_file(job["filepath"])
+            if duplicate:
+                message = f"Document already ingested (document {duplicate['document_id']}), skipped."
+                message += self._replace(job, duplicate["document_id"])
+                self._update(
+                    job["id"], status='done', stage='done', progress=1.0,
+                    document_id=duplicate["document_id"], num_chunks=duplicate["num_chunks"],
+                    message=message,
+                )
+                return
+
+            progress('ocr', 0.0)
+            pages = self._ocr_pool.submit(self.extract, job["filepath"], job["use_gvision"]).result()
+            info = self.pipeline.ingest_pages(pages, filename=job["filename"], progress=progress,
+                                              content_hash=content_hash)
+            message = f"Document ingested successfully. {info['num_chunks']} chunks stored."
+            message += self._replace(job, info["document_id"])
+            self._update(
+                job["id"], status='done', stage='done', progress=1.0,
+                document_id=info["document_id"], num_chunks=info["num_chunks"],
+                message=message,
+            )
+        except Exception as e:
+            logger.exception("ingest job %s (%s) failed", job["id"], job["filename"])
+            self._update(job["id"], status='failed', message=f"Failed to ingest document: {e}")
+
+    def _replace(self, job: Dict[str, Any], document_id: int) -> str:
+        # the old version goes only after the new one is stored
+        old = job.get("replaces")
+        if not old or old == document_id:
+            return ""
+        self.pipeline.delete_document(old)
+        return f" Replaced document {old}."
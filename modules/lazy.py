@@ -0,0 +1,34 @@
+"""
+Deferred imports of optional / heavy backends (torch via sentence_transformers, cv2, openai, ...).
+
+    cv2 = optional_import("cv2")                 # module or None, imported on first call
+    Ollama = optional_import("ollama", "Ollama")  # attribute of a module, or None
+
+Results are cached, failures included, so a missing backend costs one failed import per process.
+"""
+import importlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+_MISSING = object()
+_cache: Dict[Tuple[str, Optional[str]], Any] = {}
+_lock = threading.Lock()
+
+
+def optional_import(name: str, attr: str = None) -> Any:
+    key = (name, attr)
+    value = _cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    with _lock:
+        value = _cache.get(key, _MISSING)
+        if value is _MISSING:
+            try:
+                value = importlib.import_module(name)
+                if attr is not None:
+                    value = getattr(value, attr)
+            except Exception:
+                # ImportError, but also backends that blow up while initialising (CUDA, bad wheels)
+                value = None
+            _cache[key] = value
+    return value
@@ -0,0 +1,121 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# words, plus identifiers like INV-2023-001 / 4.2.1 / a/b kept whole
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_SPLIT_RE = re.compile(r"[-./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound identifiers are indexed whole and as their parts."""
+    tokens = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        tokens.append(tok)
+        if _SPLIT_RE.search(tok):
+            tokens.extend(p for p in _SPLIT_RE.split(tok) if p)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over chunk ids.
+    add() is idempotent per id, so rows seen twice (initial load + incremental add) count once.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_len: Dict[int, int] = {}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, doc_id: int, text: str):
+        self.add_many([(doc_id, text)])
+
+    def add_many(self, docs: Iterable[Tuple[int, str]]):
+        with self._lock:
+            for doc_id, text in docs:
+                if doc_id in self._doc_len:
+                    continue
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                length = sum(counts.values())
+                self._doc_len[doc_id] = length
+                self._doc_terms[doc_id] = tuple(counts)
+                self._total_len += length
+
+    def remove(self, doc_ids: Iterable[int]):
+        with self._lock:
+            for doc_id in doc_ids:
+                if doc_id not in self._doc_len:
+                    continue
+                for term in self._doc_terms.pop(doc_id):
+                    posting = self._postings.get(term)
+                    if posting is not None:
+                        posting.pop(doc_id, None)
+                        if not posting:
+                            del self._postings[term]
+                self._total_len -= self._doc_len.pop(doc_id)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """[(doc_id, score)] best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._doc_len)
+            if not n or not terms:
+                return []
+            avgdl = self._total_len / n or 1.0
+            scores: Dict[int, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+
+
+def load_chunks(index: BM25Index, session_factory: Callable, batch_size: int = 1000, doc_texts=None):
+    """
+    Indexes every chunk that owns a vector (duplicates would only repeat their original).
+    Offset-stored chunks are sliced out of their documents, through the doc_texts cache if given.
+    """
+    from .db import Chunk, chunk_text_query, chunk_texts
+
+    db = session_factory()
+    lookup = session_factory()  # document texts, while `db` is still streaming chunk rows
+    try:
+        rows = (chunk_text_query(db)
+                .filter(Chunk.duplicate_of.is_(None))
+                .yield_per(batch_size))
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                index.add_many(zip((r.id for r in batch), chunk_texts(lookup, batch, doc_texts)))
+                batch = []
+        index.add_many(zip((r.id for r in batch), chunk_texts(lookup, batch, doc_texts)))
+    finally:
+        lookup.close()
+        db.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List], top_k: int, k: int = 60) -> List:
+    """Merges ranked key lists by sum(1 / (k + rank)); keys are any hashable."""
+    scores: Dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return [key for key, _ in heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])]
@@ -0,0 +1,278 @@
+import json
+import os
+import pickle
+import uuid
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+# metadata keys stored as int32 columns / interned-string columns, everything else goes to extras
+INT_COLUMNS = ("chunk_index", "document_id", "chunk_id", "page", "uploaded_at")
+STRING_COLUMNS = ("source",)
+NULL = np.iinfo(np.int32).min
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool) and NULL < value <= np.iinfo(np.int32).max
+
+
+def to_timestamp(value: Any) -> int:
+    """Unix seconds from a number, datetime or ISO string (naive times are UTC, like Document.uploaded_at)."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    raise ValueError(f"Can't use {value!r} as a date")
+
+
+class _RowView(Sequence):
+    # read-only list-like view so callers can keep using vs.ids[i] / vs.metadatas[i]
+    def __init__(self, getter, length):
+        self._get = getter
+        self._len = length
+
+    def __len__(self) -> int:
+        return self._len()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._get(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._get(i)
+
+    def __iter__(self) -> Iterator:
+        return (self._get(i) for i in range(len(self)))
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+
+class MetaStore:
+    """
+    Columnar metadata for the vector store, one row per FAISS position.
+
+    ids are kept as 16-byte UUIDs, known keys as int32 columns (strings interned),
+    and anything that doesn't fit goes to a small sparse `extras` dict.
+    A loaded store memory-maps its base columns; appended rows live in compact arrays.
+    """
+
+    def __init__(self):
+        self._base_uuids = np.zeros((0, 16), dtype=np.uint8)
+        self._base_cols: Dict[str, np.ndarray] = {c: np.zeros(0, dtype=np.int32) for c in INT_COLUMNS + STRING_COLUMNS}
+        self._tail_uuids = bytearray()
+        self._tail_cols: Dict[str, array] = {c: array("i") for c in INT_COLUMNS + STRING_COLUMNS}
+        self.strings: List[str] = []
+        self._string_codes: Dict[str, int] = {}
+        self._extras: Dict[int, Dict[str, Any]] = None
+        self._extras_path: str = None
+
+    # loading / saving
+    @classmethod
+    def load(cls, path: str) -> "MetaStore":
+        store = cls()
+        store._base_uuids = np.load(os.path.join(path, "uuids.npy"), mmap_mode="r")
+        n = len(store._base_uuids)
+        for c in INT_COLUMNS + STRING_COLUMNS:
+            col_file = os.path.join(path, f"{c}.npy")
+            if os.path.exists(col_file):
+                store._base_cols[c] = np.load(col_file, mmap_mode="r")
+            else:
+                # column added after this checkpoint was written
+                store._base_cols[c] = np.full(n, NULL, dtype=np.int32)
+        with open(os.path.join(path, "strings.json"), encoding="utf-8") as f:
+            store.strings = json.load(f)
+        store._string_codes = {s: i for i, s in enumerate(store.strings)}
+        # extras are only unpickled when somebody needs them
+        store._extras_path = os.path.join(path, "extras.pkl")
+        return store
+
+    @classmethod
+    def from_rows(cls, ids: List[str], metadatas: List[Dict[str, Any]]) -> "MetaStore":
+        # used to migrate the legacy meta.pkl lists
+        store = cls()
+        store.append(ids, metadatas)
+        return store
+
+    @property
+    def extras(self) -> Dict[int, Dict[str, Any]]:
+        if self._extras is None:
+            self._extras = {}
+            if self._extras_path and os.path.exists(self._extras_path):
+                with open(self._extras_path, "rb") as f:
+                    self._extras = pickle.load(f)
+        return self._extras
+
+    def snapshot(self, keep: np.ndarray = None) -> Dict[str, Any]:
+        """
+        Copies everything needed by write(), so the copy can be written without holding locks.
+        keep (bool per row) drops the other rows, renumbering positions.
+        """
+        arrays = {"uuids": self.column_uuids()}
+        for c in INT_COLUMNS + STRING_COLUMNS:
+            arrays[c] = self.column(c)
+        extras = dict(self.extras)
+        if keep is not None:
+            arrays = {name: arr[keep] for name, arr in arrays.items()}
+            new_pos = np.cumsum(keep) - 1
+            extras = {int(new_pos[pos]): e for pos, e in extras.items() if keep[pos]}
+        return {"arrays": arrays, "strings": list(self.strings), "extras": extras}
+
+    @staticmethod
+    def write(path: str, snapshot: Dict[str, Any]):
+        os.makedirs(path, exist_ok=True)
+        for name, arr in snapshot["arrays"].items():
+            np.save(os.path.join(path, f"{name}.npy"), arr)
+        with open(os.path.join(path, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump(snapshot["strings"], f)
+        with open(os.path.join(path, "extras.pkl"), "wb") as f:
+            pickle.dump(snapshot["extras"], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # writing
+    def _intern(self, s: str) -> int:
+        code = self._string_codes.get(s)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(s)
+            self._string_codes[s] = code
+        return code
+
+    def append(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        extras = self.extras
+        for id_, meta in zip(ids, metadatas):
+            pos = len(self)
+            extra: Dict[str, Any] = {}
+
+            raw = None
+            try:
+                parsed = uuid.UUID(str(id_))
+                if str(parsed) == id_:
+                    raw = parsed.bytes
+            except ValueError:
+                pass
+            if raw is None:
+                extra["__id__"] = id_
+                raw = bytes(16)
+            self._tail_uuids += raw
+
+            meta = dict(meta or {})
+            for c in STRING_COLUMNS:
+                v = meta.pop(c, None)
+                if isinstance(v, str):
+                    self._tail_cols[c].append(self._intern(v))
+                else:
+                    self._tail_cols[c].append(NULL)
+                    if v is not None:
+                        extra[c] = v
+            for c in INT_COLUMNS:
+                v = meta.pop(c, None)
+                if _is_int(v):
+                    self._tail_cols[c].append(int(v))
+                else:
+                    self._tail_cols[c].append(NULL)
+                    if v is not None:
+                        extra[c] = v
+            # remaining keys keep their insertion order after the column keys
+            extra.update(meta)
+            if extra:
+                extras[pos] = extra
+
+    # reading
+    def __len__(self) -> int:
+        return len(self._base_uuids) + len(self._tail_uuids) // 16
+
+    def get_id(self, pos: int) -> str:
+        extra = self.extras.get(pos)
+        if extra and "__id__" in extra:
+            return extra["__id__"]
+        nb = len(self._base_uuids)
+        raw = bytes(self._base_uuids[pos]) if pos < nb else bytes(self._tail_uuids[(pos - nb) * 16:(pos - nb + 1) * 16])
+        return str(uuid.UUID(bytes=raw))
+
+    def _value(self, c: str, pos: int) -> int:
+        nb = len(self._base_uuids)
+        return int(self._base_cols[c][pos]) if pos < nb else self._tail_cols[c][pos - nb]
+
+    def get_meta(self, pos: int) -> Dict[str, Any]:
+        meta: Dict[str, Any] = {}
+        extra = self.extras.get(pos, {})
+        for c in STRING_COLUMNS:
+            code = self._value(c, pos)
+            if code != NULL:
+                meta[c] = self.strings[code]
+            elif c in extra:
+                meta[c] = extra[c]
+        for c in INT_COLUMNS:
+            v = self._value(c, pos)
+            if v != NULL:
+                meta[c] = v
+            elif c in extra:
+                meta[c] = extra[c]
+        for k, v in extra.items():
+            if k != "__id__" and k not in meta:
+                meta[k] = v
+        return meta
+
+    def column(self, name: str) -> np.ndarray:
+        """Full int32 column (base + appended rows); string columns hold codes into self.strings."""
+        tail = np.frombuffer(self._tail_cols[name], dtype=np.int32) if len(self._tail_cols[name]) else np.zeros(0, np.int32)
+        return np.concatenate([np.asarray(self._base_cols[name]), tail])
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Boolean row mask for a filter dict, all conditions ANDed:
+            {"source": "a.pdf" | [...], "document_id": 3 | [...], "page": ...}   column lookups
+            {"uploaded_after": ts, "uploaded_before": ts}                         uploaded_at range
+            {"any_other_key": value | [...]}                                      matched against extras
+        A list means "any of". Column filters are vectorized scans over the int32 columns.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        for key, value in filters.items():
+            if value is None:
+                continue
+            if key in ("uploaded_after", "uploaded_before"):
+                col = self.column("uploaded_at")
+                bound = to_timestamp(value)
+                keep &= (col != NULL) & (col >= bound if key == "uploaded_after" else col <= bound)
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            if key in STRING_COLUMNS:
+                codes = [self._string_codes[v] for v in values if v in self._string_codes]
+                keep &= np.isin(self.column(key), np.asarray(codes, dtype=np.int32))
+            elif key in INT_COLUMNS and all(_is_int(v) for v in values):
+                keep &= np.isin(self.column(key), np.asarray(values, dtype=np.int32))
+            else:
+                wanted = set(values)
+                hits = np.zeros(len(self), dtype=bool)
+                for pos, extra in self.extras.items():
+                    try:
+                        hits[pos] = key in extra and extra[key] in wanted
+                    except TypeError:  # unhashable value
+                        pass
+                keep &= hits
+        return keep
+
+    def column_uuids(self) -> np.ndarray:
+        tail = np.frombuffer(bytes(self._tail_uuids), dtype=np.uint8).reshape(-1, 16)
+        return np.concatenate([np.asarray(self._base_uuids), tail])
+
+    def rows(self, start: int = 0):
+        """(ids, metadatas) from position start onwards."""
+        positions = range(start, len(self))
+        return [self.get_id(p) for p in positions], [self.get_meta(p) for p in positions]
+
+    @property
+    def ids(self) -> Sequence[str]:
+        return _RowView(self.get_id, self.__len__)
+
+    @property
+    def metadatas(self) -> Sequence[Dict[str, Any]]:
+        return _RowView(self.get_meta, self.__len__)
@@ -0,0 +1,225 @@
+"""
+Per-stage timings and counters for ingestion and queries.
+
+    with metrics.stage("embed", chunks=len(texts)):
+        ...
+
+Every stage lands in a histogram (insightai_stage_seconds{stage=...}), its counts in counters
+(insightai_chunks_total, ...), in any hooks registered with add_hook, and in the breakdown
+of the surrounding collect() block, if there is one. registry.render() is the Prometheus text
+format served at /metrics.
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+PREFIX = "insightai"
+# seconds; from a warm vector search up to a slow OCR'd page or LLM answer
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "stage_seconds": "Time spent in each pipeline stage.",
+    "http_request_seconds": "Flask request latency by endpoint.",
+    "pages_total": "Pages extracted (text layer or OCR).",
+    "chunks_total": "Chunks produced by the chunker.",
+    "chunks_embedded_total": "Chunk texts sent to the embedding model.",
+    "vectors_added_total": "Vectors added to the vectorstore.",
+    "vectors_searched_total": "Stored vectors covered by vector searches.",
+    "queries_total": "Queries embedded for retrieval.",
+    "llm_tokens_total": "Tokens generated by the LLM (words when the backend doesn't report tokens).",
+    "vectors": "Vectors currently in the vectorstore.",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(name: str, labels: LabelKey, value: float, extra: Tuple[str, str] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    label_str = "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+    return f"{name}{label_str} {value:.17g}"
+
+
+class Registry:
+    """Thread-safe counters, gauges and fixed-bucket histograms, rendered in Prometheus text format."""
+
+    def __init__(self, prefix: str = PREFIX, buckets: Iterable[float] = BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        # per label set: [count per bucket (+Inf last), sum, count]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            h[bisect_left(self.buckets, value)] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def value(self, name: str, **labels) -> Optional[float]:
+        """Current counter / gauge value, or a histogram's observation count."""
+        key = _labels(labels)
+        with self._lock:
+            for store in (self._counters, self._gauges):
+                if key in store.get(name, {}):
+                    return store[name][key]
+            h = self._histograms.get(name, {}).get(key)
+            return h[-1] if h else None
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted(store):
+                    full = f"{self.prefix}_{name}"
+                    lines += [f"# HELP {full} {HELP.get(name, name)}", f"# TYPE {full} {kind}"]
+                    lines += [_format(full, key, v) for key, v in sorted(store[name].items())]
+            for name in sorted(self._histograms):
+                full = f"{self.prefix}_{name}"
+                lines += [f"# HELP {full} {HELP.get(name, name)}", f"# TYPE {full} histogram"]
+                for key, h in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, n in zip(self.buckets + (float("inf"),), h):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(_format(f"{full}_bucket", key, cumulative, ("le", le)))
+                    lines.append(_format(f"{full}_sum", key, h[-2]))
+                    lines.append(_format(f"{full}_count", key, h[-1]))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+registry = Registry()
+
+# hook(stage, seconds, counts), e.g. to forward stages to StatsD or a tracer
+_hooks: List[Callable[[str, float, Dict[str, Any]], None]] = []
+# breakdown dict of the enclosing collect() block, None outside of one
+_breakdown: contextvars.ContextVar = contextvars.ContextVar("metrics_breakdown", default=None)
+_breakdown_lock = threading.Lock()
+
+
+def add_hook(hook: Callable[[str, float, Dict[str, Any]], None]):
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[str, float, Dict[str, Any]], None]):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def record(name: str, seconds: float, **counts):
+    """Records a finished stage: histogram, counters (<count>_total), hooks and the current breakdown."""
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        stages, totals = breakdown["stages"], breakdown["counts"]
+        with _breakdown_lock:  # pool threads share their caller's breakdown
+            stages[name] = round(stages.get(name, 0.0) + seconds * 1000, 3)
+            for key, n in counts.items():
+                totals[key] = totals.get(key, 0) + n
+    if not METRICS_ENABLED:
+        return
+    registry.observe("stage_seconds", seconds, stage=name)
+    for key, n in counts.items():
+        registry.inc(f"{key}_total", n)
+    for hook in list(_hooks):
+        try:
+            hook(name, seconds, counts)
+        except Exception:
+            pass  # a broken hook must not fail an upload or a chat
+
+
+@contextmanager
+def stage(name: str, **counts) -> Iterator[Dict[str, Any]]:
+    """Times the block as stage `name`; counts known only inside the block can be set on the yielded dict."""
+    info = dict(counts)
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record(name, time.perf_counter() - start, **info)
+
+
+@contextmanager
+def collect() -> Iterator[Dict[str, Any]]:
+    """
+    Collects the stages recorded inside the block (in this thread, and in pool threads
+    running bind()-wrapped functions) as {"total_ms", "stages": {name: ms}, "counts": {...}}.
+    """
+    breakdown: Dict[str, Any] = {"total_ms": 0.0, "stages": {}, "counts": {}}
+    token = _breakdown.set(breakdown)
+    start = time.perf_counter()
+    try:
+        yield breakdown
+    finally:
+        breakdown["total_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _breakdown.reset(token)
+
+
+def bind(fn: Callable) -> Callable:
+    """fn recording into the caller's collect() block, for handing work to pool threads."""
+    breakdown = _breakdown.get()
+    if breakdown is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _breakdown.set(breakdown)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _breakdown.reset(token)
+    return run
+
+
+class TimedIter:
+    """Wraps an iterator and adds up the time spent producing its items (e.g. lazily OCR'd pages)."""
+
+    def __init__(self, iterable: Iterable):
+        self._it = iter(iterable)
+        self.seconds = 0.0
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._it)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.count += 1
+        return item
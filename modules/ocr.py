@@ -1,137 +1,339 @@
 import io
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
+from typing import Iterator, List, Tuple, Union
 
-try:
-    import cv2
-except Exception:
-    cv2 = None
+import numpy as np
 
-try:
-    import pytesseract
-    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-except Exception:
-    pytesseract = None
+from .lazy import optional_import
+
+
+# optional backends, imported on first use: none of them is needed to import this module
+def _cv2():
+    return optional_import("cv2")
+
+
+def _pytesseract():
+    pytesseract = optional_import("pytesseract")
+    if pytesseract is not None:
+        pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    return pytesseract
+
+
+def _pil_image():
+    return optional_import("PIL.Image")
 
-try:
-    from PIL import Image
-except Exception:
-    Image = None
 
 # PDF handling
-try:
-    from PyPDF2 import PdfReader
-except Exception:
-    PdfReader = None
+def _pdf_reader():
+    return optional_import("PyPDF2", "PdfReader")
+
+
+# Optional: PyMuPDF, used to rasterize scanned PDF pages
+def _fitz():
+    return optional_import("fitz")
+
 
 # Optional: Google Vision
-try:
-    from google.cloud import vision
-    _GCV_AVAILABLE = True
-except Exception:
-    vision = None
-    _GCV_AVAILABLE = False
+def _vision():
+    return optional_import("google.cloud.vision")
 
 
 #  PDF extraction
-def _extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from a PDF file using PyPDF2."""
+# pages with less extractable text than this (and at least one image) get OCR'd
+MIN_PAGE_CHARS = int(os.getenv("PDF_MIN_PAGE_CHARS", "20"))
+PDF_PROCESSES = int(os.getenv("PDF_PROCESSES", str(os.cpu_count() or 1)))
+# below this many pages a process pool costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+
+
+def _page_has_images(page) -> bool:
+    try:
+        resources = page.get("/Resources") or {}
+        xobjects = resources.get("/XObject") or {}
+        return any(xobjects[name].get_object().get("/Subtype") == "/Image" for name in xobjects)
+    except Exception:
+        return False
+
+
+def _page_text(pdf_path: str, reader, index: int, use_gvision: bool, can_ocr: bool) -> str:
+    page = reader.pages[index]
+    text = page.extract_text() or ""
+    if can_ocr and len(text.strip()) < MIN_PAGE_CHARS and _page_has_images(page):
+        text = _ocr_pdf_page(pdf_path, index, use_gvision)
+    return text
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int, use_gvision: bool = False,
+                        can_ocr: bool = False) -> List[Tuple[int, str]]:
+    # worker: [(page number, text)] for pages [start, stop), scanned pages OCR'd in the same process
+    reader = _pdf_reader()(pdf_path)
+    return [(i + 1, _page_text(pdf_path, reader, i, use_gvision, can_ocr)) for i in range(start, stop)]
+
+
+def _ocr_available(use_gvision: bool = False) -> bool:
+    if use_gvision and os.getenv("GOOGLE_APPLICATION_CREDENTIALS") and _vision() is not None:
+        return True
+    return _pytesseract() is not None
+
+
+def _render_pdf_page(pdf_path: str, page_index: int, dpi: int = 300) -> List[bytes]:
+    # rasterizes with PyMuPDF when installed, otherwise falls back to the page's embedded images
+    fitz = _fitz()
+    if fitz is not None:
+        with fitz.open(pdf_path) as doc:
+            return [doc[page_index].get_pixmap(dpi=dpi).tobytes("png")]
+    page = _pdf_reader()(pdf_path).pages[page_index]
+    return [img.data for img in page.images]
+
+
+def _ocr_pdf_page(pdf_path: str, page_index: int, use_gvision: bool = False) -> str:
+    texts = [_ocr_image_to_text(img, use_gvision=use_gvision) for img in _render_pdf_page(pdf_path, page_index)]
+    return "\n".join(t.strip() for t in texts if t and t.strip())
+
+
+def iter_pdf_pages(pdf_path: str, use_gvision: bool = False, processes: int = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) in page order, 1-based.
+    Page ranges are fanned out over a process pool with only a few ranges in flight,
+    so a huge PDF never has all of its text in memory at once. Image-only pages go through OCR.
+    """
+    PdfReader = _pdf_reader()
     if PdfReader is None:
         raise RuntimeError("PyPDF2 is not installed. Install it to process PDFs.")
 
     reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
+    num_pages = len(reader.pages)
+    processes = processes or PDF_PROCESSES
+    # without an OCR backend scanned pages keep whatever text layer they have
+    can_ocr = _ocr_available(use_gvision)
+    if processes <= 1 or num_pages < PDF_PARALLEL_MIN_PAGES:
+        for i in range(num_pages):
+            yield i + 1, _page_text(pdf_path, reader, i, use_gvision, can_ocr)
+        return
+    del reader
+
+    # a few ranges per process so each worker parses the PDF only a handful of times
+    step = max(1, -(-num_pages // (processes * 4)))
+    ranges = iter([(s, min(s + step, num_pages)) for s in range(0, num_pages, step)])
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = deque(
+            pool.submit(_extract_page_range, pdf_path, s, e, use_gvision, can_ocr)
+            for s, e in islice(ranges, processes * 2)
+        )
+        while pending:
+            part = pending.popleft().result()
+            nxt = next(ranges, None)
+            if nxt is not None:
+                pending.append(pool.submit(_extract_page_range, pdf_path, nxt[0], nxt[1], use_gvision, can_ocr))
+            yield from part
+
+
+def extract_pdf_pages(pdf_path: str, use_gvision: bool = False, processes: int = None) -> List[Tuple[int, str]]:
+    """Extract text per page as [(page_number, text)], 1-based."""
+    return list(iter_pdf_pages(pdf_path, use_gvision=use_gvision, processes=processes))
+
+
+def _extract_text_from_pdf(pdf_path: str) -> str:
+    """Extract text from a PDF file using PyPDF2."""
+    return "\n".join(text for _, text in extract_pdf_pages(pdf_path))
 
 
-#  Image preprocessing 
-def _opencv_preprocess(image_path: str) -> bytes:
-    # Load image, deskew, denoise, and return bytes suitable for OCR.
+#  Image preprocessing
+# none: grayscale only | fast: Otsu + deskew | full: denoise + adaptive threshold + deskew | auto: picked per image
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "auto")
+PREPROCESS_TIERS = ("none", "fast", "full")
+# skew searched within +-OCR_MAX_SKEW degrees
+OCR_MAX_SKEW = float(os.getenv("OCR_MAX_SKEW", "10"))
+# auto tier thresholds: noise sigma, ink/paper contrast, paper brightness spread between regions
+OCR_NOISE_FULL = float(os.getenv("OCR_NOISE_FULL", "6"))
+OCR_CONTRAST_FULL = float(os.getenv("OCR_CONTRAST_FULL", "80"))
+OCR_BACKGROUND_FULL = float(os.getenv("OCR_BACKGROUND_FULL", "50"))
+
+_MIN_OCR_SIDE = 1000  # smaller images are upscaled before OCR
+_ANALYSIS_SIDE = 800  # quality and skew are measured on a copy about this big
+_MIN_SKEW = 0.3  # degrees; less than this isn't worth a rotation
+
+
+def _read_image_bytes(image: Union[str, bytes]) -> bytes:
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    with open(image, "rb") as f:
+        return f.read()
+
+
+def _decode_gray(image: Union[str, bytes]) -> np.ndarray:
+    cv2 = _cv2()
+    if cv2 is not None:
+        if isinstance(image, (bytes, bytearray)):
+            gray = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            gray = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+    else:
+        Image = _pil_image()
+        if Image is None:
+            raise RuntimeError("Neither opencv-python nor Pillow is installed. Install one of them for OCR.")
+        try:
+            source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+            with Image.open(source) as img:
+                gray = np.asarray(img.convert("L"))
+        except OSError:
+            gray = None
+    if gray is None:
+        raise FileNotFoundError(f"Could not read image: {image if isinstance(image, str) else '<bytes>'}")
+    return gray
+
+
+def _otsu(gray: np.ndarray) -> int:
+    # threshold maximizing the between-class variance; ink is <= it
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    m0 = np.cumsum(hist * levels)
+    mean0 = m0 / np.maximum(w0, 1)
+    mean1 = (m0[-1] - m0) / np.maximum(w1, 1)
+    return int(np.argmax(w0 * w1 * (mean0 - mean1) ** 2))
+
+
+def _noise_sigma(gray: np.ndarray) -> float:
+    # Immerkaer's Laplacian noise estimate; the median keeps text edges from counting as noise
+    g = gray.astype(np.float32)
+    lap = (g[:-2, :-2] - 2 * g[:-2, 1:-1] + g[:-2, 2:]
+           - 2 * g[1:-1, :-2] + 4 * g[1:-1, 1:-1] - 2 * g[1:-1, 2:]
+           + g[2:, :-2] - 2 * g[2:, 1:-1] + g[2:, 2:])
+    return float(np.median(np.abs(lap)) / (6 * 0.6745)) if lap.size else 0.0
+
+
+def estimate_skew(ink: np.ndarray, max_angle: float = None) -> float:
+    """
+    Skew in degrees of the text in a boolean ink mask, in cv2.getRotationMatrix2D's convention
+    (rotating by it levels the lines). Picks the angle whose row projection is sharpest.
+    """
+    max_angle = OCR_MAX_SKEW if max_angle is None else max_angle
+    ys, xs = np.nonzero(ink)
+    if len(xs) < 50 or max_angle <= 0:
+        return 0.0
+    xs = xs - ink.shape[1] / 2
+    ys = ys - ink.shape[0] / 2
+
+    def sharpness(angle: float) -> float:
+        t = np.deg2rad(angle)
+        rows = np.round(ys * np.cos(t) - xs * np.sin(t)).astype(np.int64)
+        counts = np.bincount(rows - rows.min())
+        return float(np.dot(counts, counts))
+
+    # coarse 1 degree sweep, then 0.1 degree steps around the best
+    best = max(np.arange(-max_angle, max_angle + 1e-9, 1.0), key=sharpness)
+    best = max(np.arange(best - 1.0, best + 1.0 + 1e-9, 0.1), key=sharpness)
+    return round(float(best), 1)
+
+
+def image_quality(gray: np.ndarray) -> dict:
+    """Cheap measurements on a subsampled copy: noise, contrast, uneven lighting, skew."""
+    step = max(1, max(gray.shape) // _ANALYSIS_SIDE)
+    small = gray[::step, ::step]
+    lo, hi = np.percentile(small, (2, 98))
+    # paper brightness per tile of a 4x4 grid; shadows and gradients need adaptive thresholding
+    h, w = small.shape
+    tiles = [small[i * h // 4:(i + 1) * h // 4, j * w // 4:(j + 1) * w // 4] for i in range(4) for j in range(4)]
+    paper = [np.percentile(t, 90) for t in tiles if t.size]
+    # noise on a full resolution crop, subsampling would average it away
+    ch, cw = min(gray.shape[0], 512), min(gray.shape[1], 512)
+    y0, x0 = (gray.shape[0] - ch) // 2, (gray.shape[1] - cw) // 2
+    return {
+        "noise": round(_noise_sigma(gray[y0:y0 + ch, x0:x0 + cw]), 2),
+        "contrast": float(hi - lo),
+        "background_spread": float(max(paper) - min(paper)) if paper else 0.0,
+        "skew": estimate_skew(small <= _otsu(small)),
+    }
+
+
+def choose_tier(quality: dict) -> str:
+    if (quality["noise"] > OCR_NOISE_FULL or quality["contrast"] < OCR_CONTRAST_FULL
+            or quality["background_spread"] > OCR_BACKGROUND_FULL):
+        return "full"
+    if abs(quality["skew"]) >= _MIN_SKEW:
+        return "fast"
+    return "none"
+
+
+def _opencv_preprocess(image: Union[str, bytes], tier: str = None) -> np.ndarray:
+    # Load image (path or encoded bytes) as grayscale and clean it up for tesseract, as much as the tier asks for.
+    gray = _decode_gray(image)
+    cv2 = _cv2()
     if cv2 is None:
-        with open(image_path, "rb") as f:
-            return f.read()
+        return gray
 
-    img = cv2.imread(image_path)
-    if img is None:
-        raise FileNotFoundError(f"Could not read image: {image_path}")
+    tier = tier or OCR_PREPROCESS
+    quality = None if tier == "none" else image_quality(gray)
+    if tier not in PREPROCESS_TIERS:
+        tier = choose_tier(quality)
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if tier == "full":
+        # denoising before the upscale, on a quarter of the pixels or less
+        gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
 
     # resizing small images
     h, w = gray.shape
-    if max(h, w) < 1000:
-        scale = 1000 / max(h, w)
+    if max(h, w) < _MIN_OCR_SIDE:
+        scale = _MIN_OCR_SIDE / max(h, w)
         gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
 
-    # denoising
-    gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-
-    # adaptive threshold
-    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY, 11, 2)
-
-    # deskew
-    coords = cv2.findNonZero(255 - thresh)
-    if coords is not None:
-        rect = cv2.minAreaRect(coords)
-        angle = rect[-1]
-        if angle < -45:
-            angle = -(90 + angle)
-        else:
-            angle = -angle
-        if abs(angle) > 0.1:
-            (h, w) = thresh.shape
-            M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
-            thresh = cv2.warpAffine(thresh, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    if tier == "none":
+        return gray
+    if tier == "full":
+        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    else:
+        _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
 
-    # encoding to PNG bytes
-    is_success, buffer = cv2.imencode('.png', thresh)
-    if not is_success:
-        raise RuntimeError("Failed to encode preprocessed image")
-    return buffer.tobytes()
+    # deskew with the angle measured on the small copy
+    angle = quality["skew"]
+    if abs(angle) >= _MIN_SKEW:
+        h, w = gray.shape
+        M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+        gray = cv2.warpAffine(gray, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    return gray
 
 
 # OCR (image only)
-def _ocr_image_to_text(image_path: str, use_gvision: bool = False) -> str:
-    # Runs OCR on an image using Google Vision or pytesseract.
+def _ocr_image_to_text(image_path: Union[str, bytes], use_gvision: bool = False) -> str:
+    # Runs OCR on an image (path or encoded bytes) using Google Vision or pytesseract.
 
-    if use_gvision and _GCV_AVAILABLE and os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+    vision = _vision() if use_gvision and os.getenv("GOOGLE_APPLICATION_CREDENTIALS") else None
+    if vision is not None:
         client = vision.ImageAnnotatorClient()
-        with open(image_path, 'rb') as f:
-            content = f.read()
+        content = _read_image_bytes(image_path)
         image = vision.Image(content=content)
         response = client.document_text_detection(image=image)
         if response.error.message:
             raise RuntimeError(f"Google Vision error: {response.error.message}")
         return response.full_text_annotation.text
 
-    # Otherwise pytesseract
-    preprocessed = _opencv_preprocess(image_path)
+    # Otherwise pytesseract, fed the preprocessed array directly
+    pytesseract = _pytesseract()
     if pytesseract is None:
         raise RuntimeError("pytesseract is not installed. Install pytesseract for OCR.")
-
-    try:
-        image = Image.open(io.BytesIO(preprocessed))
-        return pytesseract.image_to_string(image, lang='eng')
-    except Exception:
-        # fallback: writing file and calling tesseract CLI
-        tmp = image_path + ".preproc.png"
-        with open(tmp, 'wb') as f:
-            f.write(preprocessed)
-        text = pytesseract.image_to_string(tmp, lang='eng', config='--psm 6')
-        try:
-            os.remove(tmp)
-        except Exception:
-            pass
-        return text
+    return pytesseract.image_to_string(_opencv_preprocess(image_path), lang='eng')
 
 
-# unified entrypoint
-def file_to_text(file_path: str, use_gvision: bool = False) -> str:
+# unified entrypoints
+def iter_pages(file_path: str, use_gvision: bool = False, processes: int = None) -> Iterator[Tuple[int, str]]:
+    """Yields (page_number, text) for a PDF or image (images are a single page 1)."""
     ext = Path(file_path).suffix.lower()
     if ext == ".pdf":
-        return _extract_text_from_pdf(file_path)
+        yield from iter_pdf_pages(file_path, use_gvision=use_gvision, processes=processes)
     else:
-        return _ocr_image_to_text(file_path, use_gvision=use_gvision)
+        yield 1, _ocr_image_to_text(file_path, use_gvision=use_gvision)
+
+
+def file_to_pages(file_path: str, use_gvision: bool = False, processes: int = None) -> List[Tuple[int, str]]:
+    """[(page_number, text)] for a PDF or image (images are a single page 1)."""
+    return list(iter_pages(file_path, use_gvision=use_gvision, processes=processes))
+
+
+def file_to_text(file_path: str, use_gvision: bool = False) -> str:
+    return "\n".join(text for _, text in iter_pages(file_path, use_gvision=use_gvision))
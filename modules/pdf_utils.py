@@ -1,9 +1,6 @@
-from PyPDF2 import PdfReader
+from .ocr import extract_pdf_pages
+
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Extract text from a PDF file."""
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
+    return "\n".join(text for _, text in extract_pdf_pages(pdf_path))
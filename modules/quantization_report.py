@@ -0,0 +1,104 @@
+"""
+Recall@k vs. memory for the vectorstore's index / quantization options on your own vectors.
+
+    python -m modules.quantization_report [--store vectorstore] [--queries 500] [--k 10] [--json out.json]
+
+A sample of the stored vectors is held out as queries; every option is built from the rest
+and compared against exact brute-force neighbours, with and without exact re-ranking.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from . import index_factory
+
+DEFAULT_OPTIONS: Sequence[Tuple[str, str]] = (
+    ("flat", "none"), ("flat", "fp16"), ("flat", "sq8"), ("flat", "pq"),
+    ("hnsw", "none"), ("hnsw", "sq8"), ("ivf_flat", "sq8"), ("ivf_pq", "pq"),
+)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[f >= 0]) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def report(vectors: np.ndarray, num_queries: int = 500, k: int = 10, rerank: int = 4,
+           options: Sequence[Tuple[str, str]] = DEFAULT_OPTIONS, nprobe: int = 16, ef_search: int = 64,
+           seed: int = 0) -> List[Dict[str, Any]]:
+    """One row per (index_type, quantization): bytes per vector, recall@k, recall@k with re-ranking, ms per query."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    num_queries = min(num_queries, len(vectors) // 10 or 1)
+    queries, base = vectors[order[:num_queries]], vectors[order[num_queries:]]
+    _, truth = faiss.knn(queries, base, k)
+
+    rows = []
+    for index_type, quantization in options:
+        index = index_factory.build_index(index_type, base.shape[1], ntrain=len(base), quantization=quantization)
+        index_factory.train(index, base)
+        index.add(base)
+        params = index_factory.search_params(index, nprobe, ef_search)
+
+        start = time.perf_counter()
+        _, found = index.search(queries, k, params=params)
+        elapsed = time.perf_counter() - start
+
+        _, candidates = index.search(queries, k * rerank, params=params)
+        exact = base[np.maximum(candidates, 0)]
+        dist = np.where(candidates >= 0, ((exact - queries[:, None, :]) ** 2).sum(axis=2), np.inf)
+        reranked = np.take_along_axis(candidates, np.argsort(dist, axis=1)[:, :k], axis=1)
+
+        # serialized size covers codes, codebooks, graph links and inverted lists alike
+        per_vector = len(faiss.serialize_index(index)) / len(base)
+        rows.append({
+            "index_type": index_type,
+            "quantization": index_factory.quantization_of(index),
+            "bytes_per_vector": round(per_vector, 1),
+            "compression": round(base.shape[1] * 4 / per_vector, 2),
+            f"recall@{k}": round(_recall(found, truth), 4),
+            f"recall@{k}_reranked": round(_recall(reranked, truth), 4),
+            "ms_per_query": round(1000 * elapsed / len(queries), 3),
+        })
+    return rows
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Recall@k vs. memory of the vectorstore index options.")
+    parser.add_argument("--store", default=None, help="vectorstore directory (default: Config.VECTORSTORE_DIR)")
+    parser.add_argument("--queries", type=int, default=500, help="held-out query vectors")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=int(os.getenv("VECTOR_RERANK", "4")),
+                        help="candidates per result re-scored exactly")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args(argv)
+
+    from config import Config
+    from .vectorstore import VectorStore
+
+    # read_only: the app may be appending to the same delta logs
+    store = VectorStore(dim=Config.VECTOR_DIM, persist_path=args.store or Config.VECTORSTORE_DIR, read_only=True)
+    vectors, _ = store.vectors()
+    if len(vectors) < 100:
+        raise SystemExit(f"only {len(vectors)} vectors in the store, ingest some documents first")
+    rows = report(vectors, num_queries=args.queries, k=args.k, rerank=args.rerank,
+                  nprobe=Config.VECTOR_NPROBE, ef_search=Config.VECTOR_EF_SEARCH)
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, float32 = {vectors.shape[1] * 4} bytes/vector")
+    columns = list(rows[0])
+    print("  ".join(f"{c:>18}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{row[c]!s:>18}" for c in columns))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
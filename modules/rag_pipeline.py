@@ -1,139 +1,915 @@
 import json
+import threading
+import time
 import uuid
-from typing import Dict, Any, List
-from modules.ocr import file_to_text
-from .chunking import chunk_text
-from .embeddings import embed_texts, get_embedding
+from collections import OrderedDict
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from modules.ocr import iter_pages
+from .chunking import SpanChunker
+from .embeddings import chunk_sizing, embed_texts, get_embedding, warm_up as warm_up_embeddings
 from .vectorstore import VectorStore
-from .db import SessionLocal, Document, Chunk, init_db
+from .sharding import ShardedVectorStore
+from sqlalchemy import func, update
+from .db import (SessionLocal, Document, Chunk, DocumentSegment, DocumentTextCache, init_db, bulk_insert_chunks,
+                 chunk_text_query, chunk_texts, segment_texts)
+from .dedup import chunk_hash, file_sha256
+from .answer_cache import AnswerCache
+from .lexical import BM25Index, load_chunks, reciprocal_rank_fusion
+from .metastore import to_timestamp
+from . import metrics
+from .lazy import optional_import
 import os
 
-# Optional Ollama integration
-try:
-    from ollama import Ollama
-    _OLLAMA_AVAILABLE = True
-except ImportError:
-    Ollama = None
-    _OLLAMA_AVAILABLE = False
+# OpenAI-compatible endpoint used when Ollama isn't available (point it at a local server to test)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-oss-20b")
+
+_IN_CLAUSE_BATCH = 900
+# documents whose vector-owning chunk ids are kept around for document filters
+_DOC_CHUNKS_CACHE = 256
+
+# filter keys the lexical side can check against the DB; other keys only exist in vector metadata
+_LEXICAL_FILTER_KEYS = {"document_id", "chunk_id", "source", "chunk_index", "uploaded_after", "uploaded_before"}
 
 class RAGPipeline:
-    def __init__(self, vector_dim: int = 384, vector_persist: str = None, ollama_model: str = "llama2"):
-        self.vs = VectorStore(dim=vector_dim, persist_path=vector_persist)
+    def __init__(self, vector_dim: int = 384, vector_persist: str = None, ollama_model: str = "llama2",
+                 embed_batch_size: int = None, vector_options: Dict[str, Any] = None,
+                 ingest_batch_size: int = 256, store_document_text: bool = True,
+                 dedup: bool = True, near_dup_distance: float = 0.0, answer_cache: AnswerCache = None,
+                 hybrid: bool = False, hybrid_candidates: int = 4, rrf_k: int = 60, llm_concurrency: int = 4,
+                 chunk_storage: str = "content", chunk_tokens: int = 0, doc_text_cache: DocumentTextCache = None):
+        # vector_options are passed through to VectorStore (index_type, promote_at, nprobe, ...);
+        # shards > 1 spreads the vectors over a ShardedVectorStore partitioned by shard_by
+        vector_options = dict(vector_options or {})
+        shards = vector_options.pop("shards", 1) or 1
+        shard_by = vector_options.pop("shard_by", "document")
+        if shards > 1:
+            self.vs = ShardedVectorStore(dim=vector_dim, persist_path=vector_persist, shards=shards,
+                                         partition=shard_by, **vector_options)
+        else:
+            self.vs = VectorStore(dim=vector_dim, persist_path=vector_persist, **vector_options)
         self.ollama_model = ollama_model
-        if _OLLAMA_AVAILABLE:
+        self.embed_batch_size = embed_batch_size
+        # chunks are embedded / stored this many at a time, so memory doesn't grow with document size
+        self.ingest_batch_size = max(1, ingest_batch_size)
+        self.store_document_text = store_document_text
+        # "offsets": documents.text holds the cleaned text once and chunk rows only (start, end) into it,
+        # sliced back out through an LRU of hot documents; "content": every chunk row has its own text
+        self.chunk_storage = chunk_storage
+        self.doc_texts = doc_text_cache or DocumentTextCache()
+        # chunk size in tokens of the embedding model (-1: its max input length), 0 keeps 500 characters
+        self.chunk_tokens = chunk_tokens
+        self._sizing: Optional[Dict[str, Any]] = None
+        # skip files / chunks already ingested; near_dup_distance > 0 also folds chunks whose
+        # vector lies within that (squared L2) distance of a stored one
+        self.dedup = dedup
+        self.near_dup_distance = near_dup_distance
+        # optional AnswerCache, entries are invalidated as new vectors are added
+        self.answer_cache = answer_cache
+        # hybrid retrieval: BM25 over chunk text next to FAISS, merged with reciprocal rank fusion.
+        # The lexical index is filled from the DB on first use and kept current by ingest.
+        self.hybrid = hybrid
+        self.hybrid_candidates = max(1, hybrid_candidates)
+        self.rrf_k = rrf_k
+        self.lexical = BM25Index()
+        self._lexical_loaded = False
+        self._lexical_lock = threading.Lock()
+        self._search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lexical") if hybrid else None
+        # document_id -> chunk ids a document filter matches, dropped whenever chunk rows are committed
+        self._doc_chunks: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._doc_chunks_version = 0
+        self._doc_chunks_lock = threading.Lock()
+        # parallel LLM requests in query_batch
+        self.llm_concurrency = max(1, llm_concurrency)
+        # Optional Ollama integration, imported here rather than with the module
+        Ollama = optional_import("ollama", "Ollama")
+        if Ollama is not None:
             self.ollama_client = Ollama(model=self.ollama_model)
         else:
             self.ollama_client = None
         init_db()
 
-    def ingest_image(self, image_path: str, filename: str = None, use_gvision: bool = False) -> Dict[str, Any]:
+    def warm_up(self):
+        """
+        Does now what the first query would otherwise pay for: loading the embedding model and,
+        with hybrid search, the lexical index. Meant to run before web workers fork.
+        """
+        warm_up_embeddings(provider="sentence_transformers", model_name="all-MiniLM-L6-v2")
+        if self.hybrid:
+            self._load_lexical()
+
+    def ingest_image(self, image_path: str, filename: str = None, use_gvision: bool = False,
+                     progress: Callable[[str, float], None] = None) -> Dict[str, Any]:
         filename = filename or (os.path.basename(image_path) if image_path else f'doc_{uuid.uuid4()}')
 
-        # Extract text
-        text = file_to_text(image_path, use_gvision=use_gvision)
+        # same bytes already ingested: skip OCR and embedding entirely
+        content_hash, duplicate = self.find_duplicate_file(image_path)
+        if duplicate:
+            return duplicate
+
+        # Extract text page by page, pages are pulled lazily while chunks are stored
+        if progress:
+            progress("ocr", 0.0)
+        pages = iter_pages(image_path, use_gvision=use_gvision)
+
+        return self.ingest_pages(pages, filename=filename, progress=progress, content_hash=content_hash)
+
+    def find_duplicate_file(self, path: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(sha256 of the file, info of an ingested document with the same bytes or None)."""
+        if not self.dedup:
+            return None, None
+        content_hash = file_sha256(path)
+        return content_hash, self.find_document_by_hash(content_hash)
+
+    def find_document_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            doc_id = (db.query(Document.id).filter(Document.content_hash == content_hash)
+                      .order_by(Document.id).limit(1).scalar())
+            if doc_id is None:
+                return None
+            num_chunks = db.query(func.count(Chunk.id)).filter(Chunk.document_id == doc_id).scalar()
+            return {"document_id": doc_id, "num_chunks": num_chunks, "duplicate": True}
+        finally:
+            db.close()
 
-        # Chunk text
-        chunks = chunk_text(text)
+    def ingest_text(self, text: str, filename: str = None,
+                    progress: Callable[[str, float], None] = None) -> Dict[str, Any]:
+        """Chunks, embeds and stores already extracted text. progress(stage, fraction) is optional."""
+        return self.ingest_pages([(None, text)], filename=filename, progress=progress)
 
-        # Generate embeddings
-        embeddings = embed_texts(chunks, provider="sentence_transformers", model_name="all-MiniLM-L6-v2")
+    def ingest_pages(self, pages: Iterable[Tuple[Optional[int], str]], filename: str = None,
+                     progress: Callable[[str, float], None] = None, content_hash: str = None) -> Dict[str, Any]:
+        """
+        Like ingest_text, for [(page_number, text)]; the page number ends up in each chunk's metadata.
+        pages may be a generator: chunks are embedded and stored in micro-batches of
+        ingest_batch_size as the pages come in. Every micro-batch is its own transaction, so the
+        DB write lock is never held while pages are extracted or progress is reported; a document
+        that fails half way is deleted again. content_hash is set once all chunks are in, so a
+        concurrent upload of the same file isn't matched against a partial document.
+        With offsets storage the cleaned text is appended batch by batch as document segments,
+        which become documents.text once all chunks are in.
+        """
+        filename = filename or f'doc_{uuid.uuid4()}'
+        report = progress or (lambda stage, fraction: None)
+        total_pages = len(pages) if hasattr(pages, "__len__") else None
+        pages_seen = 0
+        full_text: List[str] = []
+        # pages are produced lazily, so text extraction / OCR time is whatever pulling them costs
+        extracted = metrics.TimedIter(pages)
+        chunk_seconds = 0.0
 
-        # Prepare vectorstore metadata
-        ids = [str(uuid.uuid4()) for _ in chunks]
-        metadatas = [{"source": filename, "chunk_index": i} for i in range(len(chunks))]
-        self.vs.add(embeddings, metadatas, ids)
+        def page_stream():
+            nonlocal pages_seen
+            for page_no, page_text in extracted:
+                pages_seen += 1
+                if self.store_document_text and self.chunk_storage != "offsets":
+                    full_text.append(page_text)
+                yield page_no, page_text
 
-        # Store document + chunks safely
+        report("chunking", 0.3)
+        offsets = self.chunk_storage == "offsets"
+        # only offsets storage needs the cleaned text, and only until it's written out
+        chunker = SpanChunker(page_stream(), keep_text=offsets, **self._chunk_sizing())
+        chunks = iter(chunker)
+        num_chunks = 0
+        text_written = 0
+        indexed: List[int] = []
+        doc_id = None
         db = SessionLocal()
         try:
-            doc = Document(filename=filename, text=text)
+            doc = Document(filename=filename)
             db.add(doc)
-            db.commit()  # assign doc.id
-            # db.refresh(doc)  # ensure fully bound
-
-            for i, c in enumerate(chunks):
-                ch = Chunk(
-                    document_id=doc.id,
-                    content=c,
-                    chunk_index=i,
-                    chunk_metadata=json.dumps(metadatas[i])
-                )
-                db.add(ch)
+            db.commit()  # assigns doc.id
+            doc_id = doc.id
+
+            while True:
+                start, extract_before = time.perf_counter(), extracted.seconds
+                batch = list(islice(chunks, self.ingest_batch_size))
+                chunk_seconds += time.perf_counter() - start - (extracted.seconds - extract_before)
+                if not batch:
+                    break
+                texts = [span.text for span in batch]
+                metadatas = self._chunk_metas(filename, [(span.text, span.page) for span in batch], start=num_chunks)
+                spans = [(span.start, span.end) for span in batch] if offsets else None
+                indexed += self._store_chunks(db, [doc_id] * len(batch), texts, metadatas, spans=spans)
+                if offsets:
+                    # what the chunk offsets point into, up to the pages read so far
+                    text_written = self._append_text(db, doc_id, chunker, text_written)
+                    chunker.release(text_written)
+                with metrics.stage("db_write"):
+                    db.commit()
+                self._chunks_changed()
+                num_chunks += len(batch)
+
+                if total_pages:
+                    report("indexing", 0.3 + 0.65 * pages_seen / total_pages)
+                else:
+                    report("indexing", 0.5)
+
+            report("storing", 0.95)
+            values: Dict[str, Any] = {"content_hash": content_hash}
+            if offsets:
+                # the whole text written once, rewriting it every batch made ingest quadratic
+                values["text"] = segment_texts(db, [doc_id]).get(doc_id, "") + chunker.text_from(text_written)
+                db.query(DocumentSegment).filter(DocumentSegment.document_id == doc_id).delete(synchronize_session=False)
+            elif self.store_document_text:
+                values["text"] = "\n".join(full_text)
+            db.execute(update(Document).where(Document.id == doc_id).values(**values))
+            with metrics.stage("db_write"):
+                db.commit()
+        except Exception:
+            db.rollback()
+            self.lexical.remove(indexed)
+            if doc_id is not None:
+                # batches already committed (and their vectors) go with the document
+                self.delete_document(doc_id)
+            raise
+        finally:
+            db.close()
+            metrics.record("extract", extracted.seconds, pages=extracted.count)
+            metrics.record("chunk", chunk_seconds, chunks=num_chunks)
+
+        return {"document_id": doc_id, "num_chunks": num_chunks}
+
+
+    def ingest_chunked(self, docs: List[Tuple[str, List[Tuple[str, Optional[int]]]]],
+                       content_hashes: List[Optional[str]] = None, document_texts: List[Optional[str]] = None,
+                       spans: List[Optional[List[Tuple[int, int]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Stores several already chunked documents [(filename, [(chunk, page_number)])] at once:
+        one embedding call over all of their chunks, one bulk insert, one vectorstore add, one transaction.
+        document_texts are the cleaned texts the chunks were cut from, kept like ingest_pages does;
+        with offsets storage, a document's chunks are stored as its spans [(start, end)] into that text.
+        """
+        texts = [c for _, chunks in docs for c, _ in chunks]
+        content_hashes = content_hashes or [None] * len(docs)
+        document_texts = document_texts or [None] * len(docs)
+        spans = spans or [None] * len(docs)
+        offsets = self.chunk_storage == "offsets"
+        keep_text = offsets or self.store_document_text
+
+        indexed: List[int] = []
+        doc_ids: List[int] = []
+        db = SessionLocal()
+        try:
+            new_docs = [Document(filename=filename, content_hash=h, text=text if keep_text else None)
+                        for (filename, _), h, text in zip(docs, content_hashes, document_texts)]
+            db.add_all(new_docs)
+            db.flush()  # assign ids
+            doc_ids = [d.id for d in new_docs]
+
+            chunk_doc_ids, metadatas, chunk_spans = [], [], []
+            for doc_id, (filename, chunks), text, doc_spans in zip(doc_ids, docs, document_texts, spans):
+                chunk_doc_ids.extend([doc_id] * len(chunks))
+                metadatas.extend(self._chunk_metas(filename, chunks))
+                # without the text to slice from, chunks keep their content
+                use_spans = offsets and text is not None and doc_spans is not None
+                chunk_spans.extend(doc_spans if use_spans else [None] * len(chunks))
+            if texts:
+                indexed = self._store_chunks(db, chunk_doc_ids, texts, metadatas, spans=chunk_spans)
+            with metrics.stage("db_write"):
+                db.commit()
+            self._chunks_changed()
+        except Exception:
+            db.rollback()
+            self.lexical.remove(indexed)
+            if doc_ids:
+                # the rolled-back ids get handed out again, vectors left behind would hydrate to other chunks
+                removed = self.vs.delete({"document_id": doc_ids})
+                if self.answer_cache is not None:
+                    self.answer_cache.invalidate_ids(removed + [f"chunk:{cid}" for cid in indexed])
+            raise
+        finally:
+            db.close()
+
+        return [{"document_id": doc_id, "num_chunks": len(chunks)} for doc_id, (_, chunks) in zip(doc_ids, docs)]
+
+    def delete_document(self, document_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Removes a document's rows and vectors (tombstoned in the vectorstore until compaction).
+        Chunks of other documents that reused one of its vectors through duplicate_of get
+        a copy of that vector first. Returns None if there is no such document.
+        """
+        db = SessionLocal()
+        try:
+            if db.get(Document, document_id) is None:
+                return None
+            rows = db.query(Chunk.id, Chunk.duplicate_of).filter(Chunk.document_id == document_id).all()
+            owned = [r.id for r in rows if r.duplicate_of is None]
+
+            # the first other chunk pointing at a vector of this document becomes its owner, the rest point at it
+            heirs: Dict[int, Chunk] = {}
+            for start in range(0, len(owned), _IN_CLAUSE_BATCH):
+                dependents = (db.query(Chunk)
+                              .filter(Chunk.duplicate_of.in_(owned[start:start + _IN_CLAUSE_BATCH]),
+                                      Chunk.document_id != document_id)
+                              .order_by(Chunk.id)
+                              .all())
+                for chunk in dependents:
+                    heir = heirs.setdefault(chunk.duplicate_of, chunk)
+                    chunk.duplicate_of = None if heir is chunk else heir.id
+
+            db.query(Chunk).filter(Chunk.document_id == document_id).delete(synchronize_session=False)
+            db.query(DocumentSegment).filter(DocumentSegment.document_id == document_id).delete(synchronize_session=False)
+            db.query(Document).filter(Document.id == document_id).delete(synchronize_session=False)
+            db.flush()
+
+            heir_texts: List[Tuple[int, str]] = []
+            if heirs:
+                heir_ids = list(heirs)
+                for start in range(0, len(heir_ids), _IN_CLAUSE_BATCH):
+                    heir_rows = chunk_text_query(db).filter(Chunk.id.in_(heir_ids[start:start + _IN_CLAUSE_BATCH])).all()
+                    heir_texts += zip((r.id for r in heir_rows), chunk_texts(db, heir_rows, self.doc_texts))
+                self._inherit_vectors(db, heirs, dict(heir_texts))
+            removed = self.vs.delete({"document_id": document_id})
             db.commit()
+            self._chunks_changed()
+        except Exception:
+            db.rollback()
+            raise
         finally:
             db.close()
 
-        return {"document_id": doc.id, "num_chunks": len(chunks)}
+        self.doc_texts.discard(document_id)
+        self.lexical.remove(owned)
+        if self.hybrid:
+            self.lexical.add_many(heir_texts)
+        if self.answer_cache is not None:
+            # lexical-only hits are cached under "chunk:<id>"
+            self.answer_cache.invalidate_ids(removed + [f"chunk:{cid}" for cid in owned])
+        return {"document_id": document_id, "num_chunks": len(rows), "vectors_removed": len(removed)}
+
+    def _inherit_vectors(self, db, heirs: Dict[int, Chunk], texts: Dict[int, str]):
+        # copies each old owner's vector to its heir chunk; embeds the heir when there is no vector to copy
+        uploaded = dict(db.query(Document.id, Document.uploaded_at)
+                        .filter(Document.id.in_({h.document_id for h in heirs.values()})).all())
+        vectors, metas = self.vs.vectors({"chunk_id": list(heirs)})
+        found = {int(m["chunk_id"]): i for i, m in enumerate(metas)}
+        missing = [cid for cid in heirs if cid not in found]
+        if missing:
+            extra = embed_texts([texts.get(cid, "") for cid in missing], provider="sentence_transformers",
+                                model_name="all-MiniLM-L6-v2", batch_size=self.embed_batch_size)
+            vectors = np.concatenate([vectors, extra]) if len(vectors) else extra
+            found.update({cid: len(metas) + i for i, cid in enumerate(missing)})
+
+        order = list(heirs)
+        vs_metas = []
+        for cid in order:
+            heir = heirs[cid]
+            meta = json.loads(heir.chunk_metadata) if heir.chunk_metadata else {}
+            when = uploaded.get(heir.document_id)
+            meta.update(document_id=heir.document_id, chunk_id=heir.id,
+                        uploaded_at=to_timestamp(when) if when else int(time.time()))
+            vs_metas.append(meta)
+        embeddings = np.ascontiguousarray(vectors[[found[cid] for cid in order]], dtype="float32")
+        self.vs.add(embeddings, vs_metas, [str(uuid.uuid4()) for _ in order])
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_near(embeddings)
 
+    def replace_document(self, document_id: int, path: str, filename: str = None, use_gvision: bool = False,
+                         progress: Callable[[str, float], None] = None) -> Dict[str, Any]:
+        """
+        Ingests a new version of a document, then deletes the old one (kept if ingestion fails).
+        Chunks that didn't change reuse the old vectors through dedup instead of being re-embedded.
+        """
+        info = self.ingest_image(path, filename=filename, use_gvision=use_gvision, progress=progress)
+        if info["document_id"] != document_id:
+            self.delete_document(document_id)
+        return dict(info, replaced=document_id)
 
-    def query(self, query_text: str, top_k: int = 5) -> Dict[str, Any]:
-        # Get embedding
-        q_emb = get_embedding(query_text, provider="sentence_transformers", model_name="all-MiniLM-L6-v2")
-        results = self.vs.search(q_emb, top_k=top_k)
+    @staticmethod
+    def _append_text(db, doc_id: int, chunker: SpanChunker, written: int) -> int:
+        # adds the cleaned text read since `written` as the document's next segment, returns the new length
+        piece = chunker.text_from(written)
+        if piece:
+            db.add(DocumentSegment(document_id=doc_id, text=piece))
+        return written + len(piece)
 
-        if not results:
+    def _chunk_sizing(self) -> Dict[str, Any]:
+        # SpanChunker options; the tokenizer (and with it the embedding model) is loaded on first ingest
+        if not self.chunk_tokens:
+            return {}
+        if self._sizing is None:
+            self._sizing = chunk_sizing(self.chunk_tokens, provider="sentence_transformers", model_name="all-MiniLM-L6-v2")
+        return self._sizing
+
+    @staticmethod
+    def _chunk_metas(filename: str, chunks: List[Tuple[str, Optional[int]]], start: int = 0) -> List[Dict[str, Any]]:
+        metadatas = []
+        for i, (_, page_no) in enumerate(chunks):
+            meta = {"source": filename, "chunk_index": start + i}
+            if page_no is not None:
+                meta["page"] = page_no
+            metadatas.append(meta)
+        return metadatas
+
+    def _store_chunks(self, db, doc_ids: List[int], texts: List[str], metadatas: List[Dict[str, Any]],
+                      spans: List[Tuple[int, int]] = None) -> List[int]:
+        """
+        Inserts chunk rows (one document id per chunk) and adds vectors for them, inside the caller's transaction.
+        With spans, rows store (start, end) offsets into the document text instead of the chunk text.
+        With dedup on, a chunk whose content already has a vector gets none of its own, only duplicate_of.
+        Returns the ids of the chunks that got a vector (and a lexical index entry).
+        """
+        hashes = [chunk_hash(t) for t in texts]
+        duplicate_of: List[Optional[int]] = [None] * len(texts)
+        same_as: Dict[int, int] = {}  # row -> earlier row of this batch with the same content
+        if self.dedup:
+            with metrics.stage("dedup_lookup"):
+                known = dict(
+                    db.query(Chunk.content_hash, func.min(Chunk.id))
+                    .filter(Chunk.content_hash.in_(set(hashes)), Chunk.duplicate_of.is_(None))
+                    .group_by(Chunk.content_hash)
+                    .all()
+                )
+            first: Dict[str, int] = {}
+            for i, h in enumerate(hashes):
+                if h in known:
+                    duplicate_of[i] = known[h]
+                elif h in first:
+                    same_as[i] = first[h]
+                else:
+                    first[h] = i
+        to_embed = [i for i in range(len(texts)) if duplicate_of[i] is None and i not in same_as]
+
+        # Generate embeddings (float32 matrix, handed to the vectorstore as-is)
+        with metrics.stage("embed", chunks_embedded=len(to_embed)):
+            embeddings = embed_texts([texts[i] for i in to_embed], provider="sentence_transformers",
+                                     model_name="all-MiniLM-L6-v2", batch_size=self.embed_batch_size)
+
+        if self.dedup and self.near_dup_distance > 0 and to_embed:
+            keep = []
+            for row, (dist, meta) in zip(to_embed, self.vs.nearest(embeddings)):
+                if dist <= self.near_dup_distance and "chunk_id" in meta:
+                    duplicate_of[row] = int(meta["chunk_id"])
+                keep.append(duplicate_of[row] is None)
+            embeddings = embeddings[keep]
+            to_embed = [row for row, k in zip(to_embed, keep) if k]
+
+        with metrics.stage("db_write"):
+            chunk_ids = bulk_insert_chunks(db, [
+                {
+                    "document_id": doc_id,
+                    "content": None if span else c,
+                    "start_offset": span[0] if span else None,
+                    "end_offset": span[1] if span else None,
+                    "chunk_index": meta["chunk_index"],
+                    "chunk_metadata": json.dumps(meta),
+                    "content_hash": h,
+                    "duplicate_of": dup,
+                }
+                for doc_id, c, meta, h, dup, span in zip(doc_ids, texts, metadatas, hashes, duplicate_of,
+                                                          spans or [None] * len(texts))
+            ])
+            if same_as:
+                db.execute(update(Chunk), [
+                    {"id": chunk_ids[row], "duplicate_of": duplicate_of[src] or chunk_ids[src]}
+                    for row, src in same_as.items()
+                ])
+
+        if to_embed:
+            # the vectorstore carries the chunk primary key so queries can fetch content by id
+            ids = [str(uuid.uuid4()) for _ in to_embed]
+            uploaded_at = int(time.time())
+            vs_metas = [dict(metadatas[i], document_id=doc_ids[i], chunk_id=chunk_ids[i], uploaded_at=uploaded_at)
+                        for i in to_embed]
+            with metrics.stage("vector_add", vectors_added=len(ids)):
+                self.vs.add(embeddings, vs_metas, ids)
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate_near(embeddings)
+            if self.hybrid:
+                self.lexical.add_many((chunk_ids[i], texts[i]) for i in to_embed)
+        return [chunk_ids[i] for i in to_embed]
+
+    def query(self, query_text: str, top_k: int = 5, document_ids: List[int] = None,
+              filters: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Answers from the top_k chunks. document_ids / filters restrict retrieval, e.g.
+        {"source": "report.pdf", "uploaded_after": "2024-01-01"} (see MetaStore.mask for the keys).
+        """
+        q_emb, results = self._search(query_text, top_k, self._filters(document_ids, filters))
+        cached = self._cache_get(q_emb, top_k, results)
+        if cached:
+            return dict(cached, cached=True)
+
+        retrieved_texts = self._hydrate(results)
+        if not retrieved_texts:
             return {"answer": "No relevant chunks found.", "retrieved": []}
 
-        retrieved_texts: List[Dict[str, Any]] = []
+        answer = self._call_llm(self._build_prompt(query_text, retrieved_texts))
+        self._cache_put(q_emb, top_k, results, {"answer": answer, "retrieved": retrieved_texts})
+        return {"answer": answer, "retrieved": retrieved_texts}
+
+    def query_stream(self, query_text: str, top_k: int = 5, document_ids: List[int] = None,
+                     filters: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of query(): yields {"type": "sources", "retrieved": [...]} first,
+        then {"type": "token", "text": ...} as the LLM produces them, then {"type": "done"}.
+        """
+        q_emb, results = self._search(query_text, top_k, self._filters(document_ids, filters))
+        cached = self._cache_get(q_emb, top_k, results)
+        if cached:
+            yield {"type": "sources", "retrieved": cached["retrieved"]}
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done"}
+            return
+
+        retrieved_texts = self._hydrate(results)
+        yield {"type": "sources", "retrieved": retrieved_texts}
+        if not retrieved_texts:
+            yield {"type": "token", "text": "No relevant chunks found."}
+        else:
+            tokens = []
+            for token in self._stream_llm(self._build_prompt(query_text, retrieved_texts)):
+                if token:
+                    tokens.append(token)
+                    yield {"type": "token", "text": token}
+            # the cache is shared with query(), so it gets the answer _complete() would have returned
+            answer = self._finish_answer("".join(tokens))
+            self._cache_put(q_emb, top_k, results, {"answer": answer, "retrieved": retrieved_texts})
+        yield {"type": "done"}
+
+    def query_batch(self, queries: List[str], top_k: int = 5, generate: bool = True,
+                    llm_concurrency: int = None, document_ids: List[int] = None,
+                    filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        query() for many questions: one embedding batch, one FAISS search, one content lookup,
+        then the LLM calls fanned out over llm_concurrency threads (generate=False stops after retrieval).
+        document_ids / filters apply to every question.
+        """
+        q_embs, batch_results = self._search_batch(queries, top_k, self._filters(document_ids, filters))
+        out: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        pending = []
+        for i, results in enumerate(batch_results):
+            cached = self._cache_get(q_embs[i], top_k, results) if generate else None
+            if cached:
+                out[i] = dict(cached, cached=True)
+            else:
+                pending.append(i)
+
+        hydrated = self._hydrate_batch([batch_results[i] for i in pending])
+        prompts = {}
+        for i, retrieved_texts in zip(pending, hydrated):
+            if not generate:
+                out[i] = {"answer": None, "retrieved": retrieved_texts}
+            elif not retrieved_texts:
+                out[i] = {"answer": "No relevant chunks found.", "retrieved": []}
+            else:
+                out[i] = {"answer": None, "retrieved": retrieved_texts}
+                prompts[i] = self._build_prompt(queries[i], retrieved_texts)
+
+        if prompts:
+            with ThreadPoolExecutor(max_workers=llm_concurrency or self.llm_concurrency) as pool:
+                answers = dict(zip(prompts, pool.map(metrics.bind(self._call_llm), prompts.values())))
+            for i, answer in answers.items():
+                out[i]["answer"] = answer
+                self._cache_put(q_embs[i], top_k, batch_results[i], {"answer": answer, "retrieved": out[i]["retrieved"]})
+        return out
+
+    def retrieve(self, query_text: str, top_k: int = 5, document_ids: List[int] = None,
+                 filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Top-k chunks for a query as [{"id", "distance", "metadata", "content"}]."""
+        _, results = self._search(query_text, top_k, self._filters(document_ids, filters))
+        return self._hydrate(results)
+
+    def _filters(self, document_ids: Optional[List[int]], filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # document_ids is shorthand for filters["document_id"]
+        merged = {k: v for k, v in (filters or {}).items() if v is not None}
+        if document_ids:
+            merged["document_id"] = [int(d) for d in document_ids]
+        if "document_id" in merged:
+            # dedup'd chunks have no vector carrying their document_id, so match on chunk ids instead
+            chunk_ids = self._document_chunk_ids(merged.pop("document_id"))
+            if "chunk_id" in merged:
+                wanted = merged["chunk_id"]
+                wanted = set(wanted) if isinstance(wanted, (list, tuple, set, frozenset)) else {wanted}
+                chunk_ids = [cid for cid in chunk_ids if cid in wanted]
+            merged["chunk_id"] = chunk_ids
+        return merged or None
+
+    def _document_chunk_ids(self, document_ids) -> List[int]:
+        """Ids of the vector-owning chunks behind these documents: their own, or the ones they're duplicate_of."""
+        if not isinstance(document_ids, (list, tuple, set, frozenset)):
+            document_ids = [document_ids]
+        document_ids = list(dict.fromkeys(int(d) for d in document_ids))
+        with self._doc_chunks_lock:
+            version = self._doc_chunks_version
+            known = {}
+            for d in document_ids:
+                if d in self._doc_chunks:
+                    self._doc_chunks.move_to_end(d)
+                    known[d] = self._doc_chunks[d]
+        missing = [d for d in document_ids if d not in known]
+        if missing:
+            found: Dict[int, set] = {d: set() for d in missing}
+            db = SessionLocal()
+            try:
+                for start in range(0, len(missing), _IN_CLAUSE_BATCH):
+                    rows = (db.query(Chunk.document_id, Chunk.id, Chunk.duplicate_of)
+                            .filter(Chunk.document_id.in_(missing[start:start + _IN_CLAUSE_BATCH])).all())
+                    for r in rows:
+                        found[r.document_id].add(r.duplicate_of or r.id)
+            finally:
+                db.close()
+            with self._doc_chunks_lock:
+                # a commit since the lookup started may have changed these documents, don't cache it then
+                if version == self._doc_chunks_version:
+                    for d, ids in found.items():
+                        self._doc_chunks[d] = sorted(ids)
+                    while len(self._doc_chunks) > _DOC_CHUNKS_CACHE:
+                        self._doc_chunks.popitem(last=False)
+            known.update({d: sorted(ids) for d, ids in found.items()})
+        return sorted({cid for d in document_ids for cid in known[d]})
+
+    def _chunks_changed(self):
+        # chunk rows or their duplicate_of links were committed: cached document -> chunk ids may be stale
+        with self._doc_chunks_lock:
+            self._doc_chunks_version += 1
+            self._doc_chunks.clear()
+
+    def _search(self, query_text: str, top_k: int, filters: Dict[str, Any] = None):
+        if not self.hybrid:
+            # Get embedding
+            with metrics.stage("embed_query", queries=1):
+                q_emb = get_embedding(query_text, provider="sentence_transformers", model_name="all-MiniLM-L6-v2")
+            with metrics.stage("vector_search", vectors_searched=self.vs.ntotal):
+                results = [r for r in self.vs.search(q_emb, top_k=top_k, filters=filters) if len(r) == 3]  # skip malformed
+            return q_emb, results
+
+        # lexical lookup runs on the pool while this thread embeds and searches FAISS
+        n = top_k * self.hybrid_candidates
+        lexical = self._search_pool.submit(metrics.bind(self._lexical_search), query_text, n, filters)
+        with metrics.stage("embed_query", queries=1):
+            q_emb = get_embedding(query_text, provider="sentence_transformers", model_name="all-MiniLM-L6-v2")
+        with metrics.stage("vector_search", vectors_searched=self.vs.ntotal):
+            dense = [r for r in self.vs.search(q_emb, top_k=n, filters=filters) if len(r) == 3]
+        return q_emb, self._fuse(dense, lexical.result(), top_k, self.rrf_k)
+
+    def _search_batch(self, queries: List[str], top_k: int, filters: Dict[str, Any] = None):
+        n = top_k * self.hybrid_candidates if self.hybrid else top_k
+        lexical_search = metrics.bind(self._lexical_search)
+        lexical = ([self._search_pool.submit(lexical_search, q, n, filters) for q in queries]
+                   if self.hybrid else None)
+        with metrics.stage("embed_query", queries=len(queries)):
+            q_embs = embed_texts(queries, provider="sentence_transformers", model_name="all-MiniLM-L6-v2",
+                                 batch_size=self.embed_batch_size)
+        with metrics.stage("vector_search", vectors_searched=self.vs.ntotal * len(queries)):
+            dense = [[r for r in results if len(r) == 3]
+                     for results in self.vs.search_batch(q_embs, top_k=n, filters=filters)]
+        if lexical is not None:
+            dense = [self._fuse(d, f.result(), top_k, self.rrf_k) for d, f in zip(dense, lexical)]
+        return q_embs, dense
+
+    def _load_lexical(self):
+        if not self._lexical_loaded:
+            with self._lexical_lock:
+                if not self._lexical_loaded:
+                    with metrics.stage("lexical_load"):
+                        load_chunks(self.lexical, SessionLocal, doc_texts=self.doc_texts)
+                    self._lexical_loaded = True
+
+    def _lexical_search(self, query_text: str, n: int, filters: Dict[str, Any] = None) -> List[Tuple[int, float]]:
+        self._load_lexical()
+        with metrics.stage("lexical_search"):
+            hits = self.lexical.search(query_text, n)
+            if filters and hits:
+                if set(filters) - _LEXICAL_FILTER_KEYS:
+                    return []  # can't be checked outside the vectorstore, dense results only
+                allowed = self._chunks_matching([cid for cid, _ in hits], filters)
+                hits = [(cid, score) for cid, score in hits if cid in allowed]
+        return hits
+
+    @staticmethod
+    def _chunks_matching(chunk_ids: List[int], filters: Dict[str, Any]) -> set:
+        """The subset of chunk_ids whose chunk / document rows match the filters (one query per IN slice)."""
+        def values(v):
+            return list(v) if isinstance(v, (list, tuple, set, frozenset)) else [v]
+
+        def utc(v):
+            return datetime.fromtimestamp(to_timestamp(v), timezone.utc).replace(tzinfo=None)
+
+        chunk_ids = list(chunk_ids)
+        if "chunk_id" in filters:
+            # may be every chunk of a large document, so it's checked here rather than bound into the query
+            wanted = set(values(filters["chunk_id"]))
+            chunk_ids = [cid for cid in chunk_ids if cid in wanted]
         db = SessionLocal()
         try:
-            for result in results:
-                if len(result) != 3:
-                    continue  # skip malformed
-                id_, dist, meta = result
-                entry = {"id": id_, "distance": dist, "metadata": meta, "content": ""}
-                if isinstance(meta, dict) and "chunk_index" in meta and "source" in meta:
-                    doc = db.query(Document).filter(Document.filename == meta["source"]).first()
-                    if doc:
-                        chunk = db.query(Chunk).filter(
-                            Chunk.document_id == doc.id,
-                            Chunk.chunk_index == int(meta["chunk_index"])
-                        ).first()
-                        if chunk:
-                            entry["content"] = chunk.content
-                retrieved_texts.append(entry)
+            q = db.query(Chunk.id).join(Document, Chunk.document_id == Document.id)
+            for key, value in filters.items():
+                if key == "document_id":
+                    q = q.filter(Chunk.document_id.in_(values(value)))
+                elif key == "source":
+                    q = q.filter(Document.filename.in_(values(value)))
+                elif key == "chunk_index":
+                    q = q.filter(Chunk.chunk_index.in_(values(value)))
+                elif key == "uploaded_after":
+                    q = q.filter(Document.uploaded_at >= utc(value))
+                elif key == "uploaded_before":
+                    q = q.filter(Document.uploaded_at <= utc(value))
+            matched = set()
+            for start in range(0, len(chunk_ids), _IN_CLAUSE_BATCH):
+                matched.update(row.id for row in q.filter(Chunk.id.in_(chunk_ids[start:start + _IN_CLAUSE_BATCH])))
+            return matched
         finally:
             db.close()
 
+    @staticmethod
+    def _fuse(dense, lexical: List[Tuple[int, float]], top_k: int, k: int = 60):
+        """RRF over vector hits and BM25 chunk ids, as (id, distance, metadata); lexical-only hits have no distance."""
+        by_key: Dict[tuple, tuple] = {}
+        dense_keys, lexical_keys = [], []
+        for r in dense:
+            meta = r[2] if isinstance(r[2], dict) else {}
+            key = ("chunk", int(meta["chunk_id"])) if "chunk_id" in meta else ("vector", r[0])
+            by_key.setdefault(key, r)
+            dense_keys.append(key)
+        for chunk_id, _ in lexical:
+            key = ("chunk", chunk_id)
+            by_key.setdefault(key, (f"chunk:{chunk_id}", None, {"chunk_id": chunk_id}))
+            lexical_keys.append(key)
+        return [by_key[key] for key in reciprocal_rank_fusion([dense_keys, lexical_keys], top_k, k=k)]
+
+    def _hydrate(self, results: List[Tuple[str, float, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        return self._hydrate_batch([results])[0]
+
+    def _hydrate_batch(self, batch_results: List[List[Tuple[str, float, Dict[str, Any]]]]) -> List[List[Dict[str, Any]]]:
+        """Result tuples -> retrieved dicts with content, for any number of queries in one DB round trip."""
+        batch = [[{"id": id_, "distance": dist, "metadata": meta, "content": ""} for id_, dist, meta in results]
+                 for results in batch_results]
+        entries = [entry for retrieved_texts in batch for entry in retrieved_texts]
+        if not entries:
+            return batch
+
+        with metrics.stage("db_lookup"):
+            db = SessionLocal()
+            try:
+                contents = self._fetch_contents(db, [r["metadata"] for r in entries], self.doc_texts)
+            finally:
+                db.close()
+        for entry, content in zip(entries, contents):
+            entry["content"] = content
+        return batch
+
+    # answer cache
+    def _cache_get(self, q_emb, top_k: int, results) -> Optional[Dict[str, Any]]:
+        if self.answer_cache is None or not results:
+            return None
+        return self.answer_cache.get(q_emb, top_k, [r[0] for r in results])
+
+    def _cache_put(self, q_emb, top_k: int, results, value: Dict[str, Any]):
+        if self.answer_cache is None or not results:
+            return
+        answer = value["answer"]
+        if not answer or answer.startswith(("[LLM ERROR", "[No LLM configured]")):
+            return  # transient failures shouldn't stick
+        kth_distance = results[-1][1] if len(results) >= top_k else None
+        if kth_distance is None:
+            kth_distance = float("inf")  # short or lexical-only tail: any new vector may change it
+        self.answer_cache.put(q_emb, top_k, [r[0] for r in results], kth_distance, value)
+
+    @staticmethod
+    def _build_prompt(query_text: str, retrieved_texts: List[Dict[str, Any]]) -> str:
         context = [r["content"] for r in retrieved_texts if r["content"]]
         prompt = "You are an assistant. Use the following context to answer the question."
         prompt += "\n\nContext:\n" + "\n---\n".join(context) + "\n\nQuestion: " + query_text
+        return prompt
 
-        answer = self._call_llm(prompt)
-        return {"answer": answer, "retrieved": retrieved_texts}
+    @staticmethod
+    def _fetch_contents(db, metas: List[Dict[str, Any]], doc_texts: DocumentTextCache = None) -> List[str]:
+        """
+        Chunk content for each vectorstore metadata dict, in at most two queries:
+        one IN over chunk ids, one for older entries that only know (source, chunk_index).
+        Offset-stored chunks need their documents' text too, unless doc_texts has it cached.
+        """
+        metas = [m if isinstance(m, dict) else {} for m in metas]
+        chunk_ids = {int(m["chunk_id"]) for m in metas if "chunk_id" in m}
+        by_id: Dict[int, str] = {}
+        # sliced so batch queries stay under the driver's bound-parameter limit
+        ordered = sorted(chunk_ids)
+        for start in range(0, len(ordered), _IN_CLAUSE_BATCH):
+            part = ordered[start:start + _IN_CLAUSE_BATCH]
+            rows = chunk_text_query(db).filter(Chunk.id.in_(part)).all()
+            by_id.update(zip((r.id for r in rows), chunk_texts(db, rows, doc_texts)))
+
+        legacy = [m for m in metas if "chunk_id" not in m and "chunk_index" in m and "source" in m]
+        by_source: Dict[tuple, str] = {}
+        if legacy:
+            rows = (
+                chunk_text_query(db)
+                .add_columns(Document.filename, Chunk.chunk_index)
+                .filter(
+                    Document.filename.in_({m["source"] for m in legacy}),
+                    Chunk.chunk_index.in_({int(m["chunk_index"]) for m in legacy}),
+                )
+                .order_by(Document.id)
+                .all()
+            )
+            for row, content in zip(rows, chunk_texts(db, rows, doc_texts)):
+                # first document with that filename wins, same as the old per-hit lookup
+                by_source.setdefault((row.filename, row.chunk_index), content)
+
+        contents = []
+        for m in metas:
+            if "chunk_id" in m:
+                contents.append(by_id.get(int(m["chunk_id"])) or "")
+            elif "chunk_index" in m and "source" in m:
+                contents.append(by_source.get((m["source"], int(m["chunk_index"]))) or "")
+            else:
+                contents.append("")
+        return contents
 
     def _call_llm(self, prompt: str) -> str:
         """Call Ollama LLM if available, fallback to OpenAI if configured"""
+        with metrics.stage("llm") as info:
+            answer, tokens = self._complete(prompt)
+            # backends that don't report usage are counted in words
+            info["llm_tokens"] = len(answer.split()) if tokens is None else tokens
+        return answer
+
+    def _complete(self, prompt: str) -> Tuple[str, Optional[int]]:
+        # (answer, generated tokens if the backend reports them)
         # Ollama
         if self.ollama_client:
             try:
                 resp = self.ollama_client.chat([{"role": "user", "content": prompt}])
-                return resp.get("message", "").strip()
+                return resp.get("message", "").strip(), resp.get("eval_count")
             except Exception as e:
-                return f"[LLM ERROR - Ollama]: {e}"
+                return f"[LLM ERROR - Ollama]: {e}", 0
 
         # OpenAI if API key is set
-        import os
-        api_key = os.getenv("OPENAI_API_KEY")
-        if api_key:
+        if os.getenv("OPENAI_API_KEY"):
             try:
-                from openai import OpenAI
-                client = OpenAI(
-                    api_key=api_key,
-                    base_url="https://api.groq.com/openai/v1"
-                    )
+                client = _openai_client()
                 resp = client.chat.completions.create(
-                    model="openai/gpt-oss-20b",
+                    model=LLM_MODEL,
                     messages=[{"role": "user", "content": prompt}]
                 )
 
                 text = resp.choices[0].message.content.strip()
-                return clean_model_output(text=text)
+                usage = getattr(resp, "usage", None)
+                return clean_model_output(text=text), getattr(usage, "completion_tokens", None)
             except Exception as e:
-                return f"[LLM ERROR - OpenAI]: {e}"
+                return f"[LLM ERROR - OpenAI]: {e}", 0
 
         # Fallback
-        return "[No LLM configured]"
+        return "[No LLM configured]", 0
+
+    def _finish_answer(self, text: str) -> str:
+        # post-processing of a streamed answer matching _complete(): OpenAI output is cleaned, Ollama's stripped
+        text = text.strip()
+        return text if self.ollama_client else clean_model_output(text=text)
+
+    def _stream_llm(self, prompt: str) -> Iterator[str]:
+        """Same backends as _call_llm, yielding text deltas as they arrive."""
+        start = time.perf_counter()
+        deltas = 0
+        try:
+            for text in self._stream_completion(prompt):
+                if not deltas:
+                    metrics.record("llm_first_token", time.perf_counter() - start)
+                deltas += 1
+                yield text
+        finally:
+            # servers stream about one token per delta
+            metrics.record("llm", time.perf_counter() - start, llm_tokens=deltas)
+
+    def _stream_completion(self, prompt: str) -> Iterator[str]:
+        messages = [{"role": "user", "content": prompt}]
+        # Ollama
+        if self.ollama_client:
+            try:
+                for part in self.ollama_client.chat(messages, stream=True):
+                    message = part.get("message", "")
+                    yield message.get("content", "") if isinstance(message, dict) else message
+            except Exception as e:
+                yield f"[LLM ERROR - Ollama]: {e}"
+            return
+
+        # any OpenAI-compatible server (LLM_BASE_URL), tokens come back as server-sent deltas
+        if os.getenv("OPENAI_API_KEY"):
+            try:
+                client = _openai_client()
+                stream = client.chat.completions.create(model=LLM_MODEL, messages=messages, stream=True)
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                yield f"[LLM ERROR - OpenAI]: {e}"
+            return
+
+        # Fallback
+        yield "[No LLM configured]"
+
+
+def _openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=LLM_BASE_URL)
 
 
 import re
@@ -0,0 +1,295 @@
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .vectorstore import VectorStore
+
+PARTITIONS = ("document", "hash")
+
+
+class ShardedVectorStore:
+    """
+    VectorStore interface over several independent shard stores.
+
+    Rows are partitioned by document_id (all chunks of a document on one shard, so document
+    filters and deletes only touch that shard) or by a hash of the vector id. Searches fan out
+    to the shards on a thread pool (FAISS releases the GIL while searching) and the per-shard
+    top-k lists are merged into a global top-k by distance.
+
+    Layout of persist_path:
+        SHARDS        {"shards": n, "partition": ...}, fixed when the store is created
+        shard-<i>/    a complete VectorStore, loadable on its own
+
+    shard_factory(i, path) builds each shard, by default a local VectorStore. Anything with
+    the same methods (add, search_batch, nearest, delete, vectors, compact, ...) works,
+    e.g. ProcessShard for a shard served by a subprocess, or a client for another node.
+    """
+
+    def __init__(self, dim: int = 1536, persist_path: str = "vectorstore", shards: int = 4,
+                 partition: str = "document", workers: int = None,
+                 shard_factory: Callable[[int, str], Any] = None, **options):
+        self.dim = dim
+        self.persist_path = persist_path
+        os.makedirs(persist_path, exist_ok=True)
+        layout_file = os.path.join(persist_path, "SHARDS")
+
+        if os.path.exists(layout_file):
+            # an existing store keeps its layout, rows would be routed to the wrong shard otherwise
+            with open(layout_file) as f:
+                layout = json.load(f)
+            shards, partition = layout["shards"], layout["partition"]
+        else:
+            if any(name == "CURRENT" or name.startswith("delta-") or name == "faiss.index"
+                   for name in os.listdir(persist_path)):
+                raise ValueError(f"{persist_path} holds an unsharded vectorstore, use another directory for shards")
+            if partition not in PARTITIONS:
+                raise ValueError(f"Unknown partition '{partition}', expected one of {PARTITIONS}")
+            if shards < 1:
+                raise ValueError("shards must be >= 1")
+            tmp = layout_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"shards": shards, "partition": partition}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, layout_file)
+
+        self.partition = partition
+        factory = shard_factory or (lambda i, path: VectorStore(dim=dim, persist_path=path, **options))
+        self.shards = [factory(i, os.path.join(persist_path, f"shard-{i:02d}")) for i in range(shards)]
+        self._pool = ThreadPoolExecutor(max_workers=workers or len(self.shards), thread_name_prefix="shard")
+
+    @property
+    def ntotal(self) -> int:
+        return sum(s.ntotal for s in self.shards)
+
+    def __len__(self) -> int:
+        return self.ntotal
+
+    @property
+    def num_deleted(self) -> int:
+        return sum(s.num_deleted for s in self.shards)
+
+    @property
+    def ids(self) -> Sequence[str]:
+        return [id_ for s in self.shards for id_ in s.ids]
+
+    @property
+    def metadatas(self) -> Sequence[Dict[str, Any]]:
+        return [m for s in self.shards for m in s.metadatas]
+
+    @property
+    def index_name(self) -> str:
+        return ",".join(sorted({s.index_name for s in self.shards}))
+
+    # routing
+    def shard_of(self, id_: str, meta: Dict[str, Any]) -> int:
+        # crc32, not hash(): python's str hash changes between processes
+        doc = (meta or {}).get("document_id")
+        if self.partition == "document" and isinstance(doc, int):
+            return doc % len(self.shards)
+        return zlib.crc32(str(id_).encode("utf-8")) % len(self.shards)
+
+    def _targets(self, filters: Dict[str, Any] = None) -> List[int]:
+        # a document filter only needs the shards those documents live on
+        docs = (filters or {}).get("document_id")
+        if self.partition != "document" or docs is None:
+            return list(range(len(self.shards)))
+        docs = list(docs) if isinstance(docs, (list, tuple, set, frozenset)) else [docs]
+        if not all(isinstance(d, int) for d in docs):
+            return list(range(len(self.shards)))
+        return sorted({d % len(self.shards) for d in docs})
+
+    def _map(self, fn: Callable[[int], Any], targets: List[int] = None) -> List[Any]:
+        # fn(shard number) for each target shard (all by default), on the pool when there is more than one
+        targets = list(range(len(self.shards))) if targets is None else targets
+        if len(targets) == 1:
+            return [fn(targets[0])]
+        return list(self._pool.map(fn, targets))
+
+    # writing
+    def add(self, embeddings: Union[np.ndarray, List[List[float]]], metadatas: List[Dict[str, Any]], ids: List[str]):
+        if len(embeddings) != len(ids) or len(embeddings) != len(metadatas):
+            raise ValueError("Length of embeddings, ids, and metadatas must match")
+        if len(embeddings) == 0:
+            return
+        embs = np.ascontiguousarray(embeddings, dtype="float32")
+        rows: Dict[int, List[int]] = {}
+        for row, (id_, meta) in enumerate(zip(ids, metadatas)):
+            rows.setdefault(self.shard_of(id_, meta), []).append(row)
+        self._map(lambda i: self.shards[i].add(embs[rows[i]], [metadatas[r] for r in rows[i]],
+                                               [ids[r] for r in rows[i]]), sorted(rows))
+
+    def delete(self, filters: Dict[str, Any]) -> List[str]:
+        if not filters:
+            raise ValueError("delete() needs a filter, use reset() to clear the store")
+        return [id_ for ids in self._map(lambda i: self.shards[i].delete(filters), self._targets(filters)) for id_ in ids]
+
+    def vectors(self, filters: Dict[str, Any] = None) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        parts = self._map(lambda i: self.shards[i].vectors(filters), self._targets(filters))
+        vectors = np.concatenate([v for v, _ in parts]) if parts else np.zeros((0, self.dim), dtype="float32")
+        return vectors, [m for _, metas in parts for m in metas]
+
+    # reading
+    def search(self, query_embedding: List[float], top_k: int = 5,
+               nprobe: int = None, ef_search: int = None,
+               filters: Dict[str, Any] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        return self.search_batch([query_embedding], top_k=top_k, nprobe=nprobe, ef_search=ef_search,
+                                 filters=filters)[0]
+
+    def search_batch(self, query_embeddings: Union[np.ndarray, List[List[float]]], top_k: int = 5,
+                     nprobe: int = None, ef_search: int = None,
+                     filters: Dict[str, Any] = None) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        """Every shard returns its top_k per query, the global top_k is the k smallest distances among them."""
+        q = np.ascontiguousarray(query_embeddings, dtype="float32")
+        if q.ndim == 1:
+            q = q.reshape(1, -1)
+        per_shard = self._map(lambda i: self.shards[i].search_batch(q, top_k=top_k, nprobe=nprobe,
+                                                                    ef_search=ef_search, filters=filters),
+                              self._targets(filters))
+        if not per_shard:
+            return [[] for _ in range(len(q))]
+        # each shard's list is already sorted, so a k-way merge is enough
+        return [list(islice(heapq.merge(*rows, key=lambda r: r[1]), top_k)) for rows in zip(*per_shard)]
+
+    def nearest(self, embeddings: np.ndarray) -> List[Tuple[float, Dict[str, Any]]]:
+        q = np.ascontiguousarray(embeddings, dtype="float32")
+        per_shard = self._map(lambda i: self.shards[i].nearest(q))
+        return [min(hits, key=lambda h: h[0]) for hits in zip(*per_shard)] if per_shard else []
+
+    # maintenance
+    def compact(self):
+        self._map(lambda i: self.shards[i].compact())
+
+    def wait_for_compaction(self):
+        self._map(lambda i: self.shards[i].wait_for_compaction())
+
+    def rebuild_index(self, index_type: str = None, quantization: str = None):
+        self._map(lambda i: self.shards[i].rebuild_index(index_type, quantization))
+
+    def reset(self):
+        self._map(lambda i: self.shards[i].reset())
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for shard in self.shards:
+            if hasattr(shard, "close"):
+                shard.close()
+
+
+def _serve_shard(conn, dim: int, persist_path: str, options: Dict[str, Any]):
+    # subprocess side of ProcessShard: one VectorStore, requests answered in order until None / EOF
+    store = VectorStore(dim=dim, persist_path=persist_path, **options)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        name, args, kwargs = request
+        try:
+            attr = getattr(store, name)
+            result = attr(*args, **kwargs) if callable(attr) else attr
+            if name in ("ids", "metadatas"):
+                result = list(result)  # row views hold the whole MetaStore
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, e))
+    store.wait_for_compaction()
+    conn.close()
+
+
+class ProcessShard:
+    """
+    A VectorStore running in its own subprocess, driven over a pipe.
+
+    Has the methods ShardedVectorStore uses, so it drops in through shard_factory:
+        ShardedVectorStore(dim, path, shard_factory=lambda i, p: ProcessShard(dim, p, **options))
+    Arguments and results are pickled across the pipe; exceptions raised by the store are re-raised here.
+    The child is spawned, not forked, so it never inherits FAISS threads or open files.
+    """
+
+    def __init__(self, dim: int, persist_path: str, **options):
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=_serve_shard, args=(child, dim, persist_path, options),
+                                    name=f"shard:{os.path.basename(persist_path)}", daemon=True)
+        self._process.start()
+        child.close()
+        self._lock = threading.Lock()  # one request in flight per pipe
+
+    def _call(self, name: str, *args, **kwargs):
+        with self._lock:
+            self._conn.send((name, args, kwargs))
+            ok, result = self._conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    @property
+    def ntotal(self) -> int:
+        return self._call("ntotal")
+
+    @property
+    def num_deleted(self) -> int:
+        return self._call("num_deleted")
+
+    @property
+    def ids(self) -> Sequence[str]:
+        return self._call("ids")
+
+    @property
+    def metadatas(self) -> Sequence[Dict[str, Any]]:
+        return self._call("metadatas")
+
+    @property
+    def index_name(self) -> str:
+        return self._call("index_name")
+
+    def add(self, embeddings, metadatas: List[Dict[str, Any]], ids: List[str]):
+        self._call("add", np.ascontiguousarray(embeddings, dtype="float32"), list(metadatas), list(ids))
+
+    def delete(self, filters: Dict[str, Any]) -> List[str]:
+        return self._call("delete", filters)
+
+    def vectors(self, filters: Dict[str, Any] = None) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        return self._call("vectors", filters)
+
+    def search(self, query_embedding, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+               filters: Dict[str, Any] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        return self._call("search", query_embedding, top_k=top_k, nprobe=nprobe, ef_search=ef_search, filters=filters)
+
+    def search_batch(self, query_embeddings, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+                     filters: Dict[str, Any] = None) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        return self._call("search_batch", np.ascontiguousarray(query_embeddings, dtype="float32"), top_k=top_k,
+                          nprobe=nprobe, ef_search=ef_search, filters=filters)
+
+    def nearest(self, embeddings: np.ndarray) -> List[Tuple[float, Dict[str, Any]]]:
+        return self._call("nearest", np.ascontiguousarray(embeddings, dtype="float32"))
+
+    def compact(self):
+        self._call("compact")
+
+    def wait_for_compaction(self):
+        self._call("wait_for_compaction")
+
+    def rebuild_index(self, index_type: str = None, quantization: str = None):
+        self._call("rebuild_index", index_type, quantization)
+
+    def reset(self):
+        self._call("reset")
+
+    def close(self):
+        if self._process.is_alive():
+            with self._lock:
+                self._conn.send(None)
+            self._process.join()
+        self._conn.close()
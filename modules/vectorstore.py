@@ -3,71 +3,675 @@ import numpy as np
 import os
 import pickle
 import json
-from typing import List, Dict, Any, Tuple
+import re
+import shutil
+import struct
+import threading
+import zlib
+from typing import List, Dict, Any, Sequence, Set, Tuple, Union
+
+from . import index_factory
+from .metastore import MetaStore
+
+# delta log record: magic, row count, dim, metadata length, then vectors + pickled (ids, metadatas) + crc32.
+# Delete records (VDEL) carry no vectors, only the pickled filter they matched with.
+_RECORD_HEADER = struct.Struct("<4sIIQ")
+_RECORD_CRC = struct.Struct("<I")
+_ADD_MAGIC = b"VADD"
+_DEL_MAGIC = b"VDEL"
+
+# compaction kicks in once the delta logs grow past either limit
+COMPACT_BYTES = int(os.getenv("VECTORSTORE_COMPACT_BYTES", str(64 * 1024 * 1024)))
+COMPACT_RECORDS = int(os.getenv("VECTORSTORE_COMPACT_RECORDS", "256"))
+FSYNC = os.getenv("VECTORSTORE_FSYNC", "1") != "0"
+# deleted vectors stay in the index as tombstones (skipped by searches) until they reach this
+# fraction of the store; the next compaction then rewrites the index without them
+TOMBSTONE_RATIO = float(os.getenv("VECTORSTORE_TOMBSTONE_RATIO", "0.2"))
+
+# ANN settings: stores start as a flat index and get rebuilt as index_type past promote_at vectors
+INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+PROMOTE_AT = int(os.getenv("VECTOR_INDEX_PROMOTE_AT", "50000"))
+NPROBE = int(os.getenv("VECTOR_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "64"))
+# compressed storage (none | fp16 | sq8 | pq), applied at promotion like index_type; the
+# top_k * RERANK candidates are re-scored against exact vectors memory-mapped from disk
+QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+RERANK = int(os.getenv("VECTOR_RERANK", "4"))
+# filtered searches matching at most this many vectors skip the index and compare them exactly
+FILTER_EXACT_MAX = int(os.getenv("VECTOR_FILTER_EXACT_MAX", "2048"))
+# rows copied per block when streaming vectors out of a checkpoint
+_BLOCK = 65536
+
+
+def _blocks(array: np.ndarray, size: int = _BLOCK):
+    for start in range(0, len(array), size):
+        yield array[start:start + size]
+
+
+def _fsync_dir(path: str):
+    # makes renames durable on POSIX, no-op where directories can't be opened
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
 
 class VectorStore:
-    def __init__(self, dim: int = 1536, persist_path: str = "vectorstore"):
+    """
+    FAISS index + metadata persisted as a base checkpoint plus append-only delta logs.
+
+    Layout of persist_path:
+        CURRENT               generation of the active checkpoint
+        ckpt-<gen>/           faiss.index + columnar meta/, covers every delta log older than <gen>
+        delta-<gen>.log       appended (and fsynced) on every add
+        faiss.index/meta.pkl  legacy single-file store, used as base until the first checkpoint
+
+    The checkpoint index is memory-mapped read-only; rows added since then live in a
+    small in-RAM flat "tail" index that is searched alongside it and folded in on compaction.
+
+    index_type picks the ANN backend (flat, ivf_flat, ivf_pq, hnsw) and quantization the
+    vector codes (none, fp16, sq8, pq). The store stays a brute-force flat index until it
+    holds promote_at vectors, then gets trained/rebuilt as index_type / quantization during
+    the next compaction. A quantized checkpoint also keeps the exact float32 vectors in
+    vectors.npy, memory-mapped and only read to re-rank the top_k * rerank candidates.
+
+    delete() tombstones rows: they are excluded from every search through an ID selector
+    and physically dropped (positions shift) by the first compaction after they exceed
+    tombstone_ratio of the store.
+
+    read_only=True opens a store another process may be writing to: the delta logs are
+    replayed up to the last complete record but never truncated or cleaned up, and every
+    write (add, delete, compact, ...) raises.
+    """
+
+    def __init__(self, dim: int = 1536, persist_path: str = "vectorstore",
+                 compact_bytes: int = None, compact_records: int = None,
+                 index_type: str = None, promote_at: int = None,
+                 nprobe: int = None, ef_search: int = None, tombstone_ratio: float = None,
+                 quantization: str = None, rerank: int = None, read_only: bool = False):
         self.dim = dim
         self.persist_path = persist_path
-        self.ids: List[str] = []
-        self.metadatas: List[Dict[str, Any]] = []
+        self.read_only = read_only
+        self.compact_bytes = compact_bytes or COMPACT_BYTES
+        self.compact_records = compact_records or COMPACT_RECORDS
+        self.index_type = index_type or INDEX_TYPE
+        if self.index_type not in index_factory.INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{self.index_type}', expected one of {index_factory.INDEX_TYPES}")
+        self.promote_at = PROMOTE_AT if promote_at is None else promote_at
+        self.quantization = quantization or QUANTIZATION
+        if self.quantization not in index_factory.QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{self.quantization}', expected one of {index_factory.QUANTIZATIONS}")
+        self.rerank = RERANK if rerank is None else rerank
+        self.nprobe = nprobe or NPROBE
+        self.ef_search = ef_search or EF_SEARCH
+        self.tombstone_ratio = TOMBSTONE_RATIO if tombstone_ratio is None else tombstone_ratio
 
-        os.makedirs(self.persist_path, exist_ok=True)
+        if read_only:
+            if not os.path.isdir(self.persist_path):
+                raise FileNotFoundError(f"No vectorstore at {self.persist_path}")
+        else:
+            os.makedirs(self.persist_path, exist_ok=True)
         self.index_file = os.path.join(self.persist_path, "faiss.index")
         self.meta_file = os.path.join(self.persist_path, "meta.pkl")
+        self.current_file = os.path.join(self.persist_path, "CURRENT")
+
+        # _compact_lock is always taken before _lock
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._compactor: threading.Thread = None
+        self._log = None
+        self._delta_bytes = 0
+        self._delta_records = 0
+        # tombstoned positions, and the cached live-row mask built from them
+        self._deleted: Set[int] = set()
+        self._live: np.ndarray = None
+        # exact vectors of a quantized base index (memory-mapped vectors.npy), None otherwise
+        self._raw: np.ndarray = None
+
+        self._gen = self._load_base()
+        self._tail = faiss.IndexFlatL2(self.index.d)
+        self._log_gen = self._gen
+        for gen in self._delta_gens():
+            if gen >= self._gen:
+                self._replay(gen)
+                self._log_gen = gen
+        if not read_only:
+            self._cleanup(self._gen)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + self._tail.ntotal
 
+    def __len__(self) -> int:
+        return self.ntotal
+
+    @property
+    def num_deleted(self) -> int:
+        return len(self._deleted)
+
+    @property
+    def ids(self) -> Sequence[str]:
+        return self.meta.ids
+
+    @property
+    def metadatas(self) -> Sequence[Dict[str, Any]]:
+        return self.meta.metadatas
+
+    @property
+    def index_name(self) -> str:
+        # FAISS class of the checkpoint index, e.g. IndexHNSWFlat
+        return type(self.index).__name__
+
+    # loading
+    def _ckpt_dir(self, gen: int) -> str:
+        return os.path.join(self.persist_path, f"ckpt-{gen:06d}")
+
+    def _delta_file(self, gen: int) -> str:
+        return os.path.join(self.persist_path, f"delta-{gen:06d}.log")
+
+    def _delta_gens(self) -> List[int]:
+        gens = []
+        for name in os.listdir(self.persist_path):
+            m = re.fullmatch(r"delta-(\d+)\.log", name)
+            if m:
+                gens.append(int(m.group(1)))
+        return sorted(gens)
+
+    @staticmethod
+    def _read_index(path: str) -> faiss.Index:
+        # mmap keeps cold start and RSS independent of the index size
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+
+    @staticmethod
+    def _read_raw(base: str) -> np.ndarray:
+        path = os.path.join(base, "vectors.npy")
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+    @staticmethod
+    def _read_meta(base: str) -> MetaStore:
+        if os.path.isdir(os.path.join(base, "meta")):
+            return MetaStore.load(os.path.join(base, "meta"))
+        with open(os.path.join(base, "meta.pkl"), "rb") as f:
+            return MetaStore.from_rows(*pickle.load(f))
+
+    def _load_base(self) -> int:
+        if os.path.exists(self.current_file):
+            with open(self.current_file) as f:
+                gen = int(f.read().strip())
+            base = self._ckpt_dir(gen)
+            self.index = self._read_index(os.path.join(base, "faiss.index"))
+            self.meta = self._read_meta(base)
+            tombstones = os.path.join(base, "tombstones.npy")
+            if os.path.exists(tombstones):
+                self._deleted = set(np.load(tombstones).tolist())
+            self._raw = self._read_raw(base)
+            return gen
+
+        self.meta = MetaStore()
         if os.path.exists(self.index_file):
-            self.index = faiss.read_index(self.index_file)
+            self.index = self._read_index(self.index_file)
             if os.path.exists(self.meta_file):
-                with open(self.meta_file, "rb") as f:
-                    self.ids, self.metadatas = pickle.load(f)
+                self.meta = self._read_meta(self.persist_path)
         else:
             self.index = faiss.IndexFlatL2(self.dim)
+        return 0
+
+    def _replay(self, gen: int):
+        # re-applies every complete record; a torn tail from a crash is cut off (just skipped when read_only)
+        path = self._delta_file(gen)
+        good = 0
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                magic, n, dim, meta_len = _RECORD_HEADER.unpack(header)
+                if magic not in (_ADD_MAGIC, _DEL_MAGIC):
+                    break
+                payload = f.read(n * dim * 4 + meta_len)
+                crc = f.read(_RECORD_CRC.size)
+                if len(payload) < n * dim * 4 + meta_len or len(crc) < _RECORD_CRC.size:
+                    break
+                if _RECORD_CRC.unpack(crc)[0] != zlib.crc32(payload):
+                    break
+                if magic == _DEL_MAGIC:
+                    # the filter matches the same rows now as when it was logged
+                    self._tombstone(np.flatnonzero(self.meta.mask(pickle.loads(payload))))
+                else:
+                    embs = np.frombuffer(payload, dtype="float32", count=n * dim).reshape(n, dim)
+                    ids, metadatas = pickle.loads(payload[n * dim * 4:])
+                    self._tail.add(embs)
+                    self.meta.append(ids, metadatas)
+                good = f.tell()
+                self._delta_records += 1
+        if good < os.path.getsize(path) and not self.read_only:
+            with open(path, "r+b") as f:
+                f.truncate(good)
+        self._delta_bytes += good
+
+    def _open_log(self, gen: int):
+        # opened lazily so read-only users never create an empty log
+        if self._log is None:
+            self._log = open(self._delta_file(gen), "ab")
+        return self._log
 
-    def add(self, embeddings: List[List[float]], metadatas: List[Dict[str, Any]], ids: List[str]):
+    # writing
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError(f"Vectorstore at {self.persist_path} was opened read_only")
+
+    def add(self, embeddings: Union[np.ndarray, List[List[float]]], metadatas: List[Dict[str, Any]], ids: List[str]):
         """
         Adding embeddings + metadata to FAISS index.
+        Accepts the float32 matrix from embed_texts as-is (no copy).
+        Only the new rows are written to disk (appended to the delta log).
         """
         if len(embeddings) != len(ids) or len(embeddings) != len(metadatas):
             raise ValueError("Length of embeddings, ids, and metadatas must match")
+        self._check_writable()
+        if len(embeddings) == 0:
+            return
+
+        embs = np.ascontiguousarray(embeddings, dtype="float32")
+        if embs.ndim != 2 or embs.shape[1] != self.index.d:
+            raise ValueError(f"Embedding dimension {embs.shape[-1]} does not match index dimension {self.index.d}")
+        with self._lock:
+            self._append_record(embs, metadatas, ids)
+            self._tail.add(embs)
+            self.meta.append(ids, metadatas)
+            self._maybe_compact()
+
+    def _append_record(self, embs: np.ndarray, metadatas: List[Dict[str, Any]], ids: List[str]):
+        meta = pickle.dumps((list(ids), list(metadatas)), protocol=pickle.HIGHEST_PROTOCOL)
+        n, dim = embs.shape
+        self._write_record(_ADD_MAGIC, n, dim, embs.tobytes() + meta, len(meta))
+
+    def _write_record(self, magic: bytes, n: int, dim: int, payload: bytes, meta_len: int):
+        record = (_RECORD_HEADER.pack(magic, n, dim, meta_len) + payload
+                  + _RECORD_CRC.pack(zlib.crc32(payload)))
+        log = self._open_log(self._log_gen)
+        log.write(record)
+        log.flush()
+        if FSYNC:
+            os.fsync(log.fileno())
+        self._delta_bytes += len(record)
+        self._delta_records += 1
 
-        embs = np.array(embeddings, dtype="float32")
-        self.index.add(embs)
-        self.ids.extend(ids)
-        self.metadatas.extend(metadatas)
-        self._save()
-
-    def search(self, query_embedding: List[float], top_k: int = 5) -> List[Tuple[str, float, Dict[str, Any]]]:
-        if self.index.ntotal == 0:
-            return []
-        q_emb = np.array([query_embedding], dtype="float32")
-        distances, indices = self.index.search(q_emb, top_k)
-        results: List[Tuple[str, float, Dict[str, Any]]] = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx >= 0 and idx < len(self.ids):
-                meta = self.metadatas[idx] if idx < len(self.metadatas) else {}
-                results.append((self.ids[idx], float(dist), meta))
-        return results
+    def delete(self, filters: Dict[str, Any]) -> List[str]:
+        """
+        Tombstones every live row matching filters (same keys as search) and returns their ids.
+        The delete is logged as its filter, so replay re-applies it to the same rows.
+        """
+        if not filters:
+            raise ValueError("delete() needs a filter, use reset() to clear the store")
+        self._check_writable()
+        with self._lock:
+            hits = np.flatnonzero(self.meta.mask(filters) & self._live_mask())
+            if len(hits) == 0:
+                return []
+            ids = [self.meta.get_id(int(p)) for p in hits]
+            payload = pickle.dumps(dict(filters), protocol=pickle.HIGHEST_PROTOCOL)
+            self._write_record(_DEL_MAGIC, 0, 0, payload, len(payload))
+            self._tombstone(hits)
+            self._maybe_compact()
+        return ids
+
+    def vectors(self, filters: Dict[str, Any] = None) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """(vectors, metadatas) of the live rows matching filters, or of every live row (approximate for PQ)."""
+        with self._lock:
+            live = self._live_mask()
+            positions = np.flatnonzero(self.meta.mask(filters) & live if filters else live)
+            return self._vectors_at(positions), [self.meta.get_meta(int(p)) for p in positions]
+
+    def _tombstone(self, positions: np.ndarray):
+        self._deleted.update(int(p) for p in positions)
+        self._live = None
+
+    def _live_mask(self) -> np.ndarray:
+        # rebuilt lazily after deletes / adds
+        if self._live is None or len(self._live) != self.ntotal:
+            live = np.ones(self.ntotal, dtype=bool)
+            if self._deleted:
+                live[np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted))] = False
+            self._live = live
+        return self._live
+
+    def _tombstone_fraction(self) -> float:
+        return len(self._deleted) / self.ntotal if self.ntotal else 0.0
+
+    def search(self, query_embedding: List[float], top_k: int = 5,
+               nprobe: int = None, ef_search: int = None,
+               filters: Dict[str, Any] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        top_k nearest vectors as (id, distance, metadata).
+        filters restricts the search to matching rows (see MetaStore.mask), applied inside
+        FAISS so top_k filtered hits come back without over-fetching.
+        """
+        return self.search_batch([query_embedding], top_k=top_k, nprobe=nprobe, ef_search=ef_search,
+                                 filters=filters)[0]
+
+    def search_batch(self, query_embeddings: Union[np.ndarray, List[List[float]]], top_k: int = 5,
+                     nprobe: int = None, ef_search: int = None,
+                     filters: Dict[str, Any] = None) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        """search() for N queries with a single FAISS call; one result list per query row."""
+        q = np.ascontiguousarray(query_embeddings, dtype="float32")
+        if q.ndim == 1:
+            q = q.reshape(1, -1)
+        if self.ntotal == 0 or len(q) == 0:
+            return [[] for _ in range(len(q))]
+        with self._lock:
+            mask = self.meta.mask(filters) if filters else None
+            if self._deleted:
+                mask = self._live_mask() if mask is None else mask & self._live_mask()
+            distances, indices = self._search_segments(q, top_k, nprobe, ef_search, mask=mask)
+            batch: List[List[Tuple[str, float, Dict[str, Any]]]] = []
+            for row_dist, row_idx in zip(distances, indices):
+                results = []
+                for dist, idx in zip(row_dist, row_idx):
+                    if idx >= 0 and idx < len(self.meta):
+                        results.append((self.meta.get_id(idx), float(dist), self.meta.get_meta(idx)))
+                batch.append(results)
+        return batch
 
+    def nearest(self, embeddings: np.ndarray) -> List[Tuple[float, Dict[str, Any]]]:
+        """(distance, metadata) of the closest stored vector for each row, (inf, {}) when the store is empty."""
+        q = np.ascontiguousarray(embeddings, dtype="float32")
+        if self.ntotal == 0 or len(q) == 0:
+            return [(float("inf"), {}) for _ in range(len(q))]
+        with self._lock:
+            distances, indices = self._search_segments(q, 1, mask=self._live_mask() if self._deleted else None)
+            return [(float(d[0]), self.meta.get_meta(int(i[0])) if i[0] >= 0 else {})
+                    for d, i in zip(distances, indices)]
+
+    def _search_segments(self, q: np.ndarray, top_k: int, nprobe: int = None, ef_search: int = None,
+                         mask: np.ndarray = None):
+        # searches base + tail and merges them into positions over the whole store
+        if mask is not None:
+            hits = np.flatnonzero(mask)
+            if len(hits) == 0:
+                return np.full((len(q), top_k), np.inf, dtype="float32"), np.full((len(q), top_k), -1, dtype="int64")
+            if len(hits) <= FILTER_EXACT_MAX:
+                return self._search_subset(q, top_k, hits)
+
+        nb = self.index.ntotal
+        base_sel, base_buf = index_factory.selector_for(mask[:nb]) if mask is not None else (None, None)
+        params = index_factory.search_params(self.index, nprobe or self.nprobe, ef_search or self.ef_search,
+                                             selector=base_sel)
+        if self._raw is not None and self.rerank >= 1:
+            distances, indices = self.index.search(q, top_k * self.rerank, params=params)
+            distances, indices = self._rerank(q, indices, top_k)
+        else:
+            distances, indices = self.index.search(q, top_k, params=params)
+        if self._tail.ntotal == 0:
+            return distances, indices
+        tail_sel, tail_buf = index_factory.selector_for(mask[nb:]) if mask is not None else (None, None)
+        t_dist, t_idx = self._tail.search(q, top_k, params=index_factory.search_params(self._tail, selector=tail_sel))
+        del base_buf, tail_buf
+        t_idx = np.where(t_idx >= 0, t_idx + nb, -1)
+        all_dist = np.concatenate([distances, t_dist], axis=1)
+        all_idx = np.concatenate([indices, t_idx], axis=1)
+        # missing hits come back as -1 with +inf/max distance, so they sort last
+        all_dist = np.where(all_idx >= 0, all_dist, np.inf)
+        order = np.argsort(all_dist, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(all_dist, order, axis=1), np.take_along_axis(all_idx, order, axis=1)
+
+    def _rerank(self, q: np.ndarray, candidates: np.ndarray, top_k: int):
+        # exact squared L2 to the candidates' full-precision vectors; only those rows get paged in
+        valid = candidates >= 0
+        rows = np.asarray(self._raw[np.where(valid, candidates, 0).ravel()], dtype="float32")
+        rows = rows.reshape(len(q), candidates.shape[1], -1)
+        distances = ((rows - q[:, None, :]) ** 2).sum(axis=2)
+        distances = np.where(valid, distances, np.inf)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :top_k]
+        return (np.take_along_axis(distances, order, axis=1).astype("float32"),
+                np.take_along_axis(np.where(valid, candidates, -1), order, axis=1))
+
+    def _search_subset(self, q: np.ndarray, top_k: int, positions: np.ndarray):
+        # exact search over a few matching rows, cheaper than walking the ANN index for them
+        vectors = self._vectors_at(positions)
+        k = min(top_k, len(positions))
+        distances, local = faiss.knn(q, vectors, k)
+        indices = np.where(local >= 0, positions[np.maximum(local, 0)], -1)
+        if k < top_k:
+            distances = np.pad(distances, ((0, 0), (0, top_k - k)), constant_values=np.inf)
+            indices = np.pad(indices, ((0, 0), (0, top_k - k)), constant_values=-1)
+        return distances, indices
+
+    def _vectors_at(self, positions: np.ndarray) -> np.ndarray:
+        # positions must be sorted
+        nb = self.index.ntotal
+        base, tail = positions[positions < nb], positions[positions >= nb] - nb
+        base_vectors = (np.asarray(self._raw[base], dtype="float32") if self._raw is not None
+                        else index_factory.reconstruct_ids(self.index, base))
+        return np.concatenate([base_vectors, index_factory.reconstruct_ids(self._tail, tail)])
+
+    def _all_vectors(self, start: int = 0) -> np.ndarray:
+        # copies of the stored vectors from position start (base then tail)
+        nb = self.index.ntotal
+        parts = []
+        if start < nb:
+            parts.append(np.array(self._raw[start:], dtype="float32") if self._raw is not None
+                         else index_factory.reconstruct_all(self.index, start=start))
+        parts.append(index_factory.reconstruct_all(self._tail, start=max(0, start - nb)))
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    # index promotion
+    def _needs_promotion(self) -> bool:
+        return ((self.index_type != "flat" or self.quantization != "none")
+                and index_factory.index_type_of(self.index) == "flat"
+                and index_factory.quantization_of(self.index) == "none"
+                and self.ntotal >= self.promote_at)
+
+    def rebuild_index(self, index_type: str = None, quantization: str = None):
+        """
+        Retrains the index as index_type / quantization from the stored vectors and checkpoints it.
+        Also the migration path for an existing flat faiss.index.
+        """
+        self._check_writable()
+        with self._compact_lock:
+            self._rebuild(index_type or self.index_type, quantization or self.quantization)
+            self._compact_locked()
+
+    def _rebuild(self, index_type: str, quantization: str = "none"):
+        # training runs outside _lock so searches and adds keep going meanwhile
+        with self._lock:
+            n0 = self.ntotal
+            vectors = self._all_vectors()
+            # exact unless they were decoded from an already quantized index
+            exact = self._raw is not None or index_factory.quantization_of(self.index) == "none"
+        new_index = index_factory.build_index(index_type, self.index.d, ntrain=n0, quantization=quantization)
+        index_factory.train(new_index, vectors)
+        new_index.add(vectors)
+        if not (exact and index_factory.quantization_of(new_index) != "none"):
+            vectors = None
+        with self._lock:
+            # rows added while training stay in the tail
+            leftover = self._all_vectors(start=n0)
+            self.index = new_index
+            self._raw = vectors  # written to vectors.npy by the checkpoint that follows
+            self._tail = faiss.IndexFlatL2(new_index.d)
+            self._tail.add(leftover)
+
+    # checkpointing
+    def wait_for_compaction(self):
+        """Blocks until the background compaction started by add / delete (if any) has finished."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def _maybe_compact(self):
+        if (self._delta_bytes < self.compact_bytes and self._delta_records < self.compact_records
+                and not self._needs_promotion() and self._tombstone_fraction() < self.tombstone_ratio):
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="vectorstore-compact", daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """
+        Folds the delta logs into a new base checkpoint, dropping tombstoned rows once
+        they exceed tombstone_ratio. New adds keep going to a fresh delta log while the
+        checkpoint is written.
+        """
+        self._check_writable()
+        with self._compact_lock:
+            if self._needs_promotion():
+                self._rebuild(self.index_type, self.quantization)
+            self._compact_locked()
+
+    def _compact_locked(self):
+        with self._lock:
+            new_gen = self._log_gen + 1
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._log_gen = new_gen
+            n0 = self.ntotal
+            purge = bool(self._deleted) and self._tombstone_fraction() >= self.tombstone_ratio
+            if purge:
+                # rewrite the index from the live rows; IVF / PQ / HNSW keep their trained parameters.
+                # Only the small tail is copied here, the base is streamed from its mmap below
+                keep = self._live_mask().copy()
+                base_index, base_raw = self.index, self._raw
+                nb = base_index.ntotal
+                if base_raw is None and isinstance(base_index, faiss.IndexIVF):
+                    base_index.make_direct_map()
+                tail_live = index_factory.reconstruct_all(self._tail)[keep[nb:]]
+                merged = index_factory.empty_like(self.index)
+                meta_snapshot = self.meta.snapshot(keep=keep)
+                tombstones = None
+                raw_parts = ([self._live_blocks(base_index, base_raw, keep[:nb]), tail_live]
+                             if base_raw is not None else None)
+            else:
+                merged = index_factory.owned_copy(self.index)
+                tail_vectors = index_factory.reconstruct_all(self._tail)
+                merged.add(tail_vectors)
+                meta_snapshot = self.meta.snapshot()
+                tombstones = np.array(sorted(self._deleted), dtype=np.int64)
+                # the old mmapped file stays readable until _cleanup, after the swap
+                raw_parts = [self._raw, tail_vectors] if self._raw is not None else None
+            self._delta_bytes = 0
+            self._delta_records = 0
+
+        if purge:
+            # the base only changes under _compact_lock, which is held, so this runs outside _lock
+            for block in self._live_blocks(base_index, base_raw, keep[:nb]):
+                merged.add(block)
+            merged.add(tail_live)
+            del tail_live
+        self._write_checkpoint(new_gen, merged, meta_snapshot, tombstones, raw_parts)
+        del merged, meta_snapshot, raw_parts
+
+        with self._lock:
+            # swap in the mmapped checkpoint, keeping rows added while it was written
+            leftover = self._all_vectors(start=n0)
+            ids, metadatas = self.meta.rows(start=n0)
+            if purge:
+                # rows deleted while the checkpoint was written move down with everything else
+                shift = np.cumsum(~keep)
+                removed = int(shift[-1]) if n0 else 0
+                self._deleted = {p - removed if p >= n0 else p - int(shift[p])
+                                 for p in self._deleted if p >= n0 or keep[p]}
+            base = self._ckpt_dir(new_gen)
+            self.index = self._read_index(os.path.join(base, "faiss.index"))
+            self.meta = self._read_meta(base)
+            self.meta.append(ids, metadatas)
+            self._raw = self._read_raw(base)
+            self._tail = faiss.IndexFlatL2(self.index.d)
+            self._tail.add(leftover)
+            self._live = None
+            self._gen = new_gen
+            self._cleanup(new_gen)
+
+    @staticmethod
+    def _live_blocks(index: faiss.Index, raw: np.ndarray, keep: np.ndarray):
+        # kept rows of a base checkpoint, block by block from vectors.npy if there is one, else the index
+        for start in range(0, index.ntotal, _BLOCK):
+            n = min(_BLOCK, index.ntotal - start)
+            block = (np.asarray(raw[start:start + n], dtype="float32") if raw is not None
+                     else index_factory.reconstruct_all(index, start=start, n=n))
+            yield block[keep[start:start + n]]
+
+    def _write_checkpoint(self, gen: int, index: faiss.Index, meta_snapshot: Dict[str, Any],
+                          tombstones: np.ndarray = None, raw_parts: List[Any] = None):
+        final = self._ckpt_dir(gen)
+        tmp = final + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        faiss.write_index(index, os.path.join(tmp, "faiss.index"))
+        MetaStore.write(os.path.join(tmp, "meta"), meta_snapshot)
+        if tombstones is not None and len(tombstones):
+            np.save(os.path.join(tmp, "tombstones.npy"), tombstones)
+        if raw_parts is not None:
+            # parts are arrays or iterators of blocks, copied block by block so the
+            # full-precision vectors never have to fit in RAM at once (one row per index row)
+            raw = np.lib.format.open_memmap(os.path.join(tmp, "vectors.npy"), mode="w+", dtype="float32",
+                                            shape=(index.ntotal, index.d))
+            pos = 0
+            for part in raw_parts:
+                for block in (_blocks(part) if isinstance(part, np.ndarray) else part):
+                    raw[pos:pos + len(block)] = block
+                    pos += len(block)
+            raw.flush()
+            del raw
+        for root, _, files in os.walk(tmp):
+            for name in files:
+                with open(os.path.join(root, name), "rb+") as f:
+                    os.fsync(f.fileno())
+            _fsync_dir(root)
+
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+
+        # flipping CURRENT is the commit point of the checkpoint
+        current_tmp = self.current_file + ".tmp"
+        with open(current_tmp, "w") as f:
+            f.write(str(gen))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_tmp, self.current_file)
+        _fsync_dir(self.persist_path)
+
+    def _cleanup(self, gen: int):
+        for name in os.listdir(self.persist_path):
+            m = re.fullmatch(r"(ckpt|delta)-(\d+)(\.log)?", name)
+            if m and int(m.group(2)) < gen:
+                path = os.path.join(self.persist_path, name)
+                if os.path.isdir(path):
+                    # still-mapped files can't be removed on Windows; retried on the next cleanup
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
 
     def _save(self):
         # Persist FAISS index and metadata to disk
-        faiss.write_index(self.index, self.index_file)
-        with open(self.meta_file, "wb") as f:
-            pickle.dump((self.ids, self.metadatas), f)
+        self.compact()
 
     def reset(self):
         # Clear the vectorstore completely.
-        self.index = faiss.IndexFlatL2(self.dim)
-        self.ids = []
-        self.metadatas = []
-        self._save()
+        self._check_writable()
+        with self._compact_lock, self._lock:
+            self.index = faiss.IndexFlatL2(self.dim)
+            self._tail = faiss.IndexFlatL2(self.dim)
+            self.meta = MetaStore()
+            self._raw = None
+            self._deleted = set()
+            self._live = None
+            self._compact_locked()
 
 
 # singleton instance for easy reuse
 vector_store_instance: VectorStore = None
 
-def init_vectorstore(dim: int = 1536, persist_path: str = "vectorstore") -> VectorStore:
+def init_vectorstore(dim: int = 1536, persist_path: str = "vectorstore", **options) -> VectorStore:
     global vector_store_instance
-    vector_store_instance = VectorStore(dim=dim, persist_path=persist_path)
+    vector_store_instance = VectorStore(dim=dim, persist_path=persist_path, **options)
     return vector_store_instance
@@ -1,6 +1,24 @@
 document.addEventListener("DOMContentLoaded", () => {
   const form = document.getElementById("chat-form");
   const chatBox = document.getElementById("chat-box");
+  const jobStatus = document.getElementById("job-status");
+
+  // Poll ingestion job progress after an upload
+  if (jobStatus && jobStatus.dataset.jobId) {
+    const poll = async () => {
+      const res = await fetch(`/jobs/${jobStatus.dataset.jobId}`);
+      if (!res.ok) return;
+      const job = await res.json();
+      if (job.status === "done" || job.status === "failed") {
+        jobStatus.textContent = job.message;
+        return;
+      }
+      const pct = Math.round((job.progress || 0) * 100);
+      jobStatus.textContent = `Ingesting (${job.stage || job.status}) ${pct}%...`;
+      setTimeout(poll, 1000);
+    };
+    poll();
+  }
 
   if (form) {
     form.addEventListener("submit", async (e) => {
@@ -18,21 +36,43 @@ document.addEventListener("DOMContentLoaded", () => {
       chatBox.scrollTop = chatBox.scrollHeight;
       queryInput.value = "";
 
-      // Send query to Flask
-      const res = await fetch("/chat", {
+      // Bot message bubble, filled in as tokens arrive
+      const botBubble = document.createElement("div");
+      botBubble.className = "chat-message bot";
+      chatBox.appendChild(botBubble);
+
+      // Send query to Flask, answer streamed back as server-sent events
+      const res = await fetch("/chat/stream", {
         method: "POST",
         headers: { "Content-Type": "application/x-www-form-urlencoded" },
         body: `query=${encodeURIComponent(query)}`
       });
 
-      const data = await res.json();
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
 
-      // Bot message bubble
-      const botBubble = document.createElement("div");
-      botBubble.className = "chat-message bot";
-      botBubble.textContent = data.answer;
-      chatBox.appendChild(botBubble);
-      chatBox.scrollTop = chatBox.scrollHeight;
+        // events are separated by a blank line
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+          const raw = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          let event = "message";
+          let data = "";
+          for (const line of raw.split("\n")) {
+            if (line.startsWith("event: ")) event = line.slice(7);
+            else if (line.startsWith("data: ")) data += line.slice(6);
+          }
+          if (event === "token" || event === "error") {
+            botBubble.textContent += JSON.parse(data);
+            chatBox.scrollTop = chatBox.scrollHeight;
+          }
+        }
+      }
     });
   }
 });
@@ -0,0 +1,84 @@
+import pytest
+
+
+def _write_pdf(path, page_texts):
+    # minimal hand-written PDF: one Helvetica text line per page, "" gives an empty page
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET" if text else ""
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+
+
+@pytest.fixture
+def make_pdf():
+    """make_pdf(path, page_texts) writes a small text-layer PDF, one page per text."""
+    return _write_pdf
+
+
+@pytest.fixture
+def pipeline_db(monkeypatch):
+    """
+    Session factory of an in-memory database that modules.rag_pipeline uses instead of
+    instance/rag.db (RAGPipeline's init_db() is patched out too).
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from modules import rag_pipeline
+    from modules.db import Base
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(rag_pipeline, "SessionLocal", Session)
+    monkeypatch.setattr(rag_pipeline, "init_db", lambda: None)
+    yield Session
+    engine.dispose()
+
+
+class FakeEmbedder:
+    # 3-d vectors from vector(text), [len(text), 0, 0] by default; query overrides get_embedding's vector
+    def __init__(self):
+        self.calls = []
+        self.vector = lambda text: [len(text), 0, 0]
+        self.query = None
+
+    @property
+    def texts(self):
+        return [t for call in self.calls for t in call]
+
+    def __call__(self, texts, **kwargs):
+        import numpy as np
+        self.calls.append(list(texts))
+        return np.array([self.vector(t) for t in texts], dtype="float32").reshape(-1, 3)
+
+    def embed_one(self, text, **kwargs):
+        return [float(v) for v in (self.query or self.vector(text))]
+
+
+@pytest.fixture
+def fake_embed(monkeypatch):
+    """Stands in for the embedding model in modules.rag_pipeline, recording every batch in .calls."""
+    from modules import rag_pipeline
+
+    embedder = FakeEmbedder()
+    monkeypatch.setattr(rag_pipeline, "embed_texts", embedder)
+    monkeypatch.setattr(rag_pipeline, "get_embedding", embedder.embed_one)
+    return embedder
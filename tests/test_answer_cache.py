@@ -0,0 +1,26 @@
+import time
+
+
+def test_answer_cache_matches_near_duplicates_and_invalidates():
+    from modules.answer_cache import AnswerCache
+
+    cache = AnswerCache(max_entries=2, ttl=60, similarity=0.95)
+    cache.put([1.0, 0.0], 2, ["a", "b"], kth_distance=0.5, value={"answer": "A"})
+
+    assert cache.get([1.0, 0.05], 2, ["b", "a"])["answer"] == "A"  # paraphrase, same chunks
+    assert cache.get([1.0, 0.05], 2, ["a", "c"]) is None  # retrieval changed
+    assert cache.get([0.0, 1.0], 2, ["a", "b"]) is None  # different question
+    assert cache.stats()["hit_rate"] == round(1 / 3, 4)
+
+    # a new vector far from the query leaves the entry, one inside its top-k drops it
+    assert cache.invalidate_near([[5.0, 5.0]]) == 0
+    assert cache.invalidate_near([[1.1, 0.0]]) == 1
+    assert cache.get([1.0, 0.0], 2, ["a", "b"]) is None
+
+    # LRU + TTL
+    for i in range(3):
+        cache.put([float(i), 1.0], 1, [str(i)], kth_distance=1.0, value={"answer": str(i)})
+    assert cache.stats()["evictions"] == 1 and cache.get([0.0, 1.0], 1, ["0"]) is None
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get([2.0, 1.0], 1, ["2"]) is None and cache.stats()["entries"] == 0
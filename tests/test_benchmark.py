@@ -0,0 +1,38 @@
+def test_hash_embedder_is_deterministic_and_lexical():
+    import numpy as np
+    from modules.benchmark import HashEmbedder
+    a, b = HashEmbedder(32), HashEmbedder(32)
+    vecs = a(["red apple pie", "red apple tart", "blue ocean waves"])
+    assert np.array_equal(vecs, b(["red apple pie", "red apple tart", "blue ocean waves"]))
+    assert ((vecs[0] - vecs[1]) ** 2).sum() < ((vecs[0] - vecs[2]) ** 2).sum()
+
+
+def test_synthetic_pdf_round_trips_through_extraction(tmp_path):
+    from modules.benchmark import make_corpus, write_pdf
+    from modules.ocr import extract_pdf_pages
+    text = make_corpus(1, words_per_doc=600)[0]
+    pages = write_pdf(str(tmp_path / "doc.pdf"), text, lines_per_page=20)
+    extracted = extract_pdf_pages(str(tmp_path / "doc.pdf"), processes=1)
+    assert len(extracted) == pages > 1
+    assert " ".join(t for _, t in extracted).split() == text.split()
+
+
+def test_scenarios_report_metrics_and_compare_flags_regressions():
+    from modules.benchmark import compare, run_scenario
+    chunk = run_scenario("chunk", {"num_docs": 5, "words_per_doc": 300})
+    vs = run_scenario("vectorstore", {"size": 2000, "dim": 16, "num_queries": 20, "k": 5})
+    assert chunk["metrics"]["chunks"] > 0 and {"p50_ms", "p95_ms", "p99_ms"} <= set(chunk["metrics"])
+    assert vs["metrics"]["recall@5"] == 1.0 and vs["metrics"]["peak_rss_mb"] > 0
+
+    baseline = {"results": [vs]}
+    slower = dict(vs, metrics=dict(vs["metrics"], p95_ms=vs["metrics"]["p95_ms"] * 2, **{"recall@5": 0.5}))
+    regressions = compare(baseline, {"results": [slower]})
+    assert len(regressions) == 2 and any("p95_ms" in r for r in regressions)
+    assert compare(baseline, {"results": [vs]}) == []
+
+
+def test_query_scenario_runs_on_a_sharded_store():
+    from modules.benchmark import run_scenario
+    result = run_scenario("query", {"num_docs": 8, "words_per_doc": 300, "dim": 16, "num_queries": 10, "k": 3,
+                                    "shards": 2})
+    assert result["metrics"]["recall@3"] == 1.0 and result["metrics"]["chunks"] > 0
@@ -0,0 +1,77 @@
+import zipfile
+
+
+class _FakePipeline:
+    dedup = True
+
+    def __init__(self, known=None):
+        self.calls = []
+        self.known = known if known is not None else {}
+
+    def find_document_by_hash(self, content_hash):
+        return self.known.get(content_hash)
+
+    def ingest_chunked(self, docs, content_hashes=None, document_texts=None, spans=None):
+        self.calls.append([name for name, _ in docs])
+        for h in content_hashes:
+            self.known[h] = {"document_id": len(self.known), "num_chunks": 0, "duplicate": True}
+        return [{"document_id": i, "num_chunks": len(chunks)} for i, (_, chunks) in enumerate(docs)]
+
+
+def test_bulk_ingest_batches_files_and_resumes(tmp_path, make_pdf):
+    from modules.bulk_ingest import bulk_ingest
+
+    src = tmp_path / "docs"
+    (src / "sub").mkdir(parents=True)
+    make_pdf(src / "a.pdf", ["alpha page one.", "alpha page two."])
+    make_pdf(src / "sub" / "b.pdf", ["beta text."])
+    make_pdf(src / "sub" / "copy.pdf", ["alpha page one.", "alpha page two."])
+    (src / "notes.txt").write_text("ignored")
+    (src / "broken.pdf").write_bytes(b"not a pdf")
+    with zipfile.ZipFile(src / "more.zip", "w") as zf:
+        zf.write(src / "a.pdf", "inner/c.pdf")
+
+    manifest = tmp_path / "run.jsonl"
+    pipeline = _FakePipeline()
+    stats = bulk_ingest(pipeline, str(src), manifest_path=str(manifest), processes=2, log=lambda *a: None)
+    assert stats["files"] == 2 and stats["failed"] == 1 and stats["chunks"] == 2
+    assert stats["duplicates"] == 1  # copy.pdf has the same bytes as a.pdf and is never extracted
+    assert sorted(n for call in pipeline.calls for n in call) == ["a.pdf", "b.pdf"]
+    assert len(pipeline.calls) == 1  # both files embedded / stored in one batch
+
+    # the zip is walked as an archive of its own, its only member is a.pdf again
+    stats = bulk_ingest(pipeline, str(src / "more.zip"), manifest_path=str(manifest), processes=1)
+    assert stats["files"] == 0 and stats["duplicates"] == 1
+    pipeline.known.clear()
+    stats = bulk_ingest(pipeline, str(src / "more.zip"), manifest_path=str(tmp_path / "zip.jsonl"), processes=1)
+    assert stats["files"] == 1 and pipeline.calls[-1] == ["c.pdf"]
+
+    # second run over the same tree only retries the broken file
+    pipeline = _FakePipeline(known=pipeline.known)
+    stats = bulk_ingest(pipeline, str(src), manifest_path=str(manifest), processes=2, log=lambda *a: None)
+    assert stats["skipped"] == 2 and stats["failed"] == 1 and pipeline.calls == []
+
+
+def test_bulk_ingest_sizes_and_stores_chunks_like_the_pipeline(tmp_path, make_pdf, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+    from modules.bulk_ingest import bulk_ingest
+    from modules.db import Chunk, Document
+    from modules.embeddings import chunk_sizing
+
+    src = tmp_path / "docs"
+    src.mkdir()
+    pages = [" ".join(f"Sentence {i} on page {n} of the report." for i in range(12)) for n in range(1, 3)]
+    make_pdf(src / "a.pdf", pages)
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path / "vs"), chunk_storage="offsets",
+                                  chunk_tokens=40)
+    stats = bulk_ingest(rp, str(src), processes=1, log=lambda *a: None)
+
+    db = pipeline_db()
+    doc = db.query(Document).one()
+    rows = db.query(Chunk).order_by(Chunk.chunk_index).all()
+    assert stats["chunks"] == len(rows) > 4
+    assert all(r.content is None for r in rows)
+    texts = [doc.text[r.start_offset:r.end_offset] for r in rows]
+    assert texts == fake_embed.texts
+    count = chunk_sizing(40)["length"]
+    assert max(count(t) for t in texts) <= 40
@@ -0,0 +1,74 @@
+def test_span_chunker_offsets_point_into_cleaned_text():
+    from modules.chunking import SpanChunker
+
+    pages = [(1, "First  sentence on\xa0page one. It continues"), (2, "on page two. " + "Short one. " * 40),
+             (3, ""), (4, "x" * 700)]
+    chunker = SpanChunker(pages, chunk_size=200, overlap=30)
+    spans = list(chunker)
+
+    text = chunker.text
+    assert text.startswith("First sentence on page one. It continues\non page two.")
+    assert all(text[s.start:s.end] == s.text for s in spans)
+    assert max(len(s.text) for s in spans) <= 200
+    # a sentence running over the page break stays whole and keeps its first page
+    assert spans[0].text.startswith("First sentence") and "It continues\non page two." in spans[0].text
+    assert spans[0].page == 1 and spans[-1].page == 4
+    # consecutive chunks overlap
+    assert all(b.start < a.end for a, b in zip(spans, spans[1:]))
+    assert set(range(len(text))) - {i for s in spans for i in range(s.start, s.end)} <= {
+        i for i, ch in enumerate(text) if ch.isspace()}
+
+
+def test_span_chunker_sizes_by_custom_length():
+    from modules.chunking import SpanChunker, chunk_text
+
+    words = lambda t: len(t.split())
+    text = " ".join(f"Sentence {i} has exactly six words." for i in range(50))
+    spans = list(SpanChunker([(None, text)], chunk_size=40, overlap=20, length=words))
+    assert max(words(s.text) for s in spans) <= 40
+    assert chunk_text(text, chunk_size=40, overlap=20, length=words) == [s.text for s in spans]
+
+
+def test_span_chunker_keeps_estimated_tokens_under_the_limit():
+    from modules.chunking import SpanChunker
+    from modules.embeddings import _approx_tokens
+
+    # the fallback estimate adds up over neighbouring pieces
+    assert _approx_tokens("one, two") == _approx_tokens("one,") + _approx_tokens(" two")
+    # table-like text without sentence breaks whose token density changes halfway through
+    dense = " ".join(["(a)", "1.2", "x-y", "b/c"] * 300)
+    sparse = " ".join(["alpha", "beta", "gamma"] * 300)
+    chunker = SpanChunker([(1, sparse + " " + dense), (2, "A short sentence. " * 200)],
+                          chunk_size=254, overlap=50, length=_approx_tokens)
+    spans = list(chunker)
+    assert max(_approx_tokens(s.text) for s in spans) <= 254
+    assert all(chunker.text[s.start:s.end] == s.text for s in spans)
+
+
+def test_span_chunker_drops_pages_it_is_done_with():
+    from modules.chunking import SpanChunker
+
+    pages = [(n, f"Page {n} opens here. " + "Filler words on a page. " * 30 + "And it runs on")
+             for n in range(1, 41)]
+    full = SpanChunker(pages, chunk_size=300, overlap=40)
+    expected = list(full)
+
+    held = []
+    chunker = SpanChunker(pages, chunk_size=300, overlap=40, keep_text=False)
+    spans = []
+    for span in chunker:
+        spans.append(span)
+        held.append(len(chunker._parts))
+    assert spans == expected
+    assert max(held) <= 2 and full.text.endswith(chunker.text)
+
+    # keep_text holds on to everything not released yet
+    chunker = SpanChunker(pages, chunk_size=300, overlap=40)
+    written = []
+    for span in chunker:
+        piece = chunker.text_from(sum(map(len, written)))
+        written.append(piece)
+        chunker.release(sum(map(len, written)))
+        assert len(chunker._parts) <= 3
+    written.append(chunker.text_from(sum(map(len, written))))
+    assert "".join(written) == full.text
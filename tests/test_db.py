@@ -0,0 +1,21 @@
+def test_bulk_insert_chunks_returns_ids_in_order(monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from modules import db as dbmod
+
+    engine = create_engine("sqlite://")
+    dbmod.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    monkeypatch.setattr(dbmod, "CHUNK_INSERT_BATCH", 2)
+
+    doc = dbmod.Document(filename="a.pdf", text="")
+    db.add(doc)
+    db.flush()
+    ids = dbmod.bulk_insert_chunks(db, [
+        {"document_id": doc.id, "content": f"c{i}", "chunk_index": i, "chunk_metadata": "{}"}
+        for i in range(5)
+    ])
+    db.commit()
+
+    rows = dict(db.query(dbmod.Chunk.id, dbmod.Chunk.content).all())
+    assert [rows[i] for i in ids] == [f"c{i}" for i in range(5)]
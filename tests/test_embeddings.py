@@ -2,3 +2,70 @@ def test_get_embedding_callable():
     from modules.embeddings import get_embedding
     assert callable(get_embedding)
 
+
+
+def test_embed_texts_batched_matrix(monkeypatch):
+    import numpy as np
+    from modules import embeddings
+
+    calls = []
+
+    class FakeModel:
+        def encode(self, texts, batch_size=32, **kwargs):
+            calls.append(list(texts))
+            return np.array([[len(t), 1.0] for t in texts], dtype="float64")
+
+    monkeypatch.setattr(embeddings, "_ST_AVAILABLE", True)
+    monkeypatch.setattr(embeddings, "_st_model", FakeModel())
+    out = embeddings.embed_texts(["ccc", "a", "bb"], batch_size=2, use_cache=False)
+
+    assert len(calls) == 1
+    assert out.dtype == np.float32 and out.flags["C_CONTIGUOUS"]
+    assert out[:, 0].tolist() == [3.0, 1.0, 2.0]
+
+
+def test_embedding_cache_hits_and_eviction(tmp_path):
+    import numpy as np
+    from modules.embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=10, lru_size=2)
+    key = cache.make_key("st", "m", "hello   world ")
+    assert key == cache.make_key("st", "m", "hello world")
+    cache.put_many({key: np.ones(3, dtype="float32")})
+    assert cache.get_many([key])[key].tolist() == [1.0, 1.0, 1.0]
+
+    cache.put_many({cache.make_key("st", "m", str(i)): np.zeros(3, dtype="float32") for i in range(20)})
+    # reopening only sees the bounded on-disk store
+    reopened = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    assert reopened.stats()["entries"] <= 10
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["evictions"] > 0
+
+
+def test_embedding_cache_reopens_after_fork(tmp_path, monkeypatch):
+    import os
+    import numpy as np
+    import pytest
+    from modules import embeddings
+
+    if not hasattr(os, "fork"):
+        pytest.skip("needs fork()")
+    monkeypatch.setattr(embeddings, "EMBED_CACHE_PATH", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(embeddings, "_cache", None)
+    parent = embeddings.get_cache()
+    inherited = parent._conn
+
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            embeddings.reopen_cache()
+            cache = embeddings.get_cache()
+            cache.put_many({"child": np.ones(2, dtype="float32")})
+            ok = cache._conn is not inherited
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    # the parent's connection still works and sees the child's write
+    assert parent.get_many(["child"])["child"].tolist() == [1.0, 1.0]
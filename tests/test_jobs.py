@@ -0,0 +1,91 @@
+import time
+
+
+def _fake_extract(path, use_gvision=False):
+    with open(path) as f:
+        return [(1, f.read())]
+
+
+class _FakePipeline:
+    def find_duplicate_file(self, path):
+        return None, None
+
+    def ingest_pages(self, pages, filename=None, progress=None, content_hash=None):
+        progress("embedding", 0.5)
+        text = pages[0][1]
+        if text == "boom":
+            raise ValueError("bad document")
+        return {"document_id": 1, "num_chunks": len(text.split())}
+
+
+def test_job_queue_runs_jobs_and_requeues(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from modules.db import Base, IngestJob
+    from modules.jobs import JobQueue
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    # left "running" by a previous process
+    db = Session()
+    db.add(IngestJob(filename="old.txt", filepath=str(tmp_path / "old.txt"), status="running"))
+    db.commit()
+    db.close()
+    (tmp_path / "old.txt").write_text("one two")
+    (tmp_path / "bad.txt").write_text("boom")
+
+    queue = JobQueue(_FakePipeline(), workers=2, ocr_processes=1, session_factory=Session,
+                     poll_interval=0.05, extract=_fake_extract)
+    queue.start()
+    try:
+        bad_id = queue.enqueue(str(tmp_path / "bad.txt"), "bad.txt")
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            states = [queue.get(1)["status"], queue.get(bad_id)["status"]]
+            if "queued" not in states and "running" not in states:
+                break
+            time.sleep(0.05)
+    finally:
+        queue.shutdown()
+
+    assert queue.get(1)["status"] == "done" and queue.get(1)["num_chunks"] == 2
+    assert queue.get(bad_id)["status"] == "failed"
+    assert "bad document" in queue.get(bad_id)["message"]
+
+
+def test_job_queue_leaves_jobs_of_live_workers_alone(tmp_path):
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from modules.db import Base, IngestJob
+    from modules.jobs import JobQueue
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add_all([
+        IngestJob(filename="live.txt", filepath="live.txt", status="running", owner="other:1:a",
+                  heartbeat_at=datetime.utcnow()),
+        IngestJob(filename="dead.txt", filepath="dead.txt", status="running", owner="other:2:b",
+                  heartbeat_at=datetime.utcnow() - timedelta(minutes=10)),
+    ])
+    db.commit()
+    db.close()
+
+    queue = JobQueue(_FakePipeline(), session_factory=Session, stale_after=60)
+    assert queue.requeue_stale() == 1
+    assert queue.get(1)["status"] == "running"
+    assert queue.get(2)["status"] == "queued"
+
+
+def test_default_extract_keeps_pdfs_single_process(monkeypatch):
+    from modules import jobs, ocr
+
+    calls = []
+    monkeypatch.setattr(ocr, "iter_pdf_pages", lambda path, use_gvision=False, processes=None:
+                        calls.append(processes) or iter([(1, "text")]))
+    assert jobs.JobQueue(_FakePipeline()).extract("doc.pdf", False) == [(1, "text")]
+    assert calls == [1]
@@ -0,0 +1,26 @@
+def test_bm25_finds_identifiers_and_removes():
+    from modules.lexical import BM25Index, tokenize
+
+    assert tokenize("Invoice INV-2023-001.") == ["invoice", "inv-2023-001", "inv", "2023", "001"]
+
+    index = BM25Index()
+    index.add_many([
+        (1, "Invoice INV-2023-001 was paid in March."),
+        (2, "Invoice INV-2023-002 is overdue."),
+        (3, "The weather in March was mild."),
+    ])
+    index.add(1, "ignored, already indexed")
+    assert len(index) == 3
+    assert index.search("INV-2023-002", top_k=2)[0][0] == 2
+    assert [d for d, _ in index.search("march", top_k=5)] in ([1, 3], [3, 1])
+
+    index.remove([2])
+    assert all(d != 2 for d, _ in index.search("INV-2023-002", top_k=5))
+    assert index.search("", top_k=5) == []
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    from modules.lexical import reciprocal_rank_fusion
+
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "e"]], top_k=3)
+    assert fused == ["b", "a", "d"]
@@ -0,0 +1,33 @@
+def test_metastore_roundtrip(tmp_path):
+    import uuid
+    from modules.metastore import MetaStore
+
+    uid = str(uuid.uuid4())
+    store = MetaStore.from_rows(
+        [uid, 'plain-id'],
+        [{'source': 'a.pdf', 'chunk_index': 0}, {'source': 'a.pdf', 'chunk_index': '7', 'extra': [1]}],
+    )
+    MetaStore.write(str(tmp_path), store.snapshot())
+
+    loaded = MetaStore.load(str(tmp_path))
+    loaded.append(['x'], [{'source': 'b.png', 'chunk_index': 3}])
+    assert list(loaded.ids) == [uid, 'plain-id', 'x']
+    assert loaded.metadatas[0] == {'source': 'a.pdf', 'chunk_index': 0}
+    assert loaded.metadatas[1] == {'source': 'a.pdf', 'chunk_index': '7', 'extra': [1]}
+    assert loaded.strings == ['a.pdf', 'b.png']
+    assert loaded.column('chunk_index')[2] == 3
+
+
+def test_metastore_mask():
+    from modules.metastore import MetaStore
+
+    store = MetaStore.from_rows(
+        ['a', 'b', 'c'],
+        [{'source': 'a.pdf', 'document_id': 1, 'uploaded_at': 100},
+         {'source': 'b.pdf', 'document_id': 2, 'lang': 'de'},
+         {'source': 'a.pdf', 'document_id': 3, 'uploaded_at': 300, 'lang': 'en'}],
+    )
+    assert store.mask({'source': 'a.pdf'}).tolist() == [True, False, True]
+    assert store.mask({'document_id': [2, 3], 'lang': 'en'}).tolist() == [False, False, True]
+    assert store.mask({'uploaded_after': '1970-01-01T00:02:00'}).tolist() == [False, False, True]
+    assert store.mask({'source': 'missing.pdf'}).tolist() == [False, False, False]
@@ -0,0 +1,60 @@
+def test_registry_renders_prometheus_text():
+    from modules.metrics import Registry
+    reg = Registry(buckets=(0.1, 1.0))
+    reg.inc("chunks_total", 3)
+    reg.set("vectors", 7)
+    for seconds in (0.05, 0.5, 5.0):
+        reg.observe("stage_seconds", seconds, stage='em"bed')
+    text = reg.render()
+    assert "# TYPE insightai_chunks_total counter\ninsightai_chunks_total 3\n" in text
+    assert "insightai_vectors 7\n" in text
+    assert 'insightai_stage_seconds_bucket{stage="em\\"bed",le="0.1"} 1\n' in text
+    assert 'insightai_stage_seconds_bucket{stage="em\\"bed",le="1"} 2\n' in text
+    assert 'insightai_stage_seconds_bucket{stage="em\\"bed",le="+Inf"} 3\n' in text
+    assert 'insightai_stage_seconds_count{stage="em\\"bed"} 3\n' in text
+
+
+def test_stages_reach_registry_hooks_and_breakdown(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from modules import metrics
+    reg = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", reg)
+    seen = []
+    hook = lambda name, seconds, counts: seen.append((name, counts))
+    metrics.add_hook(hook)
+    try:
+        with metrics.collect() as breakdown:
+            with metrics.stage("embed", chunks_embedded=2) as info:
+                info["chunks_embedded"] += 1
+            with ThreadPoolExecutor(2) as pool:
+                list(pool.map(metrics.bind(lambda _: metrics.record("llm", 0.01, llm_tokens=5)), range(2)))
+        metrics.record("outside", 0.0)
+    finally:
+        metrics.remove_hook(hook)
+
+    assert set(breakdown["stages"]) == {"embed", "llm"} and breakdown["counts"] == {"chunks_embedded": 3, "llm_tokens": 10}
+    assert breakdown["total_ms"] >= breakdown["stages"]["embed"]
+    assert reg.value("stage_seconds", stage="llm") == 2 and reg.value("llm_tokens_total") == 10
+    assert ("embed", {"chunks_embedded": 3}) in seen
+
+
+def test_pipeline_query_records_each_stage(tmp_path, pipeline_db, fake_embed):
+    from modules import metrics, rag_pipeline
+
+    fake_embed.query = [5.0, 0.0, 0.0]
+
+    class _StubLLM:
+        def chat(self, messages, stream=False):
+            return {"message": "two words", "eval_count": 4}
+
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), hybrid=True)
+    rp.ollama_client = _StubLLM()
+    with metrics.collect() as ingest:
+        rp.ingest_pages(iter([(1, "First page text. " * 10), (2, "Second page.")]), filename="a.pdf")
+    assert {"extract", "chunk", "embed", "db_write", "vector_add"} <= set(ingest["stages"])
+    assert ingest["counts"]["pages"] == 2 and ingest["counts"]["vectors_added"] == ingest["counts"]["chunks"]
+
+    with metrics.collect() as query:
+        rp.query("page")
+    assert {"embed_query", "vector_search", "lexical_search", "db_lookup", "llm"} <= set(query["stages"])
+    assert query["counts"]["llm_tokens"] == 4 and query["counts"]["vectors_searched"] == rp.vs.ntotal
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def test_ocr_smoke():
     try:
         from modules.ocr import ocr_image_to_text
@@ -5,3 +8,40 @@ def test_ocr_smoke():
         assert False, "ocr module import failed"
     # we don't have an image in CI; just assert callable
     assert callable(ocr_image_to_text)
+
+
+def test_extract_pdf_pages_parallel_keeps_page_numbers(tmp_path, monkeypatch, make_pdf):
+    from modules import ocr
+    pdf = tmp_path / "doc.pdf"
+    make_pdf(pdf, [f"page {i} text" for i in range(1, 10)] + [""])
+    monkeypatch.setattr(ocr, "PDF_PARALLEL_MIN_PAGES", 2)
+
+    pages = ocr.extract_pdf_pages(str(pdf), processes=2)
+    assert [n for n, _ in pages] == list(range(1, 11))
+    assert "page 3 text" in pages[2][1] and pages[9][1] == ""
+    assert ocr.extract_pdf_pages(str(pdf), processes=1) == pages
+
+
+def _text_image(skew_degrees=0.0, noise=0.0, seed=0):
+    # white page with dark horizontal "text lines", tilted by skew_degrees (descending to the right)
+    rng = np.random.default_rng(seed)
+    h, w = 1200, 900
+    ys, xs = np.mgrid[0:h, 0:w]
+    tilted = ys - (xs - w / 2) * np.tan(np.deg2rad(skew_degrees))
+    ink = ((tilted % 40) < 8) & (xs > 80) & (xs < w - 80) & (ys > 100) & (ys < h - 100)
+    gray = np.where(ink, 20.0, 235.0) + rng.normal(0, noise, (h, w))
+    return np.clip(gray, 0, 255).astype(np.uint8)
+
+
+def test_estimate_skew_matches_rotation_convention():
+    from modules import ocr
+    for angle in (0.0, 3.0, -2.5):
+        gray = _text_image(skew_degrees=angle)
+        assert abs(ocr.estimate_skew(gray < 128) - angle) <= 0.2
+
+
+def test_choose_tier_from_image_quality():
+    from modules import ocr
+    assert ocr.choose_tier(ocr.image_quality(_text_image())) == "none"
+    assert ocr.choose_tier(ocr.image_quality(_text_image(skew_degrees=2.0))) == "fast"
+    assert ocr.choose_tier(ocr.image_quality(_text_image(noise=25.0))) == "full"
@@ -4,3 +4,372 @@ def test_rag_pipeline_interface():
     assert hasattr(rp, 'ingest_image')
     assert hasattr(rp, 'query')
 
+
+
+def test_fetch_contents_batches_lookups():
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from modules.db import Base, Document, Chunk
+    from modules.rag_pipeline import RAGPipeline # type: ignore
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    doc = Document(filename="a.pdf", text="")
+    db.add(doc)
+    db.flush()
+    chunks = [Chunk(document_id=doc.id, content=f"c{i}", chunk_index=i) for i in range(3)]
+    db.add_all(chunks)
+    db.commit()
+    ids = [c.id for c in chunks]
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+    metas = [{"chunk_id": ids[2]}, {"source": "a.pdf", "chunk_index": 1}, {"chunk_id": ids[0]}, {}]
+    assert RAGPipeline._fetch_contents(db, metas) == ["c2", "c1", "c0", ""]
+    assert len(statements) == 2
+
+
+def test_ingest_pages_streams_in_micro_batches(tmp_path, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+    from modules.db import Chunk, Document
+
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), ingest_batch_size=2,
+                                  store_document_text=False)
+    pulled = []
+
+    def pages():
+        for n in range(1, 6):
+            pulled.append(n)
+            yield n, f"Sentence number {n} on this page. " * 20
+
+    info = rp.ingest_pages(pages(), filename="big.pdf")
+
+    batches = [len(call) for call in fake_embed.calls]
+    assert pulled == [1, 2, 3, 4, 5]
+    assert info["num_chunks"] == sum(batches) == rp.vs.ntotal > 2
+    assert max(batches) <= 2
+    db = pipeline_db()
+    rows = db.query(Chunk).order_by(Chunk.chunk_index).all()
+    assert [r.chunk_index for r in rows] == list(range(info["num_chunks"]))
+    assert db.get(Document, info["document_id"]).text is None
+    # the full text is kept by default
+    default = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path / "default"), ingest_batch_size=2)
+    info = default.ingest_pages([(1, "First page."), (2, "Second page.")], filename="small.pdf")
+    assert db.get(Document, info["document_id"]).text == "First page.\nSecond page."
+    assert [m["page"] for m in rp.vs.metadatas] == sorted(m["page"] for m in rp.vs.metadatas)
+
+
+def test_ingest_pages_holds_no_write_lock_while_reporting_progress(tmp_path, monkeypatch, fake_embed):
+    import pytest
+    from sqlalchemy import create_engine, update
+    from sqlalchemy.orm import sessionmaker
+    from modules import rag_pipeline
+    from modules.db import Base, Chunk, Document, IngestJob
+
+    # a progress callback writing through its own connection, like JobQueue._update
+    engine = create_engine(f"sqlite:///{tmp_path / 'rag.db'}", connect_args={"check_same_thread": False, "timeout": 0.2})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(rag_pipeline, "SessionLocal", Session)
+    monkeypatch.setattr(rag_pipeline, "init_db", lambda: None)
+    db = Session()
+    db.add(IngestJob(filename="a.pdf", filepath="a.pdf", status="running"))
+    db.commit()
+    stages = []
+
+    def progress(stage, fraction):
+        stages.append(stage)
+        with Session() as s:
+            s.execute(update(IngestJob).values(stage=stage, progress=fraction))
+            s.commit()
+
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path / "vs"), ingest_batch_size=2,
+                                  chunk_storage="offsets")
+    pages = [(n, " ".join(f"Sentence {i} on page {n}, long enough to need a few chunks." for i in range(12)))
+             for n in range(1, 4)]
+    info = rp.ingest_pages(pages, filename="a.pdf", progress=progress, content_hash="abc")
+    assert stages.count("indexing") > 1 and stages[-1] == "storing"
+    doc = db.get(Document, info["document_id"])
+    assert doc.content_hash == "abc"
+    rows = db.query(Chunk).order_by(Chunk.chunk_index).all()
+    texts = [doc.text[r.start_offset:r.end_offset] for r in rows]
+    assert all(texts) and rp._fetch_contents(db, [{"chunk_id": r.id} for r in rows]) == texts
+
+    # a failing document is removed again, batches already committed included
+    def failing_pages():
+        yield from pages
+        raise RuntimeError("OCR died")
+
+    with pytest.raises(RuntimeError):
+        rp.ingest_pages(failing_pages(), filename="b.pdf", progress=progress)
+    db.expire_all()
+    assert [d.filename for d in db.query(Document).all()] == ["a.pdf"]
+    assert {m["document_id"] for m in rp.vs.metadatas} == {info["document_id"]}
+    rp.vs._compactor and rp.vs._compactor.join()
+
+
+def test_offsets_storage_slices_chunks_out_of_the_document(tmp_path, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+    from modules.db import Chunk, Document
+    from modules.lexical import BM25Index, load_chunks
+
+    Session = pipeline_db
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), chunk_storage="offsets",
+                                  ingest_batch_size=4)
+    pages = [(n, " ".join(f"Sentence {i} on page {n} about topic{n}x{i}." for i in range(20))) for n in range(1, 4)]
+    info = rp.ingest_pages(pages, filename="doc.pdf")
+
+    db = Session()
+    doc = db.get(Document, info["document_id"])
+    rows = db.query(Chunk).order_by(Chunk.chunk_index).all()
+    assert len(rows) == info["num_chunks"] > 3
+    assert all(r.content is None for r in rows)
+    texts = [doc.text[r.start_offset:r.end_offset] for r in rows]
+    assert texts == fake_embed.texts and "topic2x7" in doc.text
+
+    metas = [{"chunk_id": r.id} for r in reversed(rows)]
+    assert rp._fetch_contents(db, metas, rp.doc_texts) == texts[::-1]
+    assert rp._fetch_contents(db, [{"source": "doc.pdf", "chunk_index": 1}], rp.doc_texts) == [texts[1]]
+    assert (rp.doc_texts.misses, rp.doc_texts.hits) == (1, 1)
+    assert rag_pipeline.RAGPipeline._fetch_contents(db, metas[:1]) == texts[-1:]  # no cache
+
+    index = BM25Index()
+    load_chunks(index, Session, batch_size=2)
+    hit = index.search("topic3x5", 1)[0][0]
+    assert "topic3x5" in texts[[r.id for r in rows].index(hit)]
+
+
+def test_offsets_text_is_written_once(tmp_path, pipeline_db, fake_embed):
+    from sqlalchemy import event
+    from modules import rag_pipeline
+    from modules.db import Chunk, Document, DocumentSegment
+
+    Session = pipeline_db
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), chunk_storage="offsets",
+                                  ingest_batch_size=2)
+    statements = []
+    event.listen(Session.kw["bind"], "before_cursor_execute", lambda *args: statements.append(args[2]))
+    midway = []
+
+    def progress(stage, fraction):
+        if stage != "indexing":
+            return
+        with Session() as db:
+            # chunks committed so far read from the segments, the partial text isn't cached
+            rows = db.query(Chunk).order_by(Chunk.chunk_index).all()
+            midway.append((db.query(Document.text).scalar(), db.query(DocumentSegment).count(),
+                           rp._fetch_contents(db, [{"chunk_id": r.id} for r in rows], rp.doc_texts)))
+
+    pages = [(n, " ".join(f"Sentence {i} on page {n}." for i in range(40))) for n in range(1, 4)]
+    info = rp.ingest_pages(pages, filename="doc.pdf", progress=progress)
+
+    assert len(midway) > 2
+    assert all(text is None and segments > 0 and all(contents) for text, segments, contents in midway)
+    assert sum(s.startswith("UPDATE documents") for s in statements) == 1
+    db = Session()
+    doc = db.get(Document, info["document_id"])
+    assert "Sentence 39 on page 3." in doc.text and db.query(DocumentSegment).count() == 0
+    rows = db.query(Chunk).order_by(Chunk.chunk_index).all()
+    assert rp._fetch_contents(db, [{"chunk_id": r.id} for r in rows], rp.doc_texts) == fake_embed.texts
+
+
+def test_duplicate_chunks_reuse_vectors(tmp_path, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+    from modules.db import Chunk
+
+    # "almost" differs from "same" only by a tiny offset
+    fake_embed.vector = lambda t: [len(t), 0.001 if "almost" in t else 0, 0]
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), near_dup_distance=0.01)
+
+    rp.ingest_chunked([("a.pdf", [("same text", 1), ("same  text", 2), ("other", 3)])])
+    rp.ingest_chunked([("b.pdf", [("same text", 1), ("almost ok", 1), ("other", 2)])])
+
+    assert fake_embed.texts == ["same text", "other", "almost ok"]
+    assert rp.vs.ntotal == 2
+    rows = pipeline_db().query(Chunk).order_by(Chunk.id).all()
+    assert [r.duplicate_of for r in rows] == [None, 1, None, 1, 1, 3]
+    assert rows[0].content_hash == rows[1].content_hash
+
+
+def test_ingest_chunked_failure_leaves_no_vectors_behind(tmp_path, pipeline_db, fake_embed):
+    import pytest
+    from sqlalchemy import event
+    from modules import rag_pipeline
+
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), hybrid=True,
+                                  vector_options={"tombstone_ratio": 1.0})
+
+    def fail(session):
+        raise RuntimeError("disk full")
+
+    event.listen(pipeline_db, "before_commit", fail)
+    with pytest.raises(RuntimeError, match="disk full"):
+        rp.ingest_chunked([("a.pdf", [("old text here", 1)])])
+    event.remove(pipeline_db, "before_commit", fail)
+    assert rp.vs.ntotal == rp.vs.num_deleted == 1 and rp.lexical.search("old", 5) == []
+
+    # the new document gets the rolled-back ids, and only its own chunk comes back
+    info = rp.ingest_chunked([("b.pdf", [("new text here", 1)])])[0]
+    assert [r["content"] for r in rp.retrieve("text here", top_k=5)] == ["new text here"]
+    assert [r["content"] for r in rp.retrieve("text", top_k=5, document_ids=[info["document_id"]])] == ["new text here"]
+
+    # errors before any chunk is stored surface as themselves
+    def broken_metas(*args, **kwargs):
+        raise ValueError("bad chunk")
+
+    rp._chunk_metas = broken_metas
+    with pytest.raises(ValueError, match="bad chunk"):
+        rp.ingest_chunked([("c.pdf", [("more text", 1)])])
+
+
+def test_delete_document_hands_shared_vectors_over(tmp_path, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+    from modules.db import Chunk, Document
+
+    fake_embed.query = [11.0, 0.0, 0.0]
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), hybrid=True)
+    a, b = rp.ingest_chunked([("a.pdf", [("shared text", 1), ("only in a", 1)]),
+                              ("b.pdf", [("shared text", 1), ("only in b, longer", 2)])])
+
+    info = rp.delete_document(a["document_id"])
+    assert info == {"document_id": a["document_id"], "num_chunks": 2, "vectors_removed": 2}
+    assert rp.delete_document(a["document_id"]) is None
+    assert fake_embed.texts == ["shared text", "only in a", "only in b, longer"]  # the shared vector was copied
+
+    db = pipeline_db()
+    assert db.get(Document, a["document_id"]) is None
+    rows = db.query(Chunk).order_by(Chunk.id).all()
+    assert [(r.document_id, r.duplicate_of) for r in rows] == [(b["document_id"], None)] * 2
+    live = rp.vs.search([11.0, 0.0, 0.0], top_k=5)
+    assert {m["document_id"] for _, _, m in live} == {b["document_id"]}
+    assert [r["content"] for r in rp.retrieve("shared", top_k=1)] == ["shared text"]
+    assert [cid for cid, _ in rp.lexical.search("only in a")] == [rows[1].id]
+    assert [cid for cid, _ in rp.lexical.search("shared")] == [rows[0].id]
+    rp.vs._compactor.join()  # half the vectors are tombstones, so a compaction was started
+    assert rp.vs.ntotal == 2 and rp.vs.num_deleted == 0
+
+
+def test_document_filter_finds_deduplicated_chunks(tmp_path, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+
+    fake_embed.query = [11.0, 0.0, 0.0]
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), hybrid=True)
+    a, b = rp.ingest_chunked([("a.pdf", [("shared text", 1), ("only in a", 1)]),
+                              ("b.pdf", [("shared text", 1), ("only in b, longer", 2)])])
+
+    # b's copy of "shared text" has no vector, only duplicate_of a's chunk
+    for kwargs in ({"document_ids": [b["document_id"]]}, {"filters": {"document_id": b["document_id"]}}):
+        assert [r["content"] for r in rp.retrieve("shared text", top_k=1, **kwargs)] == ["shared text"]
+        assert {r["content"] for r in rp.retrieve("shared text", top_k=5, **kwargs)} == {"shared text", "only in b, longer"}
+    assert [r["content"] for r in rp.retrieve("only in a", top_k=5, document_ids=[b["document_id"]])
+            if r["content"] == "only in a"] == []
+    assert rp.retrieve("shared", top_k=5, document_ids=[12345]) == []
+
+
+def test_document_filter_batches_and_caches_chunk_lookup(tmp_path, pipeline_db, fake_embed):
+    from sqlalchemy import event
+    from modules import rag_pipeline
+
+    fake_embed.query = [9.0, 0.0, 0.0]
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), hybrid=True,
+                                  vector_options={"tombstone_ratio": 1.0})
+    # more chunks than SQLite will bind in one IN clause
+    big, shared = rp.ingest_chunked([("big.pdf", [(f"chunk {i:05d}", 1) for i in range(1200)]),
+                                     ("b.pdf", [("shared text", 1)])])
+    a, = rp.ingest_chunked([("a.pdf", [("shared text", 1)])])
+    # b.pdf got there first, so a.pdf's copy is only duplicate_of it
+    assert rp.retrieve("shared text", top_k=1, document_ids=[a["document_id"]])[0]["content"] == "shared text"
+
+    statements, params = [], []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+        params.append(len(parameters))
+    event.listen(pipeline_db.kw["bind"], "before_cursor_execute", record)
+    assert len(rp.retrieve("chunk 00007", top_k=3, document_ids=[big["document_id"]])) == 3
+    assert len(rp.retrieve("chunk 00007", top_k=3, document_ids=[big["document_id"]])) == 3
+    assert sum("chunks.duplicate_of" in s and "chunks.document_id IN" in s for s in statements) == 1
+    assert max(params) <= rag_pipeline._IN_CLAUSE_BATCH + 1
+
+    # the owner going away hands the vector to a.pdf's chunk, the cached lookup must not keep the old id
+    rp.delete_document(shared["document_id"])
+    assert rp.retrieve("shared text", top_k=1, document_ids=[a["document_id"]])[0]["content"] == "shared text"
+    rp.vs.wait_for_compaction()
+
+
+def test_query_stream_yields_sources_then_tokens(tmp_path, pipeline_db):
+    from modules.rag_pipeline import RAGPipeline # type: ignore
+
+    class _StubLLM:
+        calls = 0
+
+        def chat(self, messages, stream=False):
+            _StubLLM.calls += 1
+            assert stream and "ctx" in messages[0]["content"]
+            return iter([{"message": {"content": "Hel"}}, {"message": {"content": "lo"}}])
+
+    rp = RAGPipeline(vector_dim=3, vector_persist=str(tmp_path))
+    rp.ollama_client = _StubLLM()
+    rp._search = lambda q, top_k, filters=None: ([1.0, 0.0, 0.0], [("x", 0.1, {})])
+    rp._hydrate = lambda results: [{"id": "x", "distance": 0.1, "metadata": {}, "content": "ctx"}]
+
+    events = rp.query_stream("hi")
+    first = next(events)
+    assert first["type"] == "sources" and first["retrieved"][0]["content"] == "ctx"
+    assert _StubLLM.calls == 0  # sources go out before generation starts
+    assert [e.get("text") for e in events] == ["Hel", "lo", None]
+
+
+def test_streamed_answer_is_cached_cleaned(tmp_path, pipeline_db):
+    from modules.answer_cache import AnswerCache
+    from modules.rag_pipeline import RAGPipeline # type: ignore
+
+    rp = RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), answer_cache=AnswerCache())
+    rp.ollama_client = None  # OpenAI-style backend, whose answers query() cleans of markdown
+    rp._stream_completion = lambda prompt: iter(["## Total\n", "**42** ", "euros "])
+    rp._search = lambda q, top_k, filters=None: ([1.0, 0.0, 0.0], [("x", 0.1, {})])
+    rp._hydrate = lambda results: [{"id": "x", "distance": 0.1, "metadata": {}, "content": "ctx"}]
+
+    streamed = [e["text"] for e in rp.query_stream("total?") if e["type"] == "token"]
+    assert "".join(streamed) == "## Total\n**42** euros "  # the stream itself is passed through as is
+    cached = rp.query("total?")
+    assert cached["cached"] and cached["answer"] == "Total\n42 euros"
+
+
+def test_hybrid_search_fuses_lexical_hits(tmp_path, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+
+    # dense side only sees text length: it can't tell the invoices apart and ranks the unrelated chunk first
+    fake_embed.query = [21.0, 0.0, 0.0]
+
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), hybrid=True)
+    rp.ingest_chunked([("a.pdf", [("Invoice INV-1 is paid.", 1), ("Invoice INV-2 is late.", 1),
+                                  ("Unrelated words here.", 2)])])
+    # a second pipeline loads the lexical index from the DB instead of from ingest
+    fresh = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path), hybrid=True)
+    for pipeline in (rp, fresh):
+        _, results = pipeline._search("INV-2", top_k=1)
+        assert pipeline._hydrate(results)[0]["content"] == "Invoice INV-2 is late."
+
+    # filters apply to both sides: the INV-2 chunk lives in another document
+    rp.ingest_chunked([("b.pdf", [("Invoice INV-3 is new.", 1)])])
+    retrieved = rp.retrieve("INV-2", top_k=2, filters={"source": "b.pdf"})
+    assert [r["content"] for r in retrieved] == ["Invoice INV-3 is new."]
+
+
+def test_query_batch_searches_once_and_fans_out_llm(tmp_path, monkeypatch, pipeline_db, fake_embed):
+    from modules import rag_pipeline
+
+    rp = rag_pipeline.RAGPipeline(vector_dim=3, vector_persist=str(tmp_path))
+    rp.ingest_chunked([("a.pdf", [("ab", 1), ("abcd", 1)])])
+    search_calls = []
+    search_batch = rp.vs.search_batch
+    monkeypatch.setattr(rp.vs, "search_batch", lambda q, **kw: search_calls.append(len(q)) or search_batch(q, **kw))
+    rp._call_llm = lambda prompt: prompt.rsplit("Question: ", 1)[1].upper()
+
+    fake_embed.calls.clear()
+    out = rp.query_batch(["xy", "wxyz", "xy"], top_k=1)
+    assert fake_embed.calls == [["xy", "wxyz", "xy"]] and search_calls == [3]
+    assert [o["answer"] for o in out] == ["XY", "WXYZ", "XY"]
+    assert [o["retrieved"][0]["content"] for o in out] == ["ab", "abcd", "ab"]
+    assert rp.query_batch(["xy"], top_k=1, generate=False)[0]["answer"] is None
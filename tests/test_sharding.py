@@ -0,0 +1,64 @@
+def test_sharded_store_merges_global_top_k(tmp_path):
+    import numpy as np
+    from modules.sharding import ShardedVectorStore
+    from modules.vectorstore import VectorStore
+
+    rng = np.random.default_rng(0)
+    vecs = rng.random((200, 4), dtype="float32")
+    metas = [{'document_id': i % 10, 'chunk_id': i} for i in range(200)]
+    ids = [f'v{i}' for i in range(200)]
+    # tombstone_ratio=1: no background compaction after the delete below
+    sharded = ShardedVectorStore(dim=4, persist_path=str(tmp_path / "sharded"), shards=3, tombstone_ratio=1.0)
+    single = VectorStore(dim=4, persist_path=str(tmp_path / "single"))
+    sharded.add(vecs, metas, ids)
+    single.add(vecs, metas, ids)
+
+    assert sharded.ntotal == 200 and all(s.ntotal for s in sharded.shards)
+    # a document lives on exactly one shard
+    assert {m['document_id'] % 3 for m in sharded.shards[1].metadatas} == {1}
+    for got, want in zip(sharded.search_batch(vecs[:5], top_k=7), single.search_batch(vecs[:5], top_k=7)):
+        assert [r[0] for r in got] == [r[0] for r in want]
+    assert {r[2]['document_id'] for r in sharded.search(vecs[0], top_k=5, filters={'document_id': [4, 5]})} <= {4, 5}
+
+    assert len(sharded.delete({'document_id': 4})) == 20
+    reopened = ShardedVectorStore(dim=4, persist_path=str(tmp_path / "sharded"), shards=8, tombstone_ratio=1.0)
+    assert len(reopened.shards) == 3  # the layout on disk wins
+    assert reopened.ntotal == 200 and reopened.num_deleted == 20
+    assert all(r[2]['document_id'] != 4 for r in reopened.search(vecs[4], top_k=10))
+    sharded.close()
+    reopened.close()
+
+
+def test_sharded_store_over_subprocess_shards(tmp_path):
+    import os
+    import numpy as np
+    import pytest
+    from modules.sharding import ProcessShard, ShardedVectorStore
+
+    rng = np.random.default_rng(1)
+    vecs = rng.random((60, 4), dtype="float32")
+    metas = [{'document_id': i % 6, 'chunk_id': i} for i in range(60)]
+    ids = [f'v{i}' for i in range(60)]
+    path = str(tmp_path / "sharded")
+    factory = lambda i, p: ProcessShard(4, p, tombstone_ratio=1.0)
+    sharded = ShardedVectorStore(dim=4, persist_path=path, shards=2, shard_factory=factory)
+    sharded.add(vecs, metas, ids)
+
+    assert sharded.ntotal == 60 and {m['document_id'] % 2 for m in sharded.shards[1].metadatas} == {1}
+    assert [r[0] for r in sharded.search(vecs[7], top_k=1)] == ['v7']
+    assert len(sharded.delete({'document_id': 3})) == 10
+    vectors, found = sharded.vectors({'document_id': 2})
+    assert vectors.shape == (10, 4) and {m['document_id'] for m in found} == {2}
+    with pytest.raises(ValueError):  # raised in the subprocess, re-raised here
+        sharded.shards[0].add(vecs[:2], metas[:1], ids[:2])
+    pids = {s._process.pid for s in sharded.shards}
+    assert os.getpid() not in pids and len(pids) == 2
+    sharded.wait_for_compaction()
+    sharded.compact()
+    assert sharded.vectors()[0].shape == (50, 4) and sharded.index_name == "IndexFlatL2"
+    sharded.close()
+
+    # the subprocesses wrote ordinary shard directories
+    local = ShardedVectorStore(dim=4, persist_path=path, tombstone_ratio=1.0)
+    assert local.ntotal - local.num_deleted == 50 and all(r[2]['document_id'] != 3 for r in local.search(vecs[3], top_k=10))
+    local.close()
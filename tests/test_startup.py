@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# backends that must only load when a document or query needs them
+HEAVY = ["torch", "sentence_transformers", "cv2", "pytesseract", "PIL", "PyPDF2", "fitz",
+         "google.cloud.vision", "openai", "ollama", "faiss", "modules.vectorstore", "modules.rag_pipeline"]
+# seconds; generous for slow CI boxes, what matters is staying far below loading a model
+IMPORT_BUDGET = float(os.getenv("IMPORT_BUDGET_SECONDS", "3.0"))
+
+
+def _import_in_fresh_interpreter(module):
+    code = ("import json, sys, time; t = time.perf_counter(); import {m}; "
+            "print(json.dumps([time.perf_counter() - t, sorted(sys.modules)]))").format(m=module)
+    env = dict(os.environ, ASYNC_INGEST="0")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    seconds, loaded = json.loads(out.stdout.strip().splitlines()[-1])
+    return seconds, set(loaded)
+
+
+def test_import_modules_is_lazy():
+    seconds, loaded = _import_in_fresh_interpreter("modules")
+    assert not loaded & set(HEAVY + ["sqlalchemy"])
+    assert seconds < IMPORT_BUDGET
+
+
+def test_import_app_defers_pipeline_and_backends():
+    seconds, loaded = _import_in_fresh_interpreter("app")
+    assert not loaded & set(HEAVY)
+    assert seconds < IMPORT_BUDGET
+
+
+def test_lazy_exports_resolve():
+    import modules
+    from modules.vectorstore import VectorStore
+    assert modules.VectorStore is VectorStore and "RAGPipeline" in dir(modules)
@@ -6,4 +6,173 @@ def test_vectorstore_add_search():
     ids = ['id1', 'id2']
     vs.add(vecs, metas, ids)
     res = vs.search([1.0, 1.0, 1.0], top_k=1)
-    assert res and res[0][0] == 'id2'
\ No newline at end of file
+    assert res and res[0][0] == 'id2'
+
+def test_vectorstore_delta_log_replay_and_compaction(tmp_path):
+    import os
+    from modules.vectorstore import VectorStore
+    vs = VectorStore(dim=2, persist_path=str(tmp_path), compact_records=1000)
+    vs.add([[0.0, 0.0]], [{'n': 0}], ['a'])
+    vs.add([[1.0, 1.0]], [{'n': 1}], ['b'])
+    assert not os.path.exists(tmp_path / "CURRENT")
+
+    # torn write at the end of the log is dropped on replay
+    with open(tmp_path / "delta-000000.log", "ab") as f:
+        f.write(b"VADD\x01")
+    reopened = VectorStore(dim=2, persist_path=str(tmp_path))
+    assert reopened.ids == ['a', 'b']
+
+    reopened.compact()
+    reopened.add([[2.0, 2.0]], [{'n': 2}], ['c'])
+    again = VectorStore(dim=2, persist_path=str(tmp_path))
+    assert again.ids == ['a', 'b', 'c'] and again.ntotal == 3
+    assert again.search([2.0, 2.0], top_k=1)[0][0] == 'c'
+
+
+def test_vectorstore_read_only_leaves_the_log_alone(tmp_path):
+    import os
+    import pytest
+    from modules.vectorstore import VectorStore
+    vs = VectorStore(dim=2, persist_path=str(tmp_path), compact_records=1000)
+    vs.add([[0.0, 0.0], [1.0, 1.0]], [{'n': 0}, {'n': 1}], ['a', 'b'])
+    log = tmp_path / "delta-000000.log"
+    # a record the writer hasn't finished yet
+    with open(log, "ab") as f:
+        f.write(b"VADD\x01")
+    size = os.path.getsize(log)
+
+    reader = VectorStore(dim=2, persist_path=str(tmp_path), read_only=True)
+    assert reader.ids == ['a', 'b'] and os.path.getsize(log) == size
+    vectors, metas = reader.vectors()
+    assert vectors.tolist() == [[0.0, 0.0], [1.0, 1.0]] and metas == [{'n': 0}, {'n': 1}]
+    for write in (lambda: reader.add([[2.0, 2.0]], [{}], ['c']), lambda: reader.delete({'n': 0}), reader.compact):
+        with pytest.raises(ValueError):
+            write()
+    assert os.path.getsize(log) == size and not os.path.exists(tmp_path / "CURRENT")
+    with pytest.raises(FileNotFoundError):
+        VectorStore(dim=2, persist_path=str(tmp_path / "missing"), read_only=True)
+
+
+def test_vectorstore_promotes_to_ann_index(tmp_path):
+    import numpy as np
+    from modules.vectorstore import VectorStore
+    rng = np.random.default_rng(0)
+    vecs = rng.random((400, 8), dtype="float32")
+    vs = VectorStore(dim=8, persist_path=str(tmp_path), index_type="ivf_flat", promote_at=300)
+    vs.add(vecs[:200], [{'i': i} for i in range(200)], [str(i) for i in range(200)])
+    vs.add(vecs[200:], [{'i': i} for i in range(200, 400)], [str(i) for i in range(200, 400)])
+    vs._compactor.join()
+
+    reopened = VectorStore(dim=8, persist_path=str(tmp_path))
+    assert type(reopened.index).__name__ == "IndexIVFFlat" and reopened.index.ntotal == 400
+    assert reopened.search(vecs[123], top_k=1, nprobe=reopened.index.nlist)[0][0] == '123'
+
+
+def test_vectorstore_filtered_search(tmp_path, monkeypatch):
+    import numpy as np
+    from modules import vectorstore
+    from modules.vectorstore import VectorStore
+    rng = np.random.default_rng(0)
+    vecs = rng.random((300, 4), dtype="float32")
+    metas = [{'document_id': i % 3, 'source': f'{i % 2}.pdf', 'uploaded_at': 1000 + i} for i in range(300)]
+    vs = VectorStore(dim=4, persist_path=str(tmp_path), compact_records=1000)
+    vs.add(vecs[:200], metas[:200], [str(i) for i in range(200)])
+    vs.compact()
+    vs.add(vecs[200:], metas[200:], [str(i) for i in range(200, 300)])
+
+    def expected(keep):
+        rows = [i for i in range(300) if keep(metas[i])]
+        dist = ((vecs[rows] - vecs[0]) ** 2).sum(1)
+        return [str(rows[j]) for j in np.argsort(dist)[:5]]
+
+    # small matches go through the exact path, larger ones through FAISS ID selectors
+    for exact_max in (2048, 0):
+        monkeypatch.setattr(vectorstore, "FILTER_EXACT_MAX", exact_max)
+        res = vs.search(vecs[0], top_k=5, filters={'document_id': [1, 2], 'source': '0.pdf'})
+        assert [r[0] for r in res] == expected(lambda m: m['document_id'] in (1, 2) and m['source'] == '0.pdf')
+        res = vs.search(vecs[0], top_k=5, filters={'uploaded_after': 1150, 'uploaded_before': 1250})
+        assert [r[0] for r in res] == expected(lambda m: 1150 <= m['uploaded_at'] <= 1250)
+        assert len(vs.search(vecs[0], top_k=5, filters={'uploaded_after': 1298})) == 2
+        assert vs.search(vecs[0], top_k=5, filters={'document_id': 7}) == []
+
+
+def test_vectorstore_delete_tombstones_then_compacts(tmp_path):
+    from modules.vectorstore import VectorStore
+    vs = VectorStore(dim=2, persist_path=str(tmp_path), compact_records=1000, tombstone_ratio=0.5)
+    vs.add([[float(i), 0.0] for i in range(4)], [{'document_id': i % 2} for i in range(4)], list('abcd'))
+    vs.compact()
+    vs.add([[4.0, 0.0]], [{'document_id': 1}], ['e'])
+
+    assert vs.delete({'document_id': 0}) == ['a', 'c']
+    assert vs.delete({'document_id': 0}) == []
+    assert [r[0] for r in vs.search([0.0, 0.0], top_k=5)] == ['b', 'd', 'e']
+    assert vs.ntotal == 5 and vs.num_deleted == 2  # below the ratio, still tombstones
+
+    # the delete record is replayed from the delta log
+    reopened = VectorStore(dim=2, persist_path=str(tmp_path), tombstone_ratio=0.5)
+    assert reopened.num_deleted == 2 and reopened.search([0.0, 0.0], top_k=1)[0][0] == 'b'
+
+    reopened.delete({'document_id': 1, 'chunk_index': None})  # None values are ignored
+    reopened._compactor.join()
+    assert reopened.ntotal == 0 and reopened.num_deleted == 0
+    reopened.add([[9.0, 9.0]], [{'document_id': 2}], ['f'])
+    again = VectorStore(dim=2, persist_path=str(tmp_path))
+    assert again.ids == ['f'] and again.search([0.0, 0.0], top_k=2)[0][0] == 'f'
+
+
+def test_vectorstore_quantized_index_reranks_exact(tmp_path):
+    import os
+    import faiss
+    import numpy as np
+    from modules.vectorstore import VectorStore
+    rng = np.random.default_rng(0)
+    vecs = rng.random((2000, 16), dtype="float32")
+    vs = VectorStore(dim=16, persist_path=str(tmp_path), promote_at=1000, quantization="pq", rerank=8)
+    vs.add(vecs, [{'i': i} for i in range(2000)], [str(i) for i in range(2000)])
+    vs._compactor.join()
+
+    reopened = VectorStore(dim=16, persist_path=str(tmp_path), quantization="pq", rerank=8)
+    assert type(reopened.index).__name__ == "IndexPQ"
+    assert os.path.exists(os.path.join(str(tmp_path), f"ckpt-{reopened._gen:06d}", "vectors.npy"))
+    assert isinstance(reopened._raw, np.memmap)
+    _, truth = faiss.knn(vecs[:50], vecs, 10)
+
+    def recall():
+        found = reopened.search_batch(vecs[:50], top_k=10)
+        return np.mean([len({int(r[0]) for r in rows} & set(t)) / 10 for rows, t in zip(found, truth)]), found
+
+    reranked, found = recall()
+    reopened.rerank = 0
+    assert reranked > 0.9 and reranked > recall()[0] + 0.2
+    assert all(rows[0][0] == str(i) and rows[0][1] == 0.0 for i, rows in enumerate(found))
+
+
+def test_vectorstore_purge_streams_quantized_base(tmp_path, monkeypatch):
+    import numpy as np
+    from modules import vectorstore
+    from modules.vectorstore import VectorStore
+    monkeypatch.setattr(vectorstore, "_BLOCK", 128)
+    rng = np.random.default_rng(1)
+    vecs = rng.random((1000, 8), dtype="float32")
+    vs = VectorStore(dim=8, persist_path=str(tmp_path), promote_at=500, quantization="sq8", tombstone_ratio=0.4)
+    vs.add(vecs, [{'document_id': i % 2} for i in range(1000)], [str(i) for i in range(1000)])
+    vs._compactor.join()
+    vs.add(vecs[:10], [{'document_id': 1}] * 10, [f"t{i}" for i in range(10)])
+
+    vs.delete({'document_id': 0})
+    vs._compactor.join()
+    assert vs.num_deleted == 0 and vs.ntotal == 510 and len(vs._raw) == vs.index.ntotal
+    assert np.array_equal(np.asarray(vs._raw[:500]), vecs[1::2])  # exact copies of the kept rows, in order
+    reopened = VectorStore(dim=8, persist_path=str(tmp_path), quantization="sq8")
+    assert [r[0] for r in reopened.search(vecs[3], top_k=1)] == ['3']
+    assert reopened.vectors({'document_id': 0})[0].shape == (0, 8)
+
+
+def test_quantization_report_rows():
+    import numpy as np
+    from modules.quantization_report import report
+    vecs = np.random.default_rng(0).random((1200, 16), dtype="float32")
+    rows = report(vecs, num_queries=50, k=5, options=[("flat", "none"), ("flat", "sq8")])
+    assert [r["quantization"] for r in rows] == ["none", "sq8"]
+    assert rows[0]["recall@5"] == 1.0 and rows[1]["recall@5_reranked"] >= rows[1]["recall@5"]
+    assert rows[1]["bytes_per_vector"] < rows[0]["bytes_per_vector"] / 3